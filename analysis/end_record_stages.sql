@@ -0,0 +1,8 @@
+-- Adds the stage timestamp columns to an existing end_record table (see infrastructure/kubernetes/analysis/init.sql).
+ALTER TABLE public.end_record
+    ADD COLUMN IF NOT EXISTS kafka_timestamp bigint,
+    ADD COLUMN IF NOT EXISTS dequeue_time    bigint,
+    ADD COLUMN IF NOT EXISTS feature_time    bigint,
+    ADD COLUMN IF NOT EXISTS prediction_time bigint,
+    ADD COLUMN IF NOT EXISTS batch_size      integer,
+    ADD COLUMN IF NOT EXISTS worker_id       integer;
@@ -1,6 +1,11 @@
 SELECT sr.connection_id conn_id,
        er.inference_time-sr.timestamp e2e_latency_ms, sr.response_time-sr.timestamp producer_latency_ms, er.inference_time-er.timestamp consumer_latency_ms,
        sr.timestamp producer_record_start, sr.response_time producer_record_end,
-       er.timestamp consumer_record_start, er.inference_time consumer_record_end
+       er.timestamp consumer_record_start, er.inference_time consumer_record_end,
+       -- consumer stages, null unless the consumer runs with END_RECORD_STAGE_TIMES=true
+       er.timestamp-er.kafka_timestamp kafka_latency_ms, er.dequeue_time-er.timestamp queue_latency_ms,
+       er.feature_time-er.dequeue_time feature_latency_ms, er.prediction_time-er.feature_time inference_latency_ms,
+       er.inference_time-er.prediction_time log_latency_ms,
+       er.batch_size, er.worker_id
 FROM start_record sr INNER JOIN end_record er on sr.connection_id = er.connection_id
 ORDER BY e2e_latency_ms DESC;
\ No newline at end of file
@@ -0,0 +1,41 @@
+-- Breakdown of the e2e latency into stages, with percentiles (PostgreSQL).
+-- Only the records written with END_RECORD_STAGE_TIMES=true are included.
+--   producer:  request sent -> response received by the simulator
+--   kafka:     Kafka record timestamp -> polled by the consumer
+--   queue:     polled -> taken by the pipeline decode stage or a worker (0 in the single-process modes)
+--   feature:   taken -> window updated and features extracted (includes the deserialization of the pipeline and workers)
+--   inference: features extracted -> predict call done (includes waiting for the micro-batch)
+--   log:       predict call done -> EndRecord row queued
+WITH latency AS (
+    SELECT er.inference_time-sr.timestamp e2e,
+           sr.response_time-sr.timestamp producer,
+           er.timestamp-er.kafka_timestamp kafka,
+           er.dequeue_time-er.timestamp queue,
+           er.feature_time-er.dequeue_time feature,
+           er.prediction_time-er.feature_time inference,
+           er.inference_time-er.prediction_time log
+    FROM start_record sr INNER JOIN end_record er on sr.connection_id = er.connection_id
+    WHERE er.kafka_timestamp IS NOT NULL
+)
+SELECT stage, count(*) records,
+       round(avg(latency_ms), 1) mean_ms,
+       percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms) p50_ms,
+       percentile_cont(0.9) WITHIN GROUP (ORDER BY latency_ms) p90_ms,
+       percentile_cont(0.99) WITHIN GROUP (ORDER BY latency_ms) p99_ms,
+       percentile_cont(0.999) WITHIN GROUP (ORDER BY latency_ms) p999_ms,
+       max(latency_ms) max_ms
+FROM latency CROSS JOIN LATERAL (VALUES
+    (1, 'e2e', e2e), (2, 'producer', producer), (3, 'kafka', kafka), (4, 'queue', queue),
+    (5, 'feature', feature), (6, 'inference', inference), (7, 'log', log)
+) AS stages(ord, stage, latency_ms)
+GROUP BY ord, stage
+ORDER BY ord;
+
+-- Consumer latency by micro-batch size and worker.
+SELECT er.batch_size, er.worker_id, count(*) records,
+       percentile_cont(0.5) WITHIN GROUP (ORDER BY er.inference_time-er.timestamp) consumer_p50_ms,
+       percentile_cont(0.99) WITHIN GROUP (ORDER BY er.inference_time-er.timestamp) consumer_p99_ms
+FROM end_record er
+WHERE er.kafka_timestamp IS NOT NULL
+GROUP BY er.batch_size, er.worker_id
+ORDER BY er.batch_size, er.worker_id;
@@ -0,0 +1,6 @@
+"""
+This module measures the hot paths of the consumer in isolation, and compares them with a stored baseline.
+
+- cases.py: the benchmarked functions (window, validation, cache and deserializer) over sampling rates, window sizes and users.
+- suite.py: runs the cases, writes the results as JSON and fails on the cases slower than the baseline.
+"""
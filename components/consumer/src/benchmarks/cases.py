@@ -0,0 +1,119 @@
+"""
+Microbenchmark cases of the consumer hot paths, each run in isolation against fixed synthetic payloads (seeded).
+
+A case is (name, call, reset): call is the timed function, and reset (untimed, may be None) restores its input
+after each call, e.g. drops the samples appended by extend_data, so every call does the same work.
+Names hold the parameters of the case, e.g. "extend_data[hz=700,window=2]", and key the results of a run.
+"""
+import itertools
+from typing import Callable, Iterator, Optional, Sequence, Tuple
+
+from aws_schema_registry import KafkaDeserializer as _KafkaDeserializer
+
+from cache.benchmark import synthetic_segment
+from cache.table import Cache
+from serde.benchmark import SCHEMA_PATH, LocalSchemaRegistry, synthetic_message
+from serde.decoder import FastAvroDeserializer
+from window import benchmark as validation_benchmark
+from window.ring_buffer import MODALITIES, SensorWindow
+
+Case = Tuple[str, Callable[[], object], Optional[Callable[[], None]]]
+
+
+def full_window(hz: int, window_size: int, seed: int = 0) -> SensorWindow:
+    """Returns a window holding window_size seconds of samples, ready for a feature extraction."""
+    window = SensorWindow(window_size)
+    for second in range(window_size):
+        window.extend(synthetic_segment(seed + second, hz))
+    return window
+
+
+def window_cases(consumer, hz: int, window_size: int) -> Iterator[Case]:
+    """
+    extend_data, remove_overlap, is_valid_length and feature_extract_sensor on a full window.
+    feature_extract_sensor reads WINDOW_SIZE from the configuration, set here since the cases run as they are yielded.
+    """
+    consumer.InferenceConfigurations.window_size = window_size
+    suffix = f"[hz={hz},window={window_size}]"
+    segment = synthetic_segment(window_size, hz)
+
+    window = full_window(hz, window_size)
+    def drop_segment():
+        for col in MODALITIES:
+            window[col].advance(hz)
+    yield f"extend_data{suffix}", lambda: consumer.extend_data(window, segment), drop_segment
+
+    # remove_overlap drops OVERLAP_SIZE seconds, put back one segment at a time
+    overlapping = full_window(hz, window_size)
+    overlapping.extend(segment)
+    def put_back():
+        for _ in range(consumer.InferenceConfigurations.overlap_size):
+            overlapping.extend(segment)
+    yield f"remove_overlap{suffix}", lambda: consumer.remove_overlap(overlapping), put_back
+
+    ready = full_window(hz, window_size)
+    yield f"is_valid_length{suffix}", lambda: consumer.is_valid_length(ready, window_size), None
+    yield f"feature_extract_sensor{suffix}", lambda: consumer.feature_extract_sensor("user", 0, ready), None
+
+
+def validation_cases(consumer, hz: int) -> Iterator[Case]:
+    """sanity_check_no_missing on segments decoded as lists (aws_schema_registry) and integer arrays (FastAvroDeserializer)."""
+    for form in ("list", "int"):
+        record = validation_benchmark.synthetic_segment(hz, form)
+        yield f"sanity_check_no_missing[hz={hz},form={form}]", lambda record=record: consumer.sanity_check_no_missing(record), None
+
+
+def cache_cases(hz: int, users: int, hot_capacity: int) -> Iterator[Case]:
+    """
+    Cache.get and Cache.set of the windows of the users, in turn.
+    With hot_capacity=0, every access goes through the store (chunked window format).
+    """
+    suffix = f"[users={users},hot={hot_capacity}]"
+    cache = Cache("memory://", hot_capacity=hot_capacity, flush_interval_ms=0)
+    windows = {f"user{user}": full_window(hz, 1, seed=user) for user in range(users)}
+    for key, window in windows.items():
+        cache.set(key, window)
+
+    keys = itertools.cycle(windows)
+    yield f"Cache.get{suffix}", lambda: cache.get(next(keys)), None
+
+    # each set stores one new segment of the next user, as the consumer does
+    segment = synthetic_segment(users, hz)
+    pending = []
+    def next_window():
+        key = next(keys)
+        window = windows[key]
+        window.extend(segment)
+        for col in MODALITIES:
+            window[col].advance(hz)
+        pending.append((key, window))
+    def set_window():
+        cache.set(*pending.pop())
+    next_window()
+    yield f"Cache.set{suffix}", set_window, next_window
+
+
+def deserializer_cases(hz: int) -> Iterator[Case]:
+    """KafkaDeserializer (aws_schema_registry) and FastAvroDeserializer on an encoded message, with the local schema."""
+    message = synthetic_message(hz, compression=False)
+    registry = LocalSchemaRegistry(SCHEMA_PATH)
+    adapter = _KafkaDeserializer(client=registry)
+    fast = FastAvroDeserializer("chest", client=registry)
+    yield f"KafkaDeserializer.deserialize[hz={hz}]", lambda: adapter.deserialize("chest", message).data, None
+    yield f"FastAvroDeserializer.deserialize[hz={hz}]", lambda: fast.deserialize(message), None
+
+
+def all_cases(consumer, hz_values: Sequence[int], window_sizes: Sequence[int],
+              user_counts: Sequence[int]) -> Iterator[Case]:
+    """
+    Yields every case over the grid of parameters.
+    :param consumer: the main module.
+    """
+    for hz in hz_values:
+        for window_size in window_sizes:
+            yield from window_cases(consumer, hz, window_size)
+        yield from validation_cases(consumer, hz)
+        yield from deserializer_cases(hz)
+    for users in user_counts:
+        for hot_capacity in (consumer.InferenceConfigurations.cache_hot_capacity, 0):
+            yield from cache_cases(hz_values[0], users, hot_capacity)
@@ -0,0 +1,114 @@
+"""
+Microbenchmark suite of the consumer hot paths, with a stored baseline (see cases.py for the cases).
+
+Each case is timed call by call with perf_counter_ns, excluding its untimed reset, over --repeat rounds
+of --number calls, and reports the best round (us per call), as timeit does.
+Results are written as JSON (--output). Given a baseline written by a previous run (--baseline),
+every case present in both is compared: a case is a regression if it is slower than its baseline by more than
+--tolerance (0.2: 20%), and the suite then exits with status 1.
+Baselines are only comparable on the same machine and settings (e.g. FEATURE_MODE does not matter here,
+but OVERLAP_SIZE and CACHE_HOT_CAPACITY do).
+
+Usage (from the src/ directory):
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --baseline baseline.json --tolerance 0.2 --filter Cache
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+
+def measure(call: Callable[[], object], reset: Optional[Callable[[], None]], number: int, repeat: int) -> float:
+    """
+    :return: the best mean duration of a call over the rounds, in us.
+    """
+    clock = time.perf_counter_ns
+    best = None
+    for _ in range(repeat):
+        total = 0
+        for _ in range(number):
+            start = clock()
+            call()
+            total += clock() - start
+            if reset is not None:
+                reset()
+        best = total if best is None else min(best, total)
+    return best / number / 1e3
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> Dict[str, float]:
+    """
+    Prints the ratio of each result to its baseline.
+    :return: the ratio of the regressions, per case.
+    """
+    regressions = {}
+    print(f"{'case':<56} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for name, value in results.items():
+        if name not in baseline:
+            print(f"{name:<56} {'-':>12} {value:9.2f} us {'new':>7}")
+            continue
+        ratio = value / baseline[name]
+        regression = ratio > 1 + tolerance
+        if regression:
+            regressions[name] = ratio
+        print(f"{name:<56} {baseline[name]:9.2f} us {value:9.2f} us {ratio:6.2f}x" + (" REGRESSION" if regression else ""))
+    missing = len(baseline.keys() - results.keys())
+    if missing:
+        print(f"{missing} case(s) of the baseline not run")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hz", type=int, nargs="+", default=[700, 256], help="sampling rates of the payloads")
+    parser.add_argument("--window-sizes", type=int, nargs="+", default=[2, 4], help="window sizes in seconds")
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 1000], help="users in the cache")
+    parser.add_argument("--number", type=int, default=100, help="calls per round")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per case, the best is kept")
+    parser.add_argument("--filter", help="runs only the cases whose name contains this string")
+    parser.add_argument("--output", help="writes the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown beyond which a case is a regression")
+    args = parser.parse_args()
+
+    # imported here, since main.py connects its dependencies at import time.
+    import main as consumer
+    from benchmarks.cases import all_cases
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    for name, call, reset in all_cases(consumer, args.hz, args.window_sizes, args.users):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(call, reset, args.number, args.repeat)
+        if not args.baseline:
+            print(f"{name:<56} {results[name]:10.2f} us/call")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "number": args.number,
+                "repeat": args.repeat,
+                "results": results,
+            }, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"FAILED: {len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""
+This module stands in for the Kafka broker when none is available (local profile, KAFKA_HOST=memory://).
+
+- local.py: in-memory partitions consumed like an AIOKafkaConsumer, fed over HTTP by the simulator.
+"""
@@ -0,0 +1,297 @@
+"""
+In-process stand-in of the Kafka broker (KAFKA_HOST=memory://), for the local profile.
+
+LocalBroker implements the part of AIOKafkaConsumer the consumer uses (subscribe with a rebalance listener, getmany,
+async iteration, pause/resume, assignment, highwater/position) over in-memory partitions, so every processing mode runs unchanged.
+Messages are published by IngestServer, which accepts the JSON sensor records the simulator POSTs to the producer
+("/", see WatchSensorDataPublishController), encodes them with the local schema as the producer does,
+and appends them to the partition of their user. The simulator is pointed at it instead of the producer:
+    locust -f locustfile.py -H http://localhost:LOCAL_BROKER_PORT
+A rebalance moving the assignment to some partitions is simulated by POSTing them to "/rebalance", e.g.
+    curl -d '[0, 1]' http://localhost:LOCAL_BROKER_PORT/rebalance
+Unlike Kafka, messages are kept in memory until they are consumed, and are lost when the consumer stops.
+"""
+import asyncio
+import dataclasses
+import json
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, List, Optional, Set
+
+from aiokafka.structs import ConsumerRecord, TopicPartition
+
+from logger.ConsumerLogger import ConsumerLogger
+from serde.encoder import AvroEncoder
+
+logger = ConsumerLogger()
+
+CREATE_TIME = 0 # timestamp_type of the records: set by the producer
+
+
+class LocalBroker:
+    """
+    One topic of in-memory partitions, consumed by a single consumer owning every partition (unless reassigned).
+    Messages are appended from the event loop thread (publish), or from any thread (publish_threadsafe).
+    """
+    def __init__(self, topic: str, partitions: int, value_deserializer: Optional[Callable] = None,
+                 max_poll_records: int = 100, port: int = 0, schema_path: Optional[str] = None):
+        """
+        :param topic: topic name.
+        :param partitions: number of partitions, messages are partitioned by key.
+        :param value_deserializer: applied to each value when it is polled, as by AIOKafkaConsumer.
+        :param max_poll_records: max number of messages returned by a getmany call.
+        :param port: port of the IngestServer started with the broker, 0 starts none.
+        :param schema_path: local .avsc file encoding the ingested messages (required with a port).
+        """
+        if port and not schema_path:
+            raise ValueError("The local broker encodes the ingested records with a local schema: set SCHEMA_PATH")
+        self.topic = topic
+        self.value_deserializer = value_deserializer
+        self.max_poll_records = max_poll_records
+        self.port = port
+        self.schema_path = schema_path
+        self._partitions = [TopicPartition(topic, partition) for partition in range(partitions)]
+        self._logs: Dict[TopicPartition, Deque[ConsumerRecord]] = {tp: deque() for tp in self._partitions}
+        self._highwater = dict.fromkeys(self._partitions, 0)
+        self._positions = dict.fromkeys(self._partitions, 0)
+        self._committed: Dict[TopicPartition, int] = {}
+        self._paused: Set[TopicPartition] = set()
+        self._assignment: Set[TopicPartition] = set(self._partitions)
+        self._listener = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._arrived: Optional[asyncio.Event] = None
+        self._server: Optional[IngestServer] = None
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._arrived = asyncio.Event()
+        if self.port:
+            self._server = IngestServer(self, self.port, AvroEncoder(self.schema_path))
+            self._server.start()
+        if self._listener is not None:
+            await self._listener.on_partitions_assigned(self.assignment())
+
+    def subscribe(self, topics: List[str], listener=None) -> None:
+        """Sets the rebalance listener, notified of the assignment of every partition when the broker starts."""
+        self._listener = listener
+
+    async def reassign(self, partitions: Set[TopicPartition]) -> None:
+        """
+        Moves the assignment to the partitions, as a rebalance of the group would (every partition is revoked first).
+        The messages of the unassigned partitions wait in their partition.
+        """
+        if self._listener is not None:
+            await self._listener.on_partitions_revoked(self.assignment())
+        self._assignment = set(partitions)
+        self._paused &= self._assignment
+        if self._listener is not None:
+            await self._listener.on_partitions_assigned(self.assignment())
+        self._arrived.set()
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.stop()
+            self._server = None
+
+    def publish(self, key: bytes, value: bytes, timestamp: Optional[int] = None) -> None:
+        """Appends a message to the partition of its key."""
+        tp = self._partitions[zlib.crc32(key) % len(self._partitions)]
+        offset = self._highwater[tp]
+        self._highwater[tp] = offset + 1
+        timestamp = int(time.time() * 1000) if timestamp is None else timestamp
+        self._logs[tp].append(ConsumerRecord(self.topic, tp.partition, offset, timestamp, CREATE_TIME, key, value,
+                                             None, len(key), len(value), []))
+        self._arrived.set()
+
+    def publish_threadsafe(self, key: bytes, value: bytes, timestamp: Optional[int] = None) -> None:
+        """Appends a message from another thread, e.g. the HTTP threads of the IngestServer."""
+        self._loop.call_soon_threadsafe(self.publish, key, value, timestamp)
+
+    def assignment(self) -> Set[TopicPartition]:
+        return set(self._assignment)
+
+    def paused(self) -> Set[TopicPartition]:
+        return set(self._paused)
+
+    def pause(self, *partitions: TopicPartition) -> None:
+        self._paused.update(partitions)
+
+    def resume(self, *partitions: TopicPartition) -> None:
+        self._paused.difference_update(partitions)
+        if any(self._logs[tp] for tp in partitions if tp in self._assignment):
+            self._arrived.set()
+
+    def highwater(self, tp: TopicPartition) -> Optional[int]:
+        return self._highwater.get(tp)
+
+    async def commit(self, offsets: Optional[Dict[TopicPartition, int]] = None) -> None:
+        """Records the committed offsets. Polled messages are not redelivered: they are dropped from the partition."""
+        self._committed.update(offsets or {})
+
+    async def committed(self, tp: TopicPartition) -> Optional[int]:
+        return self._committed.get(tp)
+
+    async def position(self, tp: TopicPartition) -> int:
+        return self._positions[tp]
+
+    def _poll(self, max_records: int) -> Dict[TopicPartition, List[ConsumerRecord]]:
+        """Takes up to max_records messages, from the unpaused partitions in turn."""
+        records: Dict[TopicPartition, List[ConsumerRecord]] = {}
+        for tp in self._partitions:
+            log = self._logs[tp]
+            if tp in self._paused or tp not in self._assignment or not log:
+                continue
+            taken = [log.popleft() for _ in range(min(max_records, len(log)))]
+            if self.value_deserializer is not None:
+                taken = [dataclasses.replace(record, value=self.value_deserializer(record.value)) for record in taken]
+            self._positions[tp] += len(taken)
+            records[tp] = taken
+            max_records -= len(taken)
+            if not max_records:
+                break
+        return records
+
+    async def getmany(self, *partitions: TopicPartition, timeout_ms: int = 0,
+                      max_records: Optional[int] = None) -> Dict[TopicPartition, List[ConsumerRecord]]:
+        """Returns the available messages, waiting up to timeout_ms for the first ones."""
+        max_records = max_records or self.max_poll_records
+        records = self._poll(max_records)
+        if not records and timeout_ms > 0:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                return {}
+            records = self._poll(max_records)
+        return records
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ConsumerRecord:
+        while True:
+            records = await self.getmany(timeout_ms=1000, max_records=1)
+            for messages in records.values():
+                return messages[0]
+
+
+class IngestServer:
+    """
+    HTTP server publishing the sensor records POSTed as JSON to "/", from a pool of threads.
+    """
+    def __init__(self, broker: LocalBroker, port: int, encoder: AvroEncoder):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keeps the connections of the simulator alive
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path == "/rebalance":
+                    self._rebalance(body)
+                    return
+                try:
+                    record = json.loads(body)
+                    value = encoder.encode(record)
+                except (ValueError, KeyError, TypeError) as e:
+                    server.rejected += 1
+                    self._reply(400, f"invalid sensor record: {e}".encode())
+                    return
+                broker.publish_threadsafe(str(record["user_id"]).encode(), value)
+                server.published += 1
+                self._reply(200, b"ok")
+
+            def _rebalance(self, body: bytes):
+                try:
+                    partitions = {broker._partitions[partition] for partition in json.loads(body)}
+                except (ValueError, IndexError, TypeError) as e:
+                    self._reply(400, f"invalid partitions: {e}".encode())
+                    return
+                asyncio.run_coroutine_threadsafe(broker.reassign(partitions), broker._loop).result()
+                self._reply(200, b"ok")
+
+            def _reply(self, status: int, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # one line per request, as the producer does not log either
+
+        self.published = 0
+        self.rejected = 0
+        self._httpd = ThreadingHTTPServer(("", port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="ingest-server", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        logger.info("Local broker: accepting sensor records on :%d/", self._httpd.server_address[1])
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        logger.info("Local broker: %d records published, %d rejected", self.published, self.rejected)
+
+
+if __name__ == "__main__":
+    # executes test codes.
+    import urllib.request
+
+    from replay.source import SCHEMA_PATH, encode, load_recording, synthetic_messages
+    from serde.decoder import FastAvroDeserializer
+
+    async def test():
+        decoder = FastAvroDeserializer("chest", schema_path=SCHEMA_PATH)
+        broker = LocalBroker("chest", partitions=3, value_deserializer=decoder.deserialize, max_poll_records=4,
+                             port=18123, schema_path=SCHEMA_PATH)
+        await broker.start()
+        assert await broker.getmany(timeout_ms=10) == {}
+
+        messages = list(synthetic_messages(users=3, messages=6, hz=10, recording=load_recording(path=None, hz=10)))
+        def post_all():
+            for message in messages:
+                request = urllib.request.Request("http://localhost:18123/", data=json.dumps(message).encode(),
+                                                 headers={"Content-Type": "application/json"})
+                assert urllib.request.urlopen(request).read() == b"ok"
+        await asyncio.get_running_loop().run_in_executor(None, post_all)
+        await asyncio.sleep(0.1)
+
+        # messages of a user stay in order, in the partition of the user
+        tp = broker._partitions[zlib.crc32(b"user-0") % 3]
+        broker.pause(*broker.assignment() - {tp})
+        records = await broker.getmany(timeout_ms=100)
+        assert list(records) == [tp] and records[tp][0].offset == 0
+        user_records = [r for r in records[tp] if r.key == b"user-0"]
+        assert [r.value["timestamp"] for r in user_records] == [0, 1000]
+        assert user_records[0].value["value"]["chest_ecg"]["value"].tolist() == messages[0]["value"]["chest_ecg"]["value"]
+        assert await broker.position(tp) == broker.highwater(tp)
+        await broker.commit({tp: records[tp][-1].offset + 1})
+        assert await broker.committed(tp) == await broker.position(tp)
+
+        broker.resume(*broker.paused())
+        remaining = sum(len(r) for r in (await broker.getmany(timeout_ms=100)).values())
+        assert remaining == 6 - len(records[tp]) and broker._server.published == 6
+
+        # a rebalance revokes every partition, then assigns the new ones to the listener
+        events = []
+        class Listener:
+            async def on_partitions_revoked(self, revoked):
+                events.append(("revoked", sorted(p.partition for p in revoked)))
+            async def on_partitions_assigned(self, assigned):
+                events.append(("assigned", sorted(p.partition for p in assigned)))
+        broker.subscribe(["chest"], listener=Listener())
+        request = urllib.request.Request("http://localhost:18123/rebalance", data=b"[1]")
+        assert await asyncio.get_running_loop().run_in_executor(None, lambda: urllib.request.urlopen(request).read()) == b"ok"
+        assert events == [("revoked", [0, 1, 2]), ("assigned", [1])] and broker.assignment() == {broker._partitions[1]}
+        broker.publish(b"user-0", next(encode([messages[0]])))
+        assert await broker.getmany(timeout_ms=10) == {} # user-0 is not on partition 1
+        await broker.stop()
+
+    asyncio.run(test())
+    print("ok")
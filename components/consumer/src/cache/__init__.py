@@ -1,5 +1,11 @@
 """
 Cache implementation replacing Faust's RocksDB table().
-Uses dbm(https://docs.python.org/3/library/dbm.html).
+Uses the key-value store selected by STORE_HOST, e.g. dbm(https://docs.python.org/3/library/dbm.html).
+
+- table.py: Cache, with an in-memory hot tier in front of the store.
+- backends.py: stores selected by STORE_HOST (memory://, dbm://, sqlite://).
+- chunked.py: append-only storage format of the user windows.
+- expiry.py: expiry of idle users, by the timestamp of their last message.
+- benchmark.py: conformance checks and throughput benchmark of the backends.
 """
 
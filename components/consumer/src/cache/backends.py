@@ -0,0 +1,164 @@
+"""
+Key-value stores behind Cache, selected by the scheme of STORE_HOST.
+
+- memory://            : in-process dictionary, not persisted.
+- dbm://[filename]     : dbm.gnu file (default: cache.dbm).
+- sqlite://[filename]  : SQLite database in WAL mode, with memory-mapped reads (default: cache.sqlite).
+
+Relative filenames are resolved next to this module, absolute ones are used as is (e.g. "sqlite:///data/cache.sqlite").
+"""
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+from typing import Dict, Iterable, Optional, Tuple
+
+# A write (value is bytes) or a delete (value is None) of a key
+Operation = Tuple[str, Optional[bytes]]
+
+
+class StoreBackend(ABC):
+    """
+    Interface of the byte stores used by Cache.
+    Backends are not thread-safe: Cache serializes the accesses.
+    """
+    @abstractmethod
+    def get(self, key: str, default=None) -> Optional[bytes]:
+        """Returns the value of the key, or default if the key does not exist."""
+
+    def __getitem__(self, key: str) -> bytes:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    @abstractmethod
+    def __setitem__(self, key: str, value: bytes) -> None:
+        """Writes the value of the key."""
+
+    @abstractmethod
+    def __delitem__(self, key: str) -> None:
+        """Deletes the key, raises KeyError if it does not exist."""
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def write_batch(self, operations: Iterable[Operation]) -> None:
+        """
+        Applies writes and deletes, in order. Deleting a missing key is not an error.
+        Backends may apply the batch atomically.
+        """
+        for key, value in operations:
+            if value is not None:
+                self[key] = value
+            elif key in self:
+                del self[key]
+
+    def close(self) -> None:
+        """Releases the store."""
+
+
+class MemoryBackend(StoreBackend):
+    """
+    In-process store, lost when the process exits.
+    """
+    def __init__(self):
+        self._data: Dict[str, bytes] = {}
+
+    def get(self, key: str, default=None) -> Optional[bytes]:
+        return self._data.get(key, default)
+
+    def __setitem__(self, key: str, value: bytes) -> None:
+        self._data[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._data[key]
+
+    def close(self) -> None:
+        self._data = {}
+
+
+class DbmBackend(StoreBackend):
+    """
+    dbm.gnu file, as used by the original Cache.
+    """
+    def __init__(self, path: str):
+        # imported here, since some Python builds do not ship the gdbm module.
+        import dbm.gnu
+        self.db = dbm.gnu.open(path, "c")
+
+    def get(self, key: str, default=None) -> Optional[bytes]:
+        return self.db.get(key, default)
+
+    def __setitem__(self, key: str, value: bytes) -> None:
+        self.db[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.db[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.db
+
+    def close(self) -> None:
+        self.db.close()
+
+
+class SqliteBackend(StoreBackend):
+    """
+    SQLite table in WAL mode. Reads go through a memory-mapped view of the database file,
+    and each write_batch() is one transaction.
+    """
+    def __init__(self, path: str, mmap_size: int = 1 << 30):
+        """
+        :param path: path of the database file. created if not exists.
+        :param mmap_size: max number of bytes of the file that are memory-mapped.
+        """
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID")
+
+    def get(self, key: str, default=None) -> Optional[bytes]:
+        row = self.connection.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def __setitem__(self, key: str, value: bytes) -> None:
+        self.connection.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (key, value))
+
+    def __delitem__(self, key: str) -> None:
+        if self.connection.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount == 0:
+            raise KeyError(key)
+
+    def write_batch(self, operations: Iterable[Operation]) -> None:
+        with self.connection:
+            self.connection.execute("BEGIN")
+            for key, value in operations:
+                if value is not None:
+                    self.connection.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (key, value))
+                else:
+                    self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+BACKENDS = {
+    "memory": (MemoryBackend, None),
+    "dbm": (DbmBackend, "cache.dbm"),
+    "sqlite": (SqliteBackend, "cache.sqlite"),
+}
+
+
+def open_backend(url: str) -> StoreBackend:
+    """
+    Opens the store described by a STORE_HOST url.
+    :param url: "<scheme>://[filename]", see the module docstring for the supported schemes.
+    """
+    scheme, separator, filename = url.partition("://")
+    if not separator or scheme not in BACKENDS:
+        raise ValueError(f"Unsupported STORE_HOST: {url}, expected one of {', '.join(f'{s}://' for s in BACKENDS)}")
+    backend, default_filename = BACKENDS[scheme]
+    if default_filename is None:
+        return backend()
+    path = os.path.abspath(os.path.join(__file__, "..", filename or default_filename))
+    return backend(path)
@@ -0,0 +1,156 @@
+"""
+Conformance checks and shared throughput benchmark of the Cache backends.
+Every backend is checked against the same behaviour before it is measured.
+
+Usage (from the src/ directory):
+    python -m cache.benchmark                       # all backends, in a temporary directory
+    python -m cache.benchmark sqlite:///data/bench.sqlite --users 200
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from cache.backends import StoreBackend, open_backend
+from cache.table import Cache
+from window.ring_buffer import ACC_MODALITIES, MODALITIES, SensorWindow
+
+
+def check_conformance(url: str) -> None:
+    """
+    Checks the StoreBackend contract (and persistence for the durable stores) of the backend at url.
+    """
+    store: StoreBackend = open_backend(url)
+    try:
+        assert store.get("missing") is None
+        assert store.get("missing", b"default") == b"default"
+        assert "missing" not in store
+        try:
+            store["missing"]
+            raise AssertionError("__getitem__ of a missing key must raise KeyError")
+        except KeyError:
+            pass
+        try:
+            del store["missing"]
+            raise AssertionError("__delitem__ of a missing key must raise KeyError")
+        except KeyError:
+            pass
+
+        store["key"] = b"value"
+        store["key\0" + "1"] = b"\x00\x01" * 1000 # chunk keys contain NUL characters
+        assert store["key"] == b"value" and "key" in store
+        assert store.get("key\0" + "1") == b"\x00\x01" * 1000
+        store["key"] = b"overwritten"
+        assert store["key"] == b"overwritten"
+        del store["key"]
+        assert store.get("key") is None
+
+        store.write_batch([("a", b"1"), ("b", b"2"), ("a", None), ("missing", None), ("c", b"3"), ("c", b"4")])
+        assert (store.get("a"), store.get("b"), store.get("c")) == (None, b"2", b"4")
+    finally:
+        store.close()
+
+    if not url.startswith("memory://"):
+        # the store persists when it is reopened.
+        store = open_backend(url)
+        try:
+            assert store.get("b") == b"2" and store.get("key\0" + "1") == b"\x00\x01" * 1000
+            store.write_batch([("b", None), ("c", None), ("key\0" + "1", None)])
+        finally:
+            store.close()
+
+    # windows go through the chunked format on every backend.
+    cache = Cache(url, hot_capacity=0, flush_interval_ms=0)
+    try:
+        window = synthetic_window(0, hz=8)
+        window.extend(synthetic_segment(1, hz=8))
+        cache["window"] = window
+        cache._windows.indexes.clear() # force reading the index back from the store
+        restored = cache["window"]
+        for col in MODALITIES:
+            assert restored[col].view().tolist() == window[col].view().tolist()
+        del cache["window"]
+        assert cache["window"] is None
+    finally:
+        cache.close()
+
+
+def synthetic_segment(seed: int, hz: int) -> dict:
+    """Returns one second of 16-bit ADC-like samples for every modality."""
+    rng = np.random.default_rng(seed)
+    return {
+        col: {"hz": hz, "value": rng.integers(0, 1 << 16, size=(hz, 3) if col in ACC_MODALITIES else hz)}
+        for col in MODALITIES
+    }
+
+
+def synthetic_window(seed: int, hz: int, window_size: int = 2) -> SensorWindow:
+    """Returns a window holding one second of samples."""
+    window = SensorWindow(window_size)
+    window.extend(synthetic_segment(seed, hz))
+    return window
+
+
+def measure_throughput(url: str, users: int, segments: int, hz: int) -> dict:
+    """
+    Replays the consumer access pattern without hot tier, so every access hits the store:
+    one window write per segment and user (append a segment, drop an overlap), then one cold read per user.
+    :return: writes/sec, reads/sec and MB/sec written.
+    """
+    cache = Cache(url, hot_capacity=0, flush_interval_ms=0)
+    segment = synthetic_segment(0, hz)
+    windows = [synthetic_window(user, hz) for user in range(users)]
+    try:
+        start = time.perf_counter()
+        for _ in range(segments):
+            for user, window in enumerate(windows):
+                window.extend(segment)
+                for col in MODALITIES:
+                    window[col].advance(hz)
+                cache[f"user{user}"] = window
+        write_time = time.perf_counter() - start
+
+        cache._windows.indexes.clear() # cold reads, without the indexes kept by the codec
+        start = time.perf_counter()
+        for user in range(users):
+            assert cache[f"user{user}"] is not None
+        read_time = time.perf_counter() - start
+    finally:
+        cache.close()
+
+    segment_bytes = sum(np.asarray(modality["value"]).size for modality in segment.values()) * 8
+    return {
+        "writes/s": users * segments / write_time,
+        "reads/s": users / read_time,
+        "MB/s written": users * segments * segment_bytes / write_time / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("urls", nargs="*", help="STORE_HOST urls to benchmark (default: every backend)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--segments", type=int, default=20, help="segments (seconds of data) written per user")
+    parser.add_argument("--hz", type=int, default=700)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        urls = args.urls or [
+            "memory://",
+            f"dbm://{os.path.join(directory, 'bench.dbm')}",
+            f"sqlite://{os.path.join(directory, 'bench.sqlite')}",
+        ]
+        for url in urls:
+            try:
+                check_conformance(url)
+            except ImportError as e:
+                print(f"{url:<40} skipped: {e}")
+                continue
+            result = measure_throughput(url, args.users, args.segments, args.hz)
+            print(f"{url:<40} " + ", ".join(f"{value:10.1f} {name}" for name, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
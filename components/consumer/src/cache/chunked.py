@@ -0,0 +1,172 @@
+"""
+Chunked, append-only storage format of SensorWindow values.
+
+Instead of pickling the whole window on every write, each write stores only the samples
+appended since the previous write, as an immutable chunk of raw little-endian arrays.
+Samples dropped by the overlap are released by deleting the chunks that became fully stale.
+
+Layout, for a window stored under "key":
+- key: index (WINDOW_MAGIC + JSON), with the head/tail of each modality and the list of live chunks.
+- key + "\\0" + seq: chunk "seq", the arrays of every modality concatenated in index order.
+"""
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from window.ring_buffer import RingBuffer, SensorWindow
+
+# Prefix of window indexes. Cannot collide with pickled values, which start with b"\x80".
+WINDOW_MAGIC = b"\x00SW1"
+
+# A write (value is bytes) or a delete (value is None) of a key
+Operation = Tuple[str, Optional[bytes]]
+
+
+def chunk_key(key: str, seq: int) -> str:
+    """Returns the key of a chunk of the window stored under "key"."""
+    return f"{key}\0{seq}"
+
+
+def is_window(value_serialized: bytes) -> bool:
+    """Returns True if the stored value is a window index."""
+    return value_serialized[:len(WINDOW_MAGIC)] == WINDOW_MAGIC
+
+
+class ChunkedWindowCodec:
+    """
+    Encodes windows as chunk writes/deletes and decodes them back.
+    Keeps the index of every window it has written or read, so encoding a write does not read the store.
+    """
+    def __init__(self):
+        self.indexes: Dict[str, dict] = {}
+
+    @staticmethod
+    def _parse(value_serialized: bytes) -> dict:
+        return json.loads(value_serialized[len(WINDOW_MAGIC):])
+
+    def _load_index(self, key: str, read: Callable[[str], Optional[bytes]]) -> Optional[dict]:
+        index = self.indexes.get(key)
+        if index is None:
+            value_serialized = read(key)
+            if value_serialized is not None and is_window(value_serialized):
+                index = self._parse(value_serialized)
+        return index
+
+    def encode(self, key: str, window: SensorWindow, read: Callable[[str], Optional[bytes]]) -> List[Operation]:
+        """
+        Returns the operations storing the window: one new chunk, the deletes of stale chunks and the new index.
+        :param key: key of the window.
+        :param window: window to store.
+        :param read: reads a key from the store, used only if the index of the window is not known yet.
+        """
+        operations: List[Operation] = []
+        previous = self._load_index(key, read)
+        columns = list(window.buffers)
+        modalities = {
+            col: {
+                "hz": window.hz[col],
+                "dtype": window[col].dtype.newbyteorder("<").str,
+                "width": window[col].width,
+                "capacity": window[col].capacity,
+                "head": window[col].head,
+                "tail": window[col].tail,
+            }
+            for col in columns
+        }
+
+        # The stored chunks can be extended only if they hold a prefix of this window.
+        extendable = previous is not None and previous["columns"] == columns and all(
+            previous["modalities"][col]["hz"] == modalities[col]["hz"]
+            and previous["modalities"][col]["head"] <= modalities[col]["head"]
+            and previous["modalities"][col]["tail"] <= modalities[col]["tail"]
+            for col in columns
+        )
+        chunks = previous["chunks"] if extendable else []
+        seq = previous["seq"] if previous is not None else 0
+        if previous is not None and not extendable:
+            operations.extend((chunk_key(key, chunk[0]), None) for chunk in previous["chunks"])
+
+        # New chunk: samples appended since the previous write (or the whole window).
+        starts, lengths, parts = [], [], []
+        for col in columns:
+            buffer = window[col]
+            start = previous["modalities"][col]["tail"] if extendable else buffer.head
+            start = max(start, buffer.head)
+            values = buffer.view()[start - buffer.head:]
+            starts.append(start)
+            lengths.append(len(values))
+            parts.append(np.ascontiguousarray(values, dtype=modalities[col]["dtype"]).tobytes())
+        if any(lengths):
+            operations.append((chunk_key(key, seq), b"".join(parts)))
+            chunks = chunks + [[seq, starts, lengths]]
+            seq += 1
+
+        # Drop the chunks whose samples are all before the head of every modality.
+        live = []
+        for chunk in chunks:
+            _, chunk_starts, chunk_lengths = chunk
+            if all(s + n <= modalities[col]["head"] for col, s, n in zip(columns, chunk_starts, chunk_lengths)):
+                operations.append((chunk_key(key, chunk[0]), None))
+            else:
+                live.append(chunk)
+
+        index = {
+            "window_size": window.window_size,
+            "seq": seq,
+            "columns": columns,
+            "modalities": modalities,
+            "chunks": live,
+        }
+        self.indexes[key] = index
+        operations.append((key, WINDOW_MAGIC + json.dumps(index, separators=(",", ":")).encode()))
+        return operations
+
+    def decode(self, key: str, value_serialized: bytes, read: Callable[[str], bytes]) -> SensorWindow:
+        """
+        Reassembles a window from its index and chunks.
+        Chunks are read as zero-copy arrays and copied once, into the ring buffers.
+        :param key: key of the window.
+        :param value_serialized: stored index of the window.
+        :param read: reads a key from the store.
+        """
+        index = self._parse(value_serialized)
+        self.indexes.setdefault(key, index)
+        window = SensorWindow(index["window_size"])
+        meta = [index["modalities"][col] for col in index["columns"]]
+        for col, modality in zip(index["columns"], meta):
+            buffer = RingBuffer(modality["capacity"], modality["width"], modality["dtype"])
+            buffer.head = buffer.tail = modality["head"]
+            window.buffers[col] = buffer
+            window.hz[col] = modality["hz"]
+
+        for seq, starts, lengths in index["chunks"]:
+            data = read(chunk_key(key, seq))
+            offset = 0
+            for (col, modality), start, length in zip(zip(index["columns"], meta), starts, lengths):
+                buffer = window.buffers[col]
+                width = modality["width"] or 1
+                values = np.frombuffer(data, dtype=modality["dtype"], count=length * width, offset=offset)
+                offset += values.nbytes
+                if modality["width"] is not None:
+                    values = values.reshape(-1, width)
+                # skip the samples before the head, and the ones already read from a previous chunk
+                skip = max(buffer.tail - start, 0)
+                buffer.append(values[skip:])
+        return window
+
+    def forget(self, key: str) -> None:
+        """
+        Drops the index of the window kept in memory, so the next write or read of the key reads the store again.
+        Used when another process may write the window next, e.g. the consumer taking over its user.
+        """
+        self.indexes.pop(key, None)
+
+    def delete(self, key: str, read: Callable[[str], Optional[bytes]]) -> List[Operation]:
+        """
+        Returns the operations deleting the chunks of the window stored under "key", if any.
+        Used when the key is deleted or replaced by a value that is not a window.
+        """
+        index = self._load_index(key, read)
+        self.indexes.pop(key, None)
+        return [] if index is None else [(chunk_key(key, chunk[0]), None) for chunk in index["chunks"]]
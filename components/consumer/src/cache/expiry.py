@@ -0,0 +1,135 @@
+"""
+Expiry of idle users.
+
+Each user is scheduled once in a min-heap, at the time it would expire (last seen + USER_TTL_MS).
+The clock is the latest message timestamp seen, so expiry follows the data, not the wall clock.
+A sweep only pops the users due: a user seen since it was scheduled is rescheduled at its new deadline,
+otherwise it expires, and the caller frees its state (window, model, store entries).
+The cost of a sweep depends on the number of due users (bounded by "sweep_limit"), not on the number of users.
+"""
+import heapq
+from typing import Dict, List, Optional, Set, Tuple
+
+from configurations import InferenceConfigurations
+
+
+class IdleExpiry:
+    """
+    Tracks the last message timestamp of each user and expires the users idle for more than "ttl_ms".
+    Not thread-safe: touch() and sweep() are called by the thread updating the windows.
+
+    - active_users: users seen within the TTL (or not swept yet).
+    - expired_users: users expired since the start.
+    """
+    def __init__(self, ttl_ms: int = InferenceConfigurations.user_ttl_ms,
+                 sweep_limit: int = InferenceConfigurations.user_expiry_sweep_limit):
+        """
+        :param ttl_ms: idle time after which a user expires. 0 disables the expiry.
+        :param sweep_limit: max number of scheduled users examined by one sweep.
+        """
+        self.ttl_ms = ttl_ms
+        self.sweep_limit = sweep_limit
+        self.clock = 0 # latest message timestamp seen
+        self.expired_users = 0
+        self._last_seen: Dict[str, int] = {}
+        self._schedule: List[Tuple[int, str]] = [] # (deadline, user_id), one entry per user
+        self._scheduled: Set[str] = set() # users with an entry in the schedule, forgotten ones included
+
+    @property
+    def active_users(self) -> int:
+        return len(self._last_seen)
+
+    def touch(self, user_id: str, timestamp: int) -> None:
+        """
+        Records a message of the user.
+        :param timestamp: timestamp of the message in ms.
+        """
+        if self.ttl_ms <= 0:
+            return
+        last_seen = self._last_seen.get(user_id)
+        if last_seen is None:
+            # a forgotten user seen again keeps its entry, rescheduled when popped
+            if user_id not in self._scheduled:
+                heapq.heappush(self._schedule, (timestamp + self.ttl_ms, user_id))
+                self._scheduled.add(user_id)
+            self._last_seen[user_id] = timestamp
+        elif timestamp > last_seen:
+            # rescheduled lazily, when its previous deadline is popped
+            self._last_seen[user_id] = timestamp
+        if timestamp > self.clock:
+            self.clock = timestamp
+
+    def sweep(self, now: Optional[int] = None) -> List[str]:
+        """
+        Expires the users idle since "now - ttl_ms".
+        :param now: current time in ms, defaults to the latest message timestamp seen.
+        :return: the expired users.
+        """
+        now = self.clock if now is None else now
+        expired = []
+        for _ in range(self.sweep_limit):
+            if not self._schedule or self._schedule[0][0] > now:
+                break
+            _, user_id = heapq.heappop(self._schedule)
+            last_seen = self._last_seen.get(user_id)
+            if last_seen is None:
+                self._scheduled.discard(user_id) # forgotten since it was scheduled
+                continue
+            deadline = last_seen + self.ttl_ms
+            if deadline > now:
+                heapq.heappush(self._schedule, (deadline, user_id))
+            else:
+                del self._last_seen[user_id]
+                self._scheduled.discard(user_id)
+                expired.append(user_id)
+        self.expired_users += len(expired)
+        return expired
+
+    def forget(self, user_id: str) -> None:
+        """
+        Stops tracking a user without expiring it, e.g. when another consumer takes over the user:
+        its state must not be freed from the store when it becomes idle here.
+        """
+        self._last_seen.pop(user_id, None)
+
+    def report(self) -> str:
+        """Returns the active/expired user counters."""
+        return f"active users: {self.active_users}, expired users: {self.expired_users}"
+
+
+if __name__ == "__main__":
+    # executes test codes.
+    expiry = IdleExpiry(ttl_ms=1000, sweep_limit=2)
+    for user_id in ("a", "b", "c"):
+        expiry.touch(user_id, 0)
+    expiry.touch("a", 900) # "a" stays active
+    assert expiry.sweep(999) == [] and expiry.active_users == 3
+
+    # at most sweep_limit users are examined per sweep: "a" is rescheduled, "b" expires.
+    assert expiry.sweep(1000) == ["b"]
+    assert expiry.sweep(1000) == ["c"]
+    assert expiry.active_users == 1 and expiry.expired_users == 2
+
+    # the clock follows the message timestamps.
+    expiry.touch("d", 2000)
+    assert expiry.sweep() == ["a"] and expiry.active_users == 1
+
+    # a forgotten user never expires, and is tracked again when seen again.
+    expiry.forget("d")
+    assert expiry.active_users == 0 and expiry.sweep(10 ** 9) == []
+    expiry.touch("d", 3000)
+    assert expiry.sweep(4000) == ["d"]
+    assert expiry.report() == "active users: 0, expired users: 4"
+
+    # a user forgotten and seen again, rebalance after rebalance, keeps a single entry.
+    for cycle in range(5):
+        expiry.touch("e", 5000 + cycle)
+        expiry.forget("e")
+    expiry.touch("e", 5010)
+    assert len(expiry._schedule) == 1 and expiry.sweep(6009) == [] and len(expiry._schedule) == 1
+    assert expiry.sweep(6010) == ["e"] and not expiry._schedule and not expiry._scheduled
+
+    # a disabled expiry keeps every user.
+    disabled = IdleExpiry(ttl_ms=0)
+    disabled.touch("a", 0)
+    assert disabled.sweep(10 ** 9) == [] and disabled.active_users == 0
@@ -1,24 +1,157 @@
 """
 Cache implementation replacing Faust's RocksDB table().
-Uses dbm(https://docs.python.org/3/library/dbm.html).
+Uses the key-value store selected by STORE_HOST (backends.py), e.g. dbm(https://docs.python.org/3/library/dbm.html).
+SensorWindow values are stored as append-only chunks (chunked.py), other values are pickled.
 """
+from collections import OrderedDict
 from contextlib import contextmanager
-import dbm.gnu
-import os
 import pickle
+import threading
+from typing import Iterable, Optional
+
+from cache.backends import open_backend
+from cache.chunked import ChunkedWindowCodec, is_window
+from configurations import InferenceConfigurations
+from window.ring_buffer import SensorWindow
 
 
 class Cache:
     """
-    Wrapper class for dbm.
+    Wrapper class for the key-value store (dbm, SQLite or memory).
     Supports implicit serializaion/deserialization.
+    Writing a SensorWindow only stores the samples appended since its previous write.
+
+    Live values are kept in an in-process hot tier (LRU, bounded by "hot_capacity" keys).
+    Updated values are written back to the store by a background thread every "flush_interval_ms",
+    when they are evicted from the hot tier, and when the cache is closed.
+    Values modified in place (e.g. windows) must be modified within "with cache.updating():",
+    so that they are not written back while being modified.
     """
-    def __init__(self, filename: str = "cache.dbm"):
+    def __init__(self, store_host: str = InferenceConfigurations.store_host,
+                 hot_capacity: int = InferenceConfigurations.cache_hot_capacity,
+                 flush_interval_ms: int = InferenceConfigurations.cache_flush_interval_ms):
+        """
+        :param store_host: url of the store, e.g. "dbm://cache.dbm". the file is created if not exists.
+        :param hot_capacity: max number of keys kept in memory. 0 reads and writes the store on every access.
+        :param flush_interval_ms: interval of the background write-back. 0 disables the background thread.
+        """
+        self.db = open_backend(store_host)
+        self.hot_capacity = hot_capacity
+        self._hot = OrderedDict() # key -> live value, least recently used first
+        self._dirty = set() # keys whose live value is not written to the store yet
+        # Taken in this order.
+        self._write_lock = threading.RLock() # held while live values are modified in place, and written back
+        self._lock = threading.Lock() # guards the hot tier
+        self._db_lock = threading.RLock() # guards the store, which is not thread-safe, and the chunk indexes
+        self._windows = ChunkedWindowCodec()
+
+        self._stop = threading.Event()
+        self._flusher = None
+        if flush_interval_ms > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, args=(flush_interval_ms / 1000,), name="cache-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    @property
+    def hot_size(self) -> int:
+        """Returns the number of values held in the hot tier."""
+        return len(self._hot)
+
+    @contextmanager
+    def updating(self):
+        """
+        Holds the write-back of the live values, e.g. while a window returned by get() is extended.
+        get() and set() of the hot tier are not blocked.
+        """
+        with self._write_lock:
+            yield
+
+    def _flush_periodically(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def _read(self, key: str):
+        with self._db_lock:
+            return self.db.get(key, None)
+
+    def _serialize(self, items) -> list:
+        """
+        Converts (key, value) pairs to the store operations storing them: (key, bytes) writes and (key, None) deletes.
+        """
+        operations = []
+        for key, value in items:
+            if isinstance(value, SensorWindow):
+                operations.extend(self._windows.encode(key, value, self._read))
+            else:
+                operations.extend(self._windows.delete(key, self._read))
+                operations.append((key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+        return operations
+
+    def _store(self, operations) -> None:
+        """
+        Applies store operations. Must be called with self._db_lock held.
+        """
+        self.db.write_batch(operations)
+
+    def _evict(self) -> None:
         """
-        :param filename: filename of the dbm database. created if not exists.
+        Drops the least recently used keys beyond "hot_capacity", writing back the dirty ones.
+        Must be called without self._lock held.
         """
-        dbm_path = os.path.abspath(os.path.join(__file__, "..", filename))
-        self.db = dbm.gnu.open(dbm_path, "c")
+        with self._write_lock:
+            with self._lock:
+                evicted = []
+                while len(self._hot) > self.hot_capacity:
+                    key, value = self._hot.popitem(last=False)
+                    if key in self._dirty:
+                        self._dirty.discard(key)
+                        evicted.append((key, value))
+                # Taken before releasing the hot tier, so the evicted keys are not read from the store before written.
+                self._db_lock.acquire()
+            try:
+                self._store(self._serialize(evicted))
+            finally:
+                self._db_lock.release()
+
+    def flush(self, keys: Optional[Iterable[str]] = None) -> None:
+        """
+        Writes every dirty value of the hot tier to the store.
+        :param keys: writes only the dirty values of these keys, e.g. the users of a revoked partition.
+        """
+        # Serialized out of the hot tier lock, which does not block get() and set(): the write lock keeps the values
+        # from being modified in place (see updating()) and written back by another thread meanwhile.
+        with self._write_lock:
+            with self._lock:
+                dirty = self._dirty if keys is None else self._dirty.intersection(keys)
+                items = [(key, self._hot[key]) for key in dirty]
+                if keys is None:
+                    self._dirty.clear()
+                else:
+                    self._dirty.difference_update(dirty)
+            with self._db_lock:
+                self._store(self._serialize(items))
+
+    def release(self, keys: Iterable[str]) -> None:
+        """
+        Writes back the dirty values of the keys and drops them from the hot tier, keeping them in the store,
+        e.g. when another consumer takes over their users. Their next get() reads the store again.
+        """
+        keys = list(keys)
+        with self._write_lock:
+            with self._lock:
+                items = [(key, self._hot[key]) for key in keys if key in self._dirty]
+                for key in keys:
+                    self._hot.pop(key, None)
+                    self._dirty.discard(key)
+                # Taken before releasing the hot tier, so the released keys are not read from the store before written.
+                self._db_lock.acquire()
+            try:
+                self._store(self._serialize(items))
+                for key in keys:
+                    self._windows.forget(key)
+            finally:
+                self._db_lock.release()
 
     def get(self, key: str) -> any:
         """
@@ -26,14 +159,32 @@ class Cache:
 
         **WARNING: Unlike dictionary, the cache itself does not change even if the returned value is modified,
         unless the cache is explicitly updated with the "set(key, value)" method.**
+        (While the key stays in the hot tier, get() returns the same live object,
+        but modifications are only persisted after "set(key, value)".)
         
         If the cache does not exist, returns None.
         :param key: key to search.
         """
-        value_serialized = self.db.get(key, None)
+        with self._lock:
+            if key in self._hot:
+                self._hot.move_to_end(key)
+                return self._hot[key]
+        with self._db_lock:
+            value_serialized = self.db.get(key, None)
+            if value_serialized is not None and is_window(value_serialized):
+                value = self._windows.decode(key, value_serialized, self.db.__getitem__)
         if value_serialized is None:
             return None
-        value = pickle.loads(value_serialized)
+        if not is_window(value_serialized):
+            value = pickle.loads(value_serialized)
+        with self._lock:
+            if key in self._hot:
+                # set() by another thread while reading the store
+                return self._hot[key]
+            self._hot[key] = value
+            full = len(self._hot) > self.hot_capacity
+        if full:
+            self._evict()
         return value
 
     def set(self, key: str, value) -> None:
@@ -42,15 +193,30 @@ class Cache:
         :param key: key to update the value.
         :parma value: new cache value.
         """
-        value_serialized = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
-        self.db[key] = value_serialized
+        with self._lock:
+            self._hot[key] = value
+            self._hot.move_to_end(key)
+            self._dirty.add(key)
+            full = len(self._hot) > self.hot_capacity
+        if full:
+            self._evict()
 
     def delete(self, key: str) -> None:
         """
         Deletes the key from the cache.
         :param key: key to delete from the cache.
         """
-        del self.db[key]
+        with self._write_lock:
+            with self._lock:
+                cached = self._hot.pop(key, None) is not None
+                self._dirty.discard(key)
+            with self._db_lock:
+                self._store(self._windows.delete(key, self._read))
+                try:
+                    del self.db[key]
+                except KeyError:
+                    if not cached:
+                        raise
 
     def __getitem__(self, key: str) -> any:
         return self.get(key)
@@ -63,31 +229,42 @@ class Cache:
 
     def close(self):
         """
-        closes the database file.
+        writes back the hot tier and closes the store.
         """
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
         self.db.close()
         self.db = None
 
 
 @contextmanager
-def get_context_cache():
+def get_context_cache(store_host: str = InferenceConfigurations.store_host):
     """
-    manages context of the wrapped dbm object,
-    so that closing the dbm database can be done automatically,
+    manages context of the wrapped store object,
+    so that closing the store can be done automatically,
     when exitting from the "with" statement.
+    :param store_host: url of the store, defaults to STORE_HOST.
     """
     # pylint: disable-next=redefined-outer-name
-    cache = Cache()
-    yield cache
-    cache.close()
+    cache = Cache(store_host)
+    try:
+        yield cache
+    finally:
+        # also on SIGTERM, when the event loop is stopped: the hot tier holds the dirty windows
+        cache.close()
 
 
 if __name__ == "__main__":
-    # executes test codes.
+    # executes test codes, against a persistent store (default: dbm).
+    # run from components/consumer/src: python -m cache.table [STORE_HOST, e.g. sqlite:///tmp/cache.sqlite]
+    import sys
+    STORE_HOST = sys.argv[1] if len(sys.argv) > 1 else "dbm://cache.dbm"
     USER_ID1 = "user_id1"
     USER_ID2 = "user_id2"
 
-    with get_context_cache() as cache:
+    with get_context_cache(STORE_HOST) as cache:
         if cache[USER_ID1] is not None:
             del cache[USER_ID1]
         if cache[USER_ID2] is not None:
@@ -102,12 +279,12 @@ if __name__ == "__main__":
         del cache[USER_ID2] # or "cache.delete(USER_ID2)"
         assert cache[USER_ID2] is None
 
-    with get_context_cache() as cache:
+    with get_context_cache(STORE_HOST) as cache:
         # the cache persists even when the process is exitted.
         assert cache[USER_ID1] == (1, 2, 3)
         assert cache[USER_ID2] is None
 
-    with get_context_cache() as cache:
+    with get_context_cache(STORE_HOST) as cache:
         if cache[USER_ID1] is not None:
             del cache[USER_ID1]
 
@@ -119,4 +296,69 @@ if __name__ == "__main__":
         cache[USER_ID1] = window
         print(cache[USER_ID1])
 
+    # the hot tier writes back values evicted by the LRU policy, and dirty values on flush().
+    with get_context_cache(STORE_HOST) as cache:
+        cache.hot_capacity = 1
+        cache[USER_ID1] = [1]
+        cache[USER_ID2] = [2] # evicts USER_ID1, which is written to the store
+        assert USER_ID1 not in cache._hot
+        assert pickle.loads(cache.db[USER_ID1]) == [1]
+        cache.flush()
+        assert pickle.loads(cache.db[USER_ID2]) == [2]
+        del cache[USER_ID2]
+        assert cache[USER_ID2] is None
+
+    # windows are stored as chunks: each write only adds the new segment and deletes stale chunks.
+    import numpy as np
+    from window.ring_buffer import MODALITIES
+    segment = {col: {"hz": 2, "value": np.array([[1, 2, 3], [4, 5, 6]]) if col == "chest_acc" else [1.5, 2.5]} for col in MODALITIES}
+    with get_context_cache(STORE_HOST) as cache:
+        cache.hot_capacity = 0 # write through
+        window = SensorWindow(window_size=2)
+        window.extend(segment)
+        cache[USER_ID1] = window
+        window.extend(segment)
+        window["chest_acc"].advance(3)
+        cache[USER_ID1] = window
+        assert [chunk[0] for chunk in cache._windows.indexes[USER_ID1]["chunks"]] == [0, 1]
+        for col in MODALITIES:
+            window[col].advance(max(2 - window[col].head, 0))
+        window.extend(segment)
+        cache[USER_ID1] = window
+        # chunk 0 is dropped, since it is before the head of every modality
+        assert [chunk[0] for chunk in cache._windows.indexes[USER_ID1]["chunks"]] == [1, 2]
+        assert cache.db.get(f"{USER_ID1}\0{0}") is None
+
+    with get_context_cache(STORE_HOST) as cache:
+        restored = cache[USER_ID1]
+        for col in MODALITIES:
+            assert restored[col].view().tolist() == window[col].view().tolist()
+            assert (restored[col].head, restored[col].tail) == (window[col].head, window[col].tail)
+        del cache[USER_ID1]
+        assert cache.db.get(f"{USER_ID1}\0{1}") is None
+
+
+
+    # release() writes back the values and forgets them: the window is extended by another consumer meanwhile.
+    from cache.chunked import ChunkedWindowCodec
+    with get_context_cache(STORE_HOST) as cache:
+        cache.hot_capacity = 2
+        window = SensorWindow(window_size=4)
+        window.extend(segment)
+        cache[USER_ID1] = window
+        cache[USER_ID2] = [2]
+        cache.flush([USER_ID2])
+        assert USER_ID1 in cache._dirty and pickle.loads(cache.db[USER_ID2]) == [2]
+        cache.release([USER_ID1, USER_ID2])
+        assert cache.hot_size == 0 and USER_ID1 not in cache._windows.indexes
 
+        window.extend(segment)
+        cache.db.write_batch(ChunkedWindowCodec().encode(USER_ID1, window, cache.db.get))
+        taken = cache[USER_ID1]
+        assert taken["chest_ecg"].view().tolist() == [1.5, 2.5, 1.5, 2.5]
+        taken.extend(segment)
+        cache[USER_ID1] = taken
+        cache.release([USER_ID1])
+        assert cache[USER_ID1]["chest_ecg"].view().tolist() == [1.5, 2.5] * 3
+        del cache[USER_ID1]
+        del cache[USER_ID2]
@@ -15,26 +15,49 @@ class DBConfigurations:
     postgres_username = str(os.getenv("POSTGRES_USER") or "postgres")
     postgres_password = str(os.getenv("POSTGRES_PASSWORD") or "postgres")
 
-    # SQLAlchemy connection URL
-    sql_alchemy_url = (
+    # SQLAlchemy connection URL (DATABASE_URL, e.g. "sqlite:///affectstream.sqlite" for the local profile, replaces the PostgreSQL settings)
+    sql_alchemy_url = str(os.getenv("DATABASE_URL") or
         f"postgresql://{postgres_username}:{postgres_password}@{postgres_host}:{postgres_port}/{postgres_db}"
     )
 
+    # EndRecord writer settings
+    end_record_flush_rows = int(os.getenv("END_RECORD_FLUSH_ROWS") or "500") # Rows buffered before a bulk insert
+    end_record_flush_interval_ms = int(os.getenv("END_RECORD_FLUSH_INTERVAL_MS") or "1000") # Max time a row stays buffered
+    end_record_queue_size = int(os.getenv("END_RECORD_QUEUE_SIZE") or "100000") # Queued rows beyond which rows are spilled
+    end_record_spill_path = str(os.getenv("END_RECORD_SPILL_PATH") or "end_record_spill.jsonl") # File receiving the rows that could not be inserted
+    end_record_shutdown_timeout_ms = int(os.getenv("END_RECORD_SHUTDOWN_TIMEOUT_MS") or "10000") # Max wait for the queued rows on shutdown
+    end_record_stage_times = str(os.getenv("END_RECORD_STAGE_TIMES") or "false").lower() == "true" # Also write the stage timestamps of each message (requires the columns of db/models.py)
+
+
+class LoggerConfigurations:
+    """Logging configurations.
+
+    - Selects whether log records are written by the calling thread or by a listener thread.
+    - Defines the share of the per-message INFO records kept, per event type. Warnings and errors are always kept.
+    """
+    log_mode = str(os.getenv("LOG_MODE") or "sync") # "sync" writes each record on the calling thread, "async" queues it for a listener thread
+    log_queue_size = int(os.getenv("LOG_QUEUE_SIZE") or "10000") # Max records waiting for the listener thread, beyond which INFO records are dropped (async mode)
+    log_sample_rates = str(os.getenv("LOG_SAMPLE_RATES") or "") # Share of the records kept per event type, e.g. "received=0.01,prediction=0.1,success=0.01" (unlisted types are all kept)
+
 
 class KafkaConfigurations:
     """Kafka configurations for message processing.
 
     - Retrieves Kafka connection credentials and topic settings from environment variables.
     - Uses IAM authentication details if required.
+    - Uses the in-process broker (local profile) if KAFKA_HOST is "memory://".
     """
     # Connection options
-    kafka_host = str(os.getenv("KAFKA_HOST") or "")
+    kafka_host = str(os.getenv("KAFKA_HOST") or "") # Bootstrap servers, or "memory://" for the in-process broker of the local profile (broker/local.py)
+    security_protocol = str(os.getenv("KAFKA_SECURITY_PROTOCOL") or "SASL_SSL") # "SASL_SSL" (SCRAM-SHA-512, e.g. MSK) or "PLAINTEXT" (local Kafka)
+    local_broker_port = int(os.getenv("LOCAL_BROKER_PORT") or "8080") # Port receiving the simulator records with KAFKA_HOST=memory:// (the producer port, 0: none)
     sasl_user = str(os.getenv("SASL_USERNAME") or "")
     sasl_password = str(os.getenv("SASL_PASSWORD") or "")
     iam_access_key_id = str(os.getenv("IAM_ACCESS_KEY_ID") or "")
     iam_secret_access_key = str(os.getenv("IAM_SECRET_ACCESS_KEY") or "")
     aws_region_name = str(os.getenv("AWS_REGION_NAME") or "")
     registry_name = str(os.getenv("REGISTRY_NAME") or "")
+    schema_path = str(os.getenv("SCHEMA_PATH") or "") # Local Avro schema file (e.g. "schema/SensorRecord.avsc"), used instead of the registry if set
 
     # Consumer options
     topic = str(os.getenv("TOPIC") or "chest") # Kafka topic to subscribe to
@@ -52,10 +75,46 @@ class InferenceConfigurations:
     """Configurations for inference storage and processing.
 
     - Defines storage backend and windowing settings.
-    - Uses RocksDB for persistence in production.
+    - Uses a persistent store (dbm or SQLite) for persistence in production.
     """
-    # Storage backend configuration (Default: in-memory, Recommended: RocksDB for production)
-    store_host = str(os.getenv("STORE_HOST") or "memory://") # In production, "rocksdb://" should be used for persistence.
+    # Storage backend configuration (Default: in-memory, Supported: "memory://", "dbm://[file]", "sqlite://[file]")
+    store_host = str(os.getenv("STORE_HOST") or "memory://") # In production, a persistent store such as "sqlite://" should be used.
     # Inference windowing settings
     window_size = int(os.getenv("WINDOW_SIZE") or "2") # Window size in seconds
-    overlap_size = int(os.getenv("OVERLAP_SIZE") or "1") # Overlap size in seconds
\ No newline at end of file
+    overlap_size = int(os.getenv("OVERLAP_SIZE") or "1") # Overlap size in seconds
+    feature_mode = str(os.getenv("FEATURE_MODE") or "full") # "full" recomputes each window, "incremental" merges per-block aggregates
+    # Missing value settings
+    nan_policy = str(os.getenv("NAN_POLICY") or "drop") # "drop" drops the segments with NaN samples, "interpolate" repairs their short gaps
+    nan_max_gap_ms = int(os.getenv("NAN_MAX_GAP_MS") or "100") # Longest NaN gap repaired by interpolation
+    # Segment ordering settings
+    reorder_lateness_ms = int(os.getenv("REORDER_LATENESS_MS") or "0") # Time a segment waits for older segments of its user (0 appends it at once)
+    reorder_max_segments = int(os.getenv("REORDER_MAX_SEGMENTS") or "8") # Max number of segments held per user
+    deduplication_capacity = int(os.getenv("DEDUPLICATION_CAPACITY") or "100000") # Number of recent connection_id remembered to drop redelivered segments
+    # Micro-batching settings (BATCH_SIZE=1 processes one message at a time)
+    batch_size = int(os.getenv("BATCH_SIZE") or "1") # Max number of windows per predict call
+    batch_max_wait_ms = int(os.getenv("BATCH_MAX_WAIT_MS") or "5") # Max time to wait for a batch to fill, after its first message
+    # Online adaptation settings
+    adaptation_rate = float(os.getenv("ADAPTATION_RATE") or "0.05") # Weight of each new window in the per-user class prior
+    model_memory_budget_mb = float(os.getenv("MODEL_MEMORY_BUDGET_MB") or "64") # Max memory of the per-user models, the idlest users are evicted beyond
+    inference_engine = str(os.getenv("INFERENCE_ENGINE") or "sklearn") # "sklearn" calls predict_proba, "compiled" evaluates the flattened trees with NumPy
+    adaptation_mode = str(os.getenv("ADAPTATION_MODE") or "sync") # "sync" adapts before predicting, "async" adapts in a background thread
+    adaptation_max_staleness_ms = int(os.getenv("ADAPTATION_MAX_STALENESS_MS") or "100") # Max time a predicted window waits for its adaptation (async mode)
+    adaptation_queue_size = int(os.getenv("ADAPTATION_QUEUE_SIZE") or "1024") # Max number of predicted batches waiting for adaptation (async mode)
+    # Cache hot tier settings
+    cache_hot_capacity = int(os.getenv("CACHE_HOT_CAPACITY") or "1024") # Max number of user windows kept in memory
+    cache_flush_interval_ms = int(os.getenv("CACHE_FLUSH_INTERVAL_MS") or "1000") # Interval of the write-back to the persistent store
+    # Idle user expiry settings (USER_TTL_MS=0 keeps every user)
+    user_ttl_ms = int(os.getenv("USER_TTL_MS") or "600000") # Idle time (by message timestamps) after which the window and model of a user are freed
+    user_expiry_sweep_limit = int(os.getenv("USER_EXPIRY_SWEEP_LIMIT") or "100") # Max number of users examined per sweep
+    # Multi-process settings (WORKERS=0 processes messages in the consumer process)
+    workers = int(os.getenv("WORKERS") or "0") # Number of worker processes, each owning a subset of the users
+    worker_queue_size = int(os.getenv("WORKER_QUEUE_SIZE") or "64") # Max number of polled batches waiting for each worker
+    worker_shutdown_timeout_ms = int(os.getenv("WORKER_SHUTDOWN_TIMEOUT_MS") or "30000") # Max wait for the workers to process their queues on shutdown
+    # Staged pipeline settings (PIPELINE_QUEUE_SIZE=0 processes each poll sequentially)
+    pipeline_queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE") or "0") # Max number of polls waiting before each stage
+    pipeline_report_interval_ms = int(os.getenv("PIPELINE_REPORT_INTERVAL_MS") or "10000") # Interval of the stage depth/service time logs
+    # Rebalance handoff settings (REBALANCE_PREFETCH_USERS=0 disables it), through a STORE_HOST shared by the consumers of the group (disabled with memory://)
+    rebalance_prefetch_users = int(os.getenv("REBALANCE_PREFETCH_USERS") or "1000") # Max number of recent users per partition whose window and model are handed over
+    # Metrics settings (METRICS_PORT=0 disables the /metrics endpoint)
+    metrics_port = int(os.getenv("METRICS_PORT") or "9100") # Port of the Prometheus /metrics endpoint
+    metrics_lag_interval_ms = int(os.getenv("METRICS_LAG_INTERVAL_MS") or "5000") # Interval of the consumer lag refresh
@@ -4,4 +4,5 @@ For detailed usage instructions, please refer to README.md.
 
 - database.py: Contains the database connection code.
 - models.py: Defines database tables as classes using ORM. Currently, only the EndRecord class is in use.
+- writer.py: Writes EndRecord rows in bulk from a dedicated thread, spilling them to a local file if the database is slow.
 """
\ No newline at end of file
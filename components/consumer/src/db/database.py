@@ -1,5 +1,5 @@
 from contextlib import contextmanager
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from configurations import DBConfigurations
 
@@ -8,12 +8,31 @@ engine = create_engine(
     DBConfigurations.sql_alchemy_url, # Database connection URL from configurations
     pool_recycle=3600, # Recycle connections after 1 hour
     echo=False, # Disable SQL query logging for production
+    # SQLite (local profile): wait for the locks of the simulator, which writes start_record to the same file
+    connect_args={"timeout": 30} if DBConfigurations.sql_alchemy_url.startswith("sqlite") else {},
 )
 
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _enable_wal(dbapi_connection, connection_record):
+        # readers (e.g. analysis/latency.sql) do not block the inserts of the writer thread
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
 # Create a SQLAlchemy session
 SessionLocal = sessionmaker(autoflush=False, bind=engine)
 
 
+def create_local_tables() -> None:
+    """
+    Creates the end_record table if it does not exist, on SQLite (local profile).
+    PostgreSQL tables are created by infrastructure/kubernetes/analysis/init.sql.
+    """
+    if engine.dialect.name == "sqlite":
+        # imported here: models.py does not depend on the engine
+        from db.models import Base, EndRecord
+        Base.metadata.create_all(engine, tables=[EndRecord.__table__])
+
+
 @contextmanager
 def get_context_db():
     """Provides a database session using a context manager.
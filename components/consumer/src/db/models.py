@@ -1,9 +1,12 @@
-from sqlalchemy import Column, String, BigInteger, Double, ForeignKey
+from sqlalchemy import Column, String, BigInteger, Double, ForeignKey, Integer
 from sqlalchemy.ext.declarative import declarative_base
 
 # Define the base class for all models
 Base = declarative_base()
 
+# BIGSERIAL on PostgreSQL. SQLite only autoincrements an "INTEGER PRIMARY KEY" (64-bit as well), used for the local profile.
+ID_TYPE = BigInteger().with_variant(Integer, "sqlite")
+
 
 class EndRecord(Base):
     """Represents a record for tracking when a process ends."""
@@ -11,7 +14,7 @@ class EndRecord(Base):
     __tablename__ = "end_record" # Database table name
 
     id = Column(
-        BigInteger,
+        ID_TYPE,
         primary_key=True
     )
     connection_id = Column(
@@ -26,6 +29,31 @@ class EndRecord(Base):
         BigInteger,
         nullable=False,
     )
+    # Stage timestamps (ms), written with END_RECORD_STAGE_TIMES=true, null otherwise
+    kafka_timestamp = Column(
+        BigInteger,
+        nullable=True,
+    ) # timestamp of the Kafka record
+    dequeue_time = Column(
+        BigInteger,
+        nullable=True,
+    ) # taken for processing, after the pipeline or worker queues
+    feature_time = Column(
+        BigInteger,
+        nullable=True,
+    ) # window updated and features extracted
+    prediction_time = Column(
+        BigInteger,
+        nullable=True,
+    ) # predict call done
+    batch_size = Column(
+        Integer,
+        nullable=True,
+    ) # windows in the predict call
+    worker_id = Column(
+        Integer,
+        nullable=True,
+    ) # worker process (WORKERS > 0)
 
     def __repr__(self) -> str:
         """String representation of the EndRecord object."""
@@ -38,7 +66,7 @@ class User(Base):
     __tablename__ = "users" # Database table name
 
     id = Column(
-        BigInteger,
+        ID_TYPE,
         primary_key=True
     )
     age = Column(
@@ -61,7 +89,7 @@ class SensorChest(Base):
     __tablename__ = "sensor_chests" # Database table name
 
     id = Column(
-        BigInteger,
+        ID_TYPE,
         primary_key=True
     )
     user_id = Column(
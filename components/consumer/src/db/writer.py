@@ -0,0 +1,174 @@
+"""
+Batched, asynchronous writer of EndRecord rows.
+
+Rows are queued by the consumer and inserted in bulk by a dedicated thread,
+whenever END_RECORD_FLUSH_ROWS rows are buffered or END_RECORD_FLUSH_INTERVAL_MS elapsed,
+so inserts never block Kafka consumption and a crash loses at most one flush interval.
+If the database is slow (the queue is full) or fails, rows are appended to a local JSON-lines spill file instead,
+by the writer thread as well.
+"""
+from collections import deque
+from contextlib import contextmanager
+import json
+import queue
+import threading
+import time
+from typing import List
+
+from sqlalchemy import insert
+
+from configurations import DBConfigurations
+from db.database import engine
+from db.models import EndRecord
+from logger.ConsumerLogger import ConsumerLogger
+from metrics.exporter import DB_FLUSH_SECONDS
+
+logger = ConsumerLogger()
+
+_STOP = object() # queue item stopping the writer thread
+
+
+class EndRecordWriter:
+    """
+    Buffers EndRecord rows and writes them to the database in bulk, off the event loop.
+
+    - queue_depth: rows waiting to be written.
+    - last_flush_ms / max_flush_ms: duration of the bulk inserts.
+    - written_rows / spilled_rows: rows inserted in the database / appended to the spill file.
+    """
+    def __init__(self, bind=engine,
+                 flush_rows: int = DBConfigurations.end_record_flush_rows,
+                 flush_interval_ms: int = DBConfigurations.end_record_flush_interval_ms,
+                 queue_size: int = DBConfigurations.end_record_queue_size,
+                 spill_path: str = DBConfigurations.end_record_spill_path):
+        """
+        :param bind: SQLAlchemy engine to insert the rows with.
+        :param flush_rows: number of buffered rows triggering a flush.
+        :param flush_interval_ms: max time a row stays buffered.
+        :param queue_size: max number of queued rows, beyond which rows are spilled.
+        :param spill_path: JSON-lines file receiving the rows that could not be inserted.
+        """
+        self.bind = bind
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._overflow = deque() # rows that found the queue full, spilled by the writer thread
+
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.written_rows = 0
+        self.spilled_rows = 0
+
+        self._thread = threading.Thread(target=self._run, name="end-record-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        """Returns the number of rows waiting to be written."""
+        return self._queue.qsize() + len(self._overflow)
+
+    def add(self, row: dict) -> None:
+        """
+        Queues an EndRecord row, without blocking (nor writing the spill file).
+        :param row: column values of the row, e.g. {"connection_id": ..., "timestamp": ..., "inference_time": ...}.
+        """
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._overflow.append(row)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until every row queued before the call is written (or spilled).
+        :param timeout: max time to wait, in seconds. None waits until the rows are written.
+        :return: False if the timeout expired.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(None if deadline is None else max(deadline - time.monotonic(), 0))
+
+    def close(self) -> None:
+        """Writes the remaining rows and stops the writer thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self) -> None:
+        rows = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+            self._spill_overflow()
+
+            if item is _STOP:
+                self._write(rows)
+                return
+            if isinstance(item, threading.Event):
+                self._write(rows)
+                rows = []
+                item.set()
+                continue
+            if item is not None:
+                rows.append(item)
+
+            if len(rows) >= self.flush_rows or time.monotonic() >= deadline:
+                self._write(rows)
+                rows = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, rows: List[dict]) -> None:
+        """Inserts the rows with one executemany, or spills them if the insert fails."""
+        if not rows:
+            return
+        start = time.perf_counter()
+        try:
+            with self.bind.begin() as connection:
+                connection.execute(insert(EndRecord), rows)
+        except Exception as e:
+            logger.warning("Failed to write %d end records, spilling them to %s: %s", len(rows), self.spill_path, e)
+            self._spill(rows)
+            return
+        finally:
+            elapsed = time.perf_counter() - start
+            DB_FLUSH_SECONDS.observe(elapsed)
+            self.last_flush_ms = elapsed * 1000
+            self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+        self.written_rows += len(rows)
+
+    def _spill_overflow(self) -> None:
+        """Spills the rows that found the queue full."""
+        rows = []
+        while self._overflow:
+            rows.append(self._overflow.popleft())
+        self._spill(rows)
+
+    def _spill(self, rows: List[dict]) -> None:
+        """Appends rows to the spill file, one JSON object per line."""
+        if not rows:
+            return
+        with open(self.spill_path, "a") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+        self.spilled_rows += len(rows)
+
+
+@contextmanager
+def get_context_writer():
+    """Provides an EndRecordWriter using a context manager.
+
+    - Writes the remaining rows and stops the writer thread on exit.
+
+    Yields:
+        EndRecordWriter: A running writer.
+    """
+    writer = EndRecordWriter()
+    try:
+        yield writer
+    finally:
+        writer.close()
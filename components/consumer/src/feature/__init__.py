@@ -0,0 +1,8 @@
+"""
+This module computes the features fed to the model from the window of a user.
+
+- extractor.py: vectorized feature extraction into a preallocated feature vector.
+- incremental.py: same features, merged from per-block aggregates cached in the window.
+- batch.py: feature matrix of the windows predicted together.
+- benchmark.py: compares the per-window cost of the extractors with feature_extract_sensor in main.py.
+"""
@@ -0,0 +1,43 @@
+"""
+Feature matrix of the windows waiting for a batched predict call.
+"""
+from typing import List
+
+import numpy as np
+
+from feature.extractor import FEATURE_COLUMNS
+
+
+class FeatureBatch:
+    """
+    Preallocated (capacity x n_features) matrix, filled one window (row) at a time.
+    The matrix grows if more windows than "capacity" become ready before the batch is predicted.
+    """
+    def __init__(self, capacity: int):
+        """
+        :param capacity: initial number of rows.
+        """
+        self.matrix = np.empty((max(capacity, 1), len(FEATURE_COLUMNS)), dtype=np.float64)
+        self.user_ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def next_row(self, user_id: str) -> np.ndarray:
+        """
+        Reserves the next row for a window of the user.
+        :return: the row to write the features into.
+        """
+        if len(self) == len(self.matrix):
+            self.matrix = np.concatenate([self.matrix, np.empty_like(self.matrix)])
+        self.user_ids.append(user_id)
+        return self.matrix[len(self) - 1]
+
+    @property
+    def rows(self) -> np.ndarray:
+        """Returns the filled part of the matrix."""
+        return self.matrix[:len(self)]
+
+    def clear(self) -> None:
+        """Empties the batch, keeping the allocated matrix."""
+        self.user_ids.clear()
@@ -0,0 +1,84 @@
+"""
+Benchmark of the feature extraction path.
+Checks that FeatureExtractor matches feature_extract_sensor in main.py bit for bit,
+and that IncrementalFeatureExtractor matches it numerically,
+then reports the per-window cost of each, sliding the window by overlap_size seconds.
+
+Usage (from the src/ directory):
+    python -m feature.benchmark --hz 700 --window-size 2 --overlap-size 1
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from feature.extractor import FEATURE_COLUMNS, FeatureExtractor
+from feature.incremental import IncrementalFeatureExtractor
+from window.ring_buffer import ACC_MODALITIES, MODALITIES, SensorWindow
+
+
+def synthetic_window(window_size: int, hz: int, seed: int = 0) -> SensorWindow:
+    """
+    Builds a full window of 16-bit ADC-like samples, as sent by the simulator.
+    """
+    rng = np.random.default_rng(seed)
+    length = window_size * hz
+    segment = {}
+    for col in MODALITIES:
+        shape = (length, 3) if col in ACC_MODALITIES else (length,)
+        segment[col] = {"hz": hz, "value": rng.integers(0, 1 << 16, size=shape)}
+    window = SensorWindow(window_size)
+    window.extend(segment)
+    return window
+
+
+def sliding(extract, window: SensorWindow, segment: dict, overlap_size: int):
+    """Returns a function extracting the next window: appends one step of samples, extracts, drops the oldest step."""
+    def step():
+        window.extend(segment)
+        extract(window)
+        for col in MODALITIES:
+            window[col].advance(overlap_size * window.hz[col])
+    return step
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hz", type=int, default=700, help="sampling rate of every modality")
+    parser.add_argument("--window-size", type=int, default=2, help="window size in seconds")
+    parser.add_argument("--overlap-size", type=int, default=1, help="step between two windows in seconds")
+    parser.add_argument("--number", type=int, default=200, help="windows per measurement")
+    args = parser.parse_args()
+
+    # imported here, since main.py connects its dependencies at import time.
+    import main as consumer
+    consumer.InferenceConfigurations.window_size = args.window_size
+
+    window = synthetic_window(args.window_size, args.hz)
+    extractor = FeatureExtractor(args.window_size)
+
+    reference = consumer.feature_extract_sensor("user", 0, window)
+    reference = reference[reference.columns.difference(['user_id', 'timestamp'])]
+    assert tuple(reference.columns) == FEATURE_COLUMNS
+    expected = reference.to_numpy(dtype=np.float64)[0]
+    actual = extractor.extract(window)
+    assert expected.tobytes() == actual.tobytes(), "features differ from feature_extract_sensor"
+
+    incremental = IncrementalFeatureExtractor(args.window_size, args.overlap_size)
+    assert np.allclose(incremental.extract(window), expected, rtol=1e-12, atol=1e-9), "features differ from feature_extract_sensor"
+
+    # every measurement slides its own copy of the window, one overlap_size step per call.
+    step = synthetic_window(args.overlap_size, args.hz, seed=1)
+    segment = {col: {"hz": args.hz, "value": step[col].view()} for col in MODALITIES}
+    for name, extract in (
+        ("feature_extract_sensor", lambda w: consumer.feature_extract_sensor("user", 0, w)),
+        ("FeatureExtractor", extractor.extract),
+        ("IncrementalFeature...", incremental.extract),
+    ):
+        func = sliding(extract, synthetic_window(args.window_size, args.hz), segment, args.overlap_size)
+        best = min(timeit.repeat(func, number=args.number, repeat=5)) / args.number
+        print(f"{name:<26} {best * 1e6:10.1f} us/window")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Vectorized feature extraction.
+
+Computes the same mean/std/max/min features as feature_extract_sensor in main.py,
+but directly on the ring buffer views and into a preallocated feature vector,
+so no Python objects or DataFrames are created per window.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+from window.ring_buffer import ACC_MODALITIES, MODALITIES, SensorWindow
+
+FEATURE_STATS = ("mean", "std", "max", "min")
+# Column order expected by the model.
+# Same as new_feat.columns.difference(['user_id', 'timestamp']), which sorts the column names.
+FEATURE_COLUMNS = tuple(sorted(f"{col}_{stat}" for col in MODALITIES for stat in FEATURE_STATS))
+
+
+class FeatureExtractor:
+    """
+    Extracts the features of a window into a fixed-order float64 vector.
+    Scratch buffers are allocated once and reused for every window.
+    """
+    def __init__(self, window_size: int):
+        """
+        :param window_size: window size in seconds.
+        """
+        self.window_size = window_size
+        self.features = np.empty(len(FEATURE_COLUMNS), dtype=np.float64)
+        # Position of each (modality, statistic) in the feature vector.
+        self._index: Dict[str, tuple] = {
+            col: tuple(FEATURE_COLUMNS.index(f"{col}_{stat}") for stat in FEATURE_STATS)
+            for col in MODALITIES
+        }
+        self._squares = np.empty((0, 3), dtype=np.float64)
+        self._scratch = np.empty(0, dtype=np.float64)
+
+    def _reserve(self, length: int) -> None:
+        if len(self._scratch) < length:
+            self._squares = np.empty((length, 3), dtype=np.float64)
+            self._scratch = np.empty(2 * length, dtype=np.float64)
+
+    def extract(self, sensor_data: SensorWindow, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Computes the features of the oldest "window_size" seconds of the window.
+        :param sensor_data: the window of a user.
+        :param out: vector of len(FEATURE_COLUMNS) to write into (e.g. a row of a batch matrix).
+         Defaults to an internal vector that is overwritten by the next call.
+        :return: the feature vector, ordered as FEATURE_COLUMNS.
+        """
+        if out is None:
+            out = self.features
+        for col in MODALITIES:
+            window_length = self.window_size * sensor_data.hz[col]
+            self._reserve(window_length)
+            values = sensor_data[col].view(window_length)
+            if col in ACC_MODALITIES:  # l2-norm of X, Y, Z axis
+                squares = self._squares[:window_length]
+                np.square(values, out=squares, dtype=np.float64)
+                values = self._scratch[window_length:2 * window_length]
+                np.add(squares[:, 0], squares[:, 1], out=values)
+                np.add(values, squares[:, 2], out=values)
+                np.sqrt(values, out=values)
+
+            # Same operations as np.mean and np.std, without their temporaries.
+            i_mean, i_std, i_max, i_min = self._index[col]
+            mean = np.add.reduce(values) / window_length
+            deviation = self._scratch[:window_length]
+            np.subtract(values, mean, out=deviation)
+            np.multiply(deviation, deviation, out=deviation)
+            out[i_mean] = mean
+            out[i_std] = np.sqrt(np.add.reduce(deviation) / window_length)
+            out[i_max] = np.maximum.reduce(values)
+            out[i_min] = np.minimum.reduce(values)
+        return out
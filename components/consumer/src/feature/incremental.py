@@ -0,0 +1,151 @@
+"""
+Incremental feature extraction from per-block aggregates.
+
+Consecutive windows share most of their samples (window_size=2 and overlap_size=1 summarize every sample twice).
+The window is split into blocks of gcd(window_size, overlap_size) seconds, the step between two windows,
+and each block is summarized once per modality as (count, sum, M2, max, min),
+M2 being the sum of squared deviations from the mean of the block (a stable form of the sum of squares).
+The features of a window are then merged from its blocks, so only the blocks of the new data are computed.
+"""
+import math
+from typing import Optional
+
+import numpy as np
+
+from feature.extractor import FEATURE_COLUMNS, FEATURE_STATS
+from window.ring_buffer import ACC_MODALITIES, MODALITIES, SensorWindow
+
+# Fields of a block aggregate
+COUNT, SUM, M2, MAX, MIN = range(5)
+
+
+def aggregate(values: np.ndarray, accelerometer: bool = False) -> np.ndarray:
+    """
+    Summarizes the samples of a block.
+    :param values: samples of the block, (n, 3) for accelerometers.
+    :param accelerometer: aggregates the l2-norm of the X, Y, Z axis.
+    :return: the aggregate of the block, indexed by COUNT, SUM, M2, MAX, MIN.
+    """
+    if accelerometer:
+        squares = np.square(values, dtype=np.float64)
+        values = squares[:, 0] + squares[:, 1]
+        np.add(values, squares[:, 2], out=values)
+        np.sqrt(values, out=values)
+    count = len(values)
+    total = np.add.reduce(values, dtype=np.float64)
+    deviation = np.subtract(values, total / count, dtype=np.float64)
+    return np.array([count, total, np.dot(deviation, deviation), np.maximum.reduce(values), np.minimum.reduce(values)],
+                    dtype=np.float64)
+
+
+class IncrementalFeatureExtractor:
+    """
+    Extracts the same features as FeatureExtractor, merging cached block aggregates.
+    Aggregates are cached in SensorWindow.blocks, keyed by the absolute position of their first sample,
+    and recomputed from the samples when missing (e.g. for a window read back from the persistent store).
+
+    - computed_blocks / reused_blocks: blocks aggregated from samples / taken from the cache.
+    """
+    def __init__(self, window_size: int, overlap_size: int):
+        """
+        :param window_size: window size in seconds.
+        :param overlap_size: step between two windows in seconds.
+        """
+        self.window_size = window_size
+        self.block_size = math.gcd(window_size, overlap_size)
+        self.blocks_per_window = window_size // self.block_size
+        self.features = np.empty(len(FEATURE_COLUMNS), dtype=np.float64)
+        # Position of each statistic of every modality in the feature vector, in MODALITIES order.
+        self._index = tuple(
+            np.array([FEATURE_COLUMNS.index(f"{col}_{stat}") for col in MODALITIES]) for stat in FEATURE_STATS
+        )
+        self._blocks = np.empty((len(MODALITIES), self.blocks_per_window, 5), dtype=np.float64)
+
+        self.computed_blocks = 0
+        self.reused_blocks = 0
+
+    def extract(self, sensor_data: SensorWindow, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Computes the features of the oldest "window_size" seconds of the window.
+        :param sensor_data: the window of a user.
+        :param out: vector of len(FEATURE_COLUMNS) to write into (e.g. a row of a batch matrix).
+         Defaults to an internal vector that is overwritten by the next call.
+        :return: the feature vector, ordered as FEATURE_COLUMNS.
+        """
+        if out is None:
+            out = self.features
+        for i, col in enumerate(MODALITIES):
+            buffer = sensor_data[col]
+            block_length = self.block_size * sensor_data.hz[col]
+            cache = sensor_data.blocks.setdefault(col, {})
+            # blocks before the head were dropped from the window
+            for start in [start for start in cache if start < buffer.head]:
+                del cache[start]
+
+            values = None
+            for b in range(self.blocks_per_window):
+                start = buffer.head + b * block_length
+                block = cache.get(start)
+                if block is None:
+                    if values is None:
+                        values = buffer.view(self.blocks_per_window * block_length)
+                    block = aggregate(values[b * block_length:(b + 1) * block_length], col in ACC_MODALITIES)
+                    cache[start] = block
+                    self.computed_blocks += 1
+                else:
+                    self.reused_blocks += 1
+                self._blocks[i, b] = block
+
+        # Merge the blocks of every modality at once (Chan et al. pairwise update of M2).
+        blocks = self._blocks
+        count = np.add.reduce(blocks[:, :, COUNT], axis=1)
+        mean = np.add.reduce(blocks[:, :, SUM], axis=1) / count
+        shift = blocks[:, :, SUM] / blocks[:, :, COUNT] - mean[:, None]
+        m2 = np.add.reduce(blocks[:, :, M2], axis=1) + np.add.reduce(blocks[:, :, COUNT] * shift * shift, axis=1)
+
+        i_mean, i_std, i_max, i_min = self._index
+        out[i_mean] = mean
+        out[i_std] = np.sqrt(m2 / count)
+        out[i_max] = np.maximum.reduce(blocks[:, :, MAX], axis=1)
+        out[i_min] = np.minimum.reduce(blocks[:, :, MIN], axis=1)
+        return out
+
+
+if __name__ == "__main__":
+    # executes test codes: streams segments through the window as main.update_window does,
+    # and checks every window against the full recomputation.
+    from feature.extractor import FeatureExtractor
+
+    for window_size, overlap_size, hz in ((2, 1, 700), (4, 1, 32), (6, 4, 4), (3, 3, 64)):
+        rng = np.random.default_rng(window_size)
+        full = FeatureExtractor(window_size)
+        incremental = IncrementalFeatureExtractor(window_size, overlap_size)
+        window = SensorWindow(window_size)
+        windows = 0
+        for second in range(20):
+            window.extend({
+                col: {"hz": hz, "value": rng.integers(0, 1 << 16, size=(hz, 3) if col in ACC_MODALITIES else hz)}
+                for col in MODALITIES
+            })
+            while all(window.length(col) >= window_size * hz for col in MODALITIES):
+                expected = full.extract(window).copy()
+                actual = incremental.extract(window)
+                assert np.allclose(actual, expected, rtol=1e-12, atol=1e-9), (window_size, overlap_size, second)
+                assert (actual[list(incremental._index[2])] == expected[list(incremental._index[2])]).all()
+                windows += 1
+                for col in MODALITIES:
+                    window[col].advance(overlap_size * hz)
+        assert windows > 0
+        blocks = windows * incremental.blocks_per_window * len(MODALITIES)
+        assert incremental.computed_blocks + incremental.reused_blocks == blocks
+        if incremental.blocks_per_window > 1:
+            assert incremental.reused_blocks > 0
+
+    # a window without cached aggregates (e.g. read back from the store) is recomputed.
+    window.extend({
+        col: {"hz": hz, "value": rng.integers(0, 1 << 16, size=(window_size * hz, 3) if col in ACC_MODALITIES else window_size * hz)}
+        for col in MODALITIES
+    })
+    window.blocks.clear()
+    assert np.allclose(IncrementalFeatureExtractor(3, 3).extract(window), FeatureExtractor(3).extract(window))
+    print("ok")
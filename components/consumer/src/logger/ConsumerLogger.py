@@ -1,5 +1,9 @@
+import atexit
 import logging
 
+from configurations import LoggerConfigurations
+from logger.handlers import DrainingQueueListener, DroppingQueueHandler
+
 LOGGER_LEVEL = logging.INFO # Set the logging level to INFO as default
 FORMATTER = "%(asctime)s \t [%(levelname)s | %(filename)s:%(lineno)s] > %(message)s" # Define the log message format
 
@@ -9,16 +13,20 @@ class ConsumerLogger:
     
     - Ensures only one instance of the logger is created.
     - Logs messages with timestamps, severity level, filename, and line number.
+    - With LOG_MODE=async, the records are formatted and written by a listener thread (see handlers.py).
     """
 
     _logger = None # Private class variable to store the logger instance
+    _queue_handler = None # Queue handler of the async mode
+    _listener = None # Listener thread of the async mode
 
     def __new__(cls, *args, **kwargs):
         """Creates a singleton logger instance if not already created.
 
         - Uses `logging.getLogger()` to configure the logger.
         - Sets log level to `LOGGER_LEVEL`.
-        - Attaches a `StreamHandler` to output logs to the console.
+        - Attaches a `StreamHandler` to output logs to the console,
+          directly or (LOG_MODE=async) behind a `DroppingQueueHandler` and its `DrainingQueueListener`.
 
         Returns:
             logging.Logger: A singleton logger instance.
@@ -29,5 +37,23 @@ class ConsumerLogger:
             cls._logger.setLevel(LOGGER_LEVEL) # Set the logging level
             handler = logging.StreamHandler() # Create a StreamHandler to output logs to the console
             handler.setFormatter(logging.Formatter(FORMATTER)) # Set the log message format
+            if LoggerConfigurations.log_mode == "async":
+                cls._queue_handler = DroppingQueueHandler(LoggerConfigurations.log_queue_size)
+                cls._listener = DrainingQueueListener(cls._queue_handler.queue, handler) # Write the records from a background thread
+                cls._listener.start()
+                atexit.register(cls.stop) # Write the queued records before exiting
+                handler = cls._queue_handler
             cls._logger.addHandler(handler) # Attach the handler to the logger
         return cls._logger
+
+    @classmethod
+    def dropped(cls) -> int:
+        """Returns the number of records dropped because the queue of the listener was full (async mode)."""
+        return cls._queue_handler.dropped if cls._queue_handler is not None else 0
+
+    @classmethod
+    def stop(cls) -> None:
+        """Writes the queued records and stops the listener thread (async mode)."""
+        if cls._listener is not None:
+            cls._listener.stop()
+            cls._listener = None
@@ -1,4 +1,8 @@
 """
 This module logs messages with timestamps.
 Usage example: logger.info("Prediction is skipped...")
+
+- ConsumerLogger.py: singleton logger, writing synchronously or through a listener thread (LOG_MODE).
+- handlers.py: queue handler of the listener thread, dropping INFO records when its queue is full.
+- sampling.py: per event type sampling of the per-message INFO logs (LOG_SAMPLE_RATES).
 """
\ No newline at end of file
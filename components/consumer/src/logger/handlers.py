@@ -0,0 +1,91 @@
+"""
+Asynchronous log handler (LOG_MODE=async).
+
+The calling thread only builds the LogRecord and puts it in a bounded queue:
+the message is formatted and written by the StreamHandler of a QueueListener thread.
+When the queue is full, INFO and DEBUG records are dropped and counted,
+while warnings and errors wait for room, so they are never lost.
+On exit, the listener writes every queued record before it stops, even if the queue is full.
+"""
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that defers the formatting to the listener, and drops the records below WARNING when the queue is full.
+
+    - dropped: records dropped because the queue was full.
+    """
+    def __init__(self, queue_size: int):
+        """
+        :param queue_size: max number of records waiting for the listener.
+        """
+        super().__init__(queue.Queue(maxsize=max(queue_size, 1)))
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the queue stays in this process: the record is passed as is, and formatted by the listener.
+        # (QueueHandler.prepare formats the message on the calling thread, to make the record picklable)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """
+    QueueListener whose stop() waits for room in a full queue, instead of raising queue.Full:
+    the records queued before stop() are all handled.
+    """
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+if __name__ == "__main__":
+    # executes test codes.
+    import time
+
+    handler = DroppingQueueHandler(queue_size=2)
+    test_logger = logging.getLogger("test")
+    test_logger.setLevel(logging.INFO)
+    test_logger.propagate = False
+    test_logger.addHandler(handler)
+    for i in range(3):
+        test_logger.info("record %d", i)
+    assert handler.dropped == 1 and handler.queue.qsize() == 2
+
+    # records keep their arguments until the listener formats them.
+    record = handler.queue.get_nowait()
+    assert record.msg == "record %d" and record.args == (0,) and record.getMessage() == "record 0"
+
+    written = []
+    target = logging.Handler()
+    target.emit = lambda record: written.append(target.format(record))
+    listener = QueueListener(handler.queue, target)
+    listener.start()
+    test_logger.warning("warning")
+    listener.stop()
+    assert written == ["record 1", "warning"]
+
+    # a full queue at exit: stop() waits for the slow target, and every queued record is written.
+    handler = DroppingQueueHandler(queue_size=4)
+    test_logger.handlers = [handler]
+    written = []
+    target = logging.Handler()
+    target.emit = lambda record: (time.sleep(0.005), written.append(record.getMessage()))
+    listener = DrainingQueueListener(handler.queue, target)
+    listener.start()
+    for i in range(50):
+        test_logger.info("record %d", i)
+    assert handler.queue.full()
+    listener.stop()
+    assert handler.queue.empty() and len(written) == 50 - handler.dropped and handler.dropped > 0
+    print("ok")
@@ -0,0 +1,82 @@
+"""
+Sampling of the per-message INFO logs (LOG_SAMPLE_RATES).
+
+Each log call of the processing path belongs to an event type ("received", "prediction", "success"),
+and is guarded by EventSampler.keep before the logger is called,
+so a sampled-out record costs a dict lookup: no LogRecord, no formatting and no I/O.
+A rate r keeps one record in round(1 / r) of its event type, counting from the first one.
+Only INFO logs are sampled: warnings and errors are logged without a guard.
+"""
+from typing import Dict
+
+from configurations import LoggerConfigurations
+
+
+def parse_rates(rates: str) -> Dict[str, int]:
+    """
+    Parses "event=rate,..." into the sampling interval of each event type.
+    :return: per event type, 1 record kept every interval records (0 keeps none).
+    """
+    intervals = {}
+    for item in filter(None, (item.strip() for item in rates.split(","))):
+        event, sep, rate = item.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid log sample rate: {item}, expected event=rate")
+        rate = float(rate)
+        if not 0 <= rate <= 1:
+            raise ValueError(f"Invalid log sample rate of {event.strip()}: {rate}, expected between 0 and 1")
+        intervals[event.strip()] = max(round(1 / rate), 1) if rate > 0 else 0
+    return intervals
+
+
+class EventSampler:
+    """
+    Keeps a share of the records of each event type.
+
+    - sampled: records skipped, per event type.
+    """
+    def __init__(self, rates: str = LoggerConfigurations.log_sample_rates):
+        """
+        :param rates: share of the records kept per event type, e.g. "received=0.01,success=0.1".
+        """
+        # event types kept 1 in 1 are not tracked: keep returns at the first lookup
+        self.intervals = {event: interval for event, interval in parse_rates(rates).items() if interval != 1}
+        self._seen = dict.fromkeys(self.intervals, 0)
+        self.sampled = dict.fromkeys(self.intervals, 0)
+
+    def keep(self, event: str) -> bool:
+        """
+        Counts a record of the event type.
+        :return: True if the record must be logged.
+        """
+        interval = self.intervals.get(event)
+        if interval is None:
+            return True
+        seen = self._seen[event]
+        self._seen[event] = seen + 1
+        if interval and seen % interval == 0:
+            return True
+        self.sampled[event] += 1
+        return False
+
+    def report(self) -> str:
+        """Returns the number of records skipped, per event type."""
+        return ", ".join(f"{event}: {count}" for event, count in self.sampled.items()) or "none"
+
+
+if __name__ == "__main__":
+    # executes test codes.
+    assert parse_rates(" received=0.01, success=1,prediction=0 ") == {"received": 100, "success": 1, "prediction": 0}
+    for invalid in ("received", "received=2"):
+        try:
+            parse_rates(invalid)
+            raise AssertionError(invalid)
+        except ValueError:
+            pass
+
+    sampler = EventSampler("received=0.25,prediction=0,success=1")
+    assert [sampler.keep("received") for _ in range(8)] == [True, False, False, False] * 2
+    assert not any(sampler.keep("prediction") for _ in range(3))
+    assert all(sampler.keep(event) for event in ("success", "other"))
+    assert sampler.report() == "received: 6, prediction: 3"
+    print("ok")
@@ -3,148 +3,597 @@ main consumer code.
 """
 import math
 import time
-from typing import List
-import pandas as pd
+
+# start of the imports, the first phase of the startup report
+IMPORT_START = time.perf_counter()
+
+from typing import TYPE_CHECKING, List, Optional
 import numpy as np
 import os
 
-from aiokafka import AIOKafkaConsumer
-from aiokafka.helpers import create_ssl_context
-
+from cache.expiry import IdleExpiry
 from cache.table import Cache, get_context_cache
-from configurations import InferenceConfigurations, KafkaConfigurations
-from db.database import get_context_db
-from db.models import EndRecord
+from configurations import DBConfigurations, InferenceConfigurations, KafkaConfigurations
+from db.database import create_local_tables
+from db.writer import EndRecordWriter, get_context_writer
+from feature.batch import FeatureBatch
+from feature.extractor import FeatureExtractor
+from feature.incremental import IncrementalFeatureExtractor
 from logger.ConsumerLogger import ConsumerLogger
+from logger.sampling import EventSampler
+from metrics import exporter as metrics
+from metrics.startup import StartupPhases
+from model.adaptation import BackgroundAdapter
+from model.predictor import batch_adapt_and_predict, batch_predict
+from model.registry import ModelRegistry
+from pipeline.stages import Pipeline, Stage, fetch
 from schema.chest import DeviceSensorValue, SensorValue
-from serde.deserializer import KafkaDeserializer
+from serde.decoder import FastAvroDeserializer
+from window.reorder import DuplicateFilter, ReorderBuffer
+from window.ring_buffer import MODALITIES, SensorWindow
+from window.validation import SegmentValidator
+from worker.pool import WorkerPool
 import signal
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
+if TYPE_CHECKING:
+    # imported on use: pandas by the reference feature extraction only, aiokafka by create_consumer
+    import pandas as pd
+    from aiokafka import AIOKafkaConsumer
+    from rebalance.handoff import StateHandoff
+
 logger = ConsumerLogger() # Initialize logger
 
-# Initialize Kafka deserializer for incoming messages
-deserializer = KafkaDeserializer(
-    topic=KafkaConfigurations.topic
+# Startup time by phase, see metrics/startup.py
+startup = StartupPhases(IMPORT_START)
+startup.mark("imports")
+
+LOCAL_BROKER_HOST = "memory://" # KAFKA_HOST of the in-process broker
+
+# Sampling of the per-message INFO logs (LOG_SAMPLE_RATES), see logger/sampling.py
+log_sampler = EventSampler()
+
+# Initialize Kafka deserializer for incoming messages, decoding sensor values into NumPy arrays
+deserializer = FastAvroDeserializer(
+    topic=KafkaConfigurations.topic,
+    schema_path=KafkaConfigurations.schema_path or None
 )
 
+# Vectorized feature extraction into a preallocated feature vector
+if InferenceConfigurations.feature_mode == "incremental":
+    # merges cached per-block aggregates, so each window only summarizes its new samples
+    feature_extractor = IncrementalFeatureExtractor(InferenceConfigurations.window_size, InferenceConfigurations.overlap_size)
+else:
+    feature_extractor = FeatureExtractor(InferenceConfigurations.window_size)
+
+# Redelivered segments (by connection_id) and out-of-order segments of a user, see window/reorder.py
+duplicates = DuplicateFilter()
+reorder_buffer = ReorderBuffer()
+
+# NaN screening of the incoming segments (NAN_POLICY), see window/validation.py
+validator = SegmentValidator()
+
+# Feature matrix of the windows predicted together (one message, or one micro-batch)
+feature_batch = FeatureBatch(InferenceConfigurations.batch_size)
+
+# Per-user models on top of the shared checkpoint, created on the first window of each user
+models = ModelRegistry()
+
+# Adaptation of the models off the prediction path (ADAPTATION_MODE=async), see model/adaptation.py
+adapter = BackgroundAdapter() if InferenceConfigurations.adaptation_mode == "async" else None
+
+# Last message timestamp of each user, to free the state of idle users
+user_expiry = IdleExpiry()
+
 # Thread pool executor for parallel execution
 thread_pool = ThreadPoolExecutor(max_workers=5)
 
-async def process_data(sensor_data: SensorValue, cache: Cache, db):
+# Handoff of the user state on rebalances, set by main() (REBALANCE_PREFETCH_USERS), see rebalance/handoff.py
+handoff: Optional["StateHandoff"] = None
+
+startup.mark("init")
+
+def deserialize(value: bytes) -> SensorValue:
+    """
+    Deserializes the value of a Kafka message, timing it for the metrics.
+    """
+    with metrics.DESERIALIZE_SECONDS.time():
+        return deserializer.deserialize(value)
+
+def update_window(sensor_data: SensorValue, cache: Cache, batch: FeatureBatch) -> None:
+    """
+    Appends a segment to the window of its user,
+    and extracts the features of every window that became ready into the batch.
+    Redelivered segments are dropped, and the segments of a user are appended in timestamp order.
+
+    Args:
+        sensor_data (SensorValue): Deserialized sensor data from Kafka.
+        cache (Cache): In-memory storage for sensor data.
+        batch (FeatureBatch): Feature matrix of the windows waiting for prediction.
+    """
+    # Drop redelivered segments before any window work
+    if duplicates.seen(sensor_data['connection_id']):
+        return
+    for segment in reorder_buffer.push(sensor_data):
+        append_segment(segment, cache, batch)
+
+    # Free the window and model of the users idle for USER_TTL_MS
+    user_expiry.touch(sensor_data['user_id'], sensor_data['timestamp'])
+    for expired_user in user_expiry.sweep():
+        expire_user(expired_user, cache)
+
+def append_segment(sensor_data: SensorValue, cache: Cache, batch: FeatureBatch) -> None:
+    """
+    Appends a segment, released in order, to the window of its user,
+    and extracts the features of every window that became ready into the batch.
+    """
+    user_id = sensor_data['user_id']
+    # The window is modified in place: it is not written back by the cache meanwhile
+    with cache.updating():
+        with metrics.WINDOW_UPDATE_SECONDS.time():
+            # Initialize user cache if not already present
+            window = cache.get(user_id)
+            if window is None:
+                window = SensorWindow(InferenceConfigurations.window_size)
+
+            # Check for missing values in sensor data, dropping or repairing the segment
+            if validator.validate(sensor_data):
+                window = extend_data(window, sensor_data["value"])
+
+        while is_valid_length(window, InferenceConfigurations.window_size):
+            # feature extraction, straight into the next row of the batch
+            with metrics.FEATURE_EXTRACTION_SECONDS.time():
+                feature_extractor.extract(window, out=batch.next_row(user_id))
+
+            # Remove oldest data from cache if overlap condition is met
+            if is_valid_length(window, InferenceConfigurations.overlap_size):
+                window = remove_overlap(window)
+
+        cache[user_id] = window
+
+def expire_user(user_id: str, cache: Cache) -> None:
+    """
+    Frees the state of an idle user: its held segments, its window (hot tier and store entries) and its model.
+    """
+    reorder_buffer.pop(user_id)
+    models.pop(user_id)
+    if handoff is not None:
+        handoff.forget(user_id)
+    try:
+        del cache[user_id]
+    except KeyError:
+        pass
+
+def release_user(user_id: str) -> None:
+    """
+    Frees the in-memory state of a user whose partition moved to another consumer: its held segments and its expiry.
+    Its window and model are handed over through the store, and are not freed (see rebalance/handoff.py).
+    """
+    reorder_buffer.pop(user_id)
+    user_expiry.forget(user_id)
+
+def predict_batch(batch: FeatureBatch) -> None:
+    """
+    Runs a single predict call for every window in the batch,
+    then logs the prediction of each window for its user.
+    """
+    if len(batch) == 0:
+        return
+
+    with metrics.INFERENCE_SECONDS.time():
+        # load models
+        user_models = [models.get(user_id) for user_id in batch.user_ids]
+
+        # inference
+        if adapter is None:
+            results = batch_adapt_and_predict(user_models, batch.rows)
+        else:
+            # predicts with the current priors, and queues the adaptation for the background thread
+            results = batch_predict(user_models, batch.rows)
+            adapter.submit(user_models, [proba for _, proba in results])
+    for user_id, (pred, xai) in zip(batch.user_ids, results):
+        if log_sampler.keep("prediction"):
+            logger.info("Prediction for user, %s is: %s", user_id, bool(pred))
+    batch.clear()
+    if handoff is not None:
+        handoff.predicted()
+
+def stage_times(kafka_timestamp: Optional[int], dequeue_time: int, worker_id: Optional[int] = None) -> dict:
+    """
+    Returns the stage timestamps of a message, completed as it goes through the stages (see EndRecord in db/models.py).
+
+    Args:
+        kafka_timestamp (int): Timestamp of the Kafka record.
+        dequeue_time (int): Time the message was taken for processing, after any queue of the consumer.
+        worker_id (int): Worker process processing the message, None in the consumer process.
+    """
+    return {
+        "kafka_timestamp": kafka_timestamp,
+        "dequeue_time": dequeue_time,
+        "feature_time": None,
+        "prediction_time": None,
+        "batch_size": None,
+        "worker_id": worker_id,
+    }
+
+def record_prediction(received: List[tuple], batch_size: int) -> None:
+    """
+    Completes the stage timestamps of the messages (sensor_data, start_time, stages) whose windows were just predicted.
+    """
+    prediction_time = int(time.time() * 1000)
+    for _, _, stages in received:
+        stages["prediction_time"] = prediction_time
+        stages["batch_size"] = batch_size
+
+def log_end_record(sensor_data: SensorValue, start_time: int, writer: EndRecordWriter, stages: Optional[dict] = None) -> None:
+    """
+    Logs the latency of a message and queues its timestamps for the database.
+    With END_RECORD_STAGE_TIMES=true, the row also holds the stage timestamps of the message (see stage_times).
+    """
+    if log_sampler.keep("success"):
+        logger.info("[Success]: user_id: %s, created_at: %s, latency: %s",
+                    sensor_data['user_id'], sensor_data['timestamp'], start_time - sensor_data['timestamp'])
+
+    # log timestamp to database, written in bulk by the writer thread
+    row = {
+        "connection_id": sensor_data['connection_id'],
+        "timestamp": start_time,
+        "inference_time": int(time.time() * 1000),
+    }
+    if stages is not None and DBConfigurations.end_record_stage_times:
+        row.update(stages)
+    writer.add(row)
+
+async def process_data(sensor_data: SensorValue, cache: Cache, writer: EndRecordWriter, kafka_timestamp: Optional[int] = None):
     """
     Process each sensor message from Kafka.
 
     Args:
         sensor_data (SensorValue): Deserialized sensor data from Kafka.
         cache (Cache): In-memory storage for sensor data.
-        db: SQLAlchemy session object for storing timestamps.
+        writer (EndRecordWriter): Batched writer storing timestamps in the database.
+        kafka_timestamp (int): Timestamp of the Kafka record.
 
-    - Extracts features from sensor data.
-    - Stores processed data in a global Pandas dataframe.
+    - Keeps the window of each user in NumPy ring buffers.
+    - Extracts features from sensor data and runs inference.
     - Logs latency and saves the timestamp in the database.
     """
 
     # Record the start time for inference (benchmarking)
     start_time = int(time.time() * 1000)
-    user_id = sensor_data['user_id']
-    # Initialize user cache if not already present
-    if cache.get(user_id) is None:
-        cache[user_id] = {}
-
-    # Check for missing values in sensor data
-    has_missing_value = sanity_check_no_missing(sensor_data)
-    if not has_missing_value:
-        cache[user_id] = extend_data(cache[user_id], sensor_data["value"])
-
-    while is_valid_length(cache[user_id], InferenceConfigurations.window_size):
-        # feature extraction
-        new_feat = feature_extract_sensor(user_id, sensor_data["timestamp"], cache[user_id])
-
-        # load model & inference
-        model = models[user_id]
-        if model is None:
-            model = model_load()
-            models[user_id] = model
-        pred, xai = model_adapt_and_predict(model, sensor_features=new_feat[new_feat.columns.difference(['user_id', 'timestamp'])])
-        logger.info("Prediction for user, %s is: %s", user_id, bool(pred))
-
-        # Remove oldest data from cache if overlap condition is met
-        if is_valid_length(cache[user_id], InferenceConfigurations.overlap_size):
-            window = cache[user_id]
-            cache[user_id] = remove_overlap(window)
-
-    logger.info(f"[Success]: user_id: {user_id}, created_at: {sensor_data['timestamp']}, latency: {start_time - sensor_data['timestamp']}")
-
-    # log timestamp to database
-    end_record = EndRecord(
-        connection_id=sensor_data['connection_id'],
-        timestamp=start_time,
-        inference_time=int(time.time() * 1000),
-    )
-    db.add(end_record)
+    stages = stage_times(kafka_timestamp, start_time)
+    update_window(sensor_data, cache, feature_batch)
+    stages["feature_time"] = int(time.time() * 1000)
+    received = [(sensor_data, start_time, stages)]
+    batch_size = len(feature_batch)
+    predict_batch(feature_batch)
+    record_prediction(received, batch_size)
+    log_end_record(sensor_data, start_time, writer, stages)
+
+async def process_batches(consumer: "AIOKafkaConsumer", cache: Cache, writer: EndRecordWriter):
+    """
+    Micro-batching mode: gathers the windows that became ready across users,
+    and predicts them with a single call.
+
+    - Polls with getmany() until BATCH_SIZE windows are ready,
+      or BATCH_MAX_WAIT_MS elapsed since the first message of the batch.
+    - Fans the predictions back to per-user logging and EndRecord rows.
+    """
+    loop = asyncio.get_running_loop()
+    batch_size = InferenceConfigurations.batch_size
+    max_wait = InferenceConfigurations.batch_max_wait_ms / 1000
+
+    while True:
+        received = []
+        deadline = None
+        while len(feature_batch) < batch_size:
+            # Long poll until the first message arrives, then poll only until the deadline
+            timeout_ms = 1000 if deadline is None else max(int((deadline - loop.time()) * 1000), 0)
+            records = await consumer.getmany(timeout_ms=timeout_ms, max_records=batch_size - len(feature_batch))
+            for msg in (msg for messages in records.values() for msg in messages):
+                # Record the start time for inference (benchmarking)
+                start_time = int(time.time() * 1000)
+                if log_sampler.keep("received"):
+                    logger.info("Received message: topic: %s, partition: %s, offset: %s, key: %s", msg.topic, msg.partition, msg.offset, msg.key)
+                stages = stage_times(msg.timestamp, start_time)
+                if handoff is not None:
+                    handoff.seen(msg.partition, msg.value['user_id'])
+                update_window(msg.value, cache, feature_batch)
+                stages["feature_time"] = int(time.time() * 1000)
+                received.append((msg.value, start_time, stages))
+            if deadline is None and received:
+                deadline = loop.time() + max_wait
+            if deadline is not None and loop.time() >= deadline:
+                break
+
+        batch_size = len(feature_batch)
+        predict_batch(feature_batch)
+        record_prediction(received, batch_size)
+        for sensor_data, start_time, stages in received:
+            log_end_record(sensor_data, start_time, writer, stages)
+
+async def process_parallel(consumer: "AIOKafkaConsumer", pool: WorkerPool):
+    """
+    Multi-process mode: the fetch loop only polls Kafka,
+    and hands the raw messages to the worker owning their user (see worker/pool.py).
+    """
+    while True:
+        records = await consumer.getmany(timeout_ms=1000)
+        messages = [msg for messages in records.values() for msg in messages]
+        if messages:
+            await pool.dispatch(messages, {tp: messages[-1].offset + 1 for tp, messages in records.items() if messages})
+        await commit_acknowledged(consumer, pool)
+
+async def commit_acknowledged(consumer: "AIOKafkaConsumer", pool: WorkerPool):
+    """
+    Commits the offsets of the polls processed by the workers (auto-commit is disabled with workers).
+    Offsets of the partitions revoked meanwhile are not committed: their messages are redelivered to the new owner.
+    """
+    from aiokafka.errors import KafkaError
+
+    assignment = consumer.assignment()
+    offsets = {tp: offset for tp, offset in pool.acknowledged().items() if tp in assignment}
+    if not offsets:
+        return
+    try:
+        await consumer.commit(offsets)
+    except KafkaError as e:
+        logger.warning("Failed to commit the offsets of %d partitions: %s", len(offsets), e)
+
+def build_pipeline(cache: Cache, writer: EndRecordWriter) -> Pipeline:
+    """
+    Staged mode: each poll of Kafka goes through
+
+    - decode (executor): deserializes the raw messages.
+    - window (executor): updates the windows and extracts the features of the windows that became ready.
+    - inference (executor): predicts every window of the poll with a single call.
+    - log (event loop): queues the EndRecord rows.
+
+    Only one poll is in each stage at a time, so windows and models of a user are updated in order.
+    """
+    def decode(item):
+        start_time, messages = item
+        dequeue_time = int(time.time() * 1000)
+        received = []
+        for msg in messages:
+            if log_sampler.keep("received"):
+                logger.info("Received message: topic: %s, partition: %s, offset: %s, key: %s", msg.topic, msg.partition, msg.offset, msg.key)
+            sensor_data = deserialize(msg.value)
+            if handoff is not None:
+                handoff.seen(msg.partition, sensor_data['user_id'])
+            received.append((sensor_data, start_time, stage_times(msg.timestamp, dequeue_time)))
+        return received
+
+    def window(received):
+        batch = FeatureBatch(len(received))
+        for sensor_data, _, stages in received:
+            update_window(sensor_data, cache, batch)
+            stages["feature_time"] = int(time.time() * 1000)
+        return received, batch
+
+    def inference(item):
+        received, batch = item
+        batch_size = len(batch)
+        predict_batch(batch)
+        record_prediction(received, batch_size)
+        return received
+
+    def log(received):
+        for sensor_data, start_time, stages in received:
+            log_end_record(sensor_data, start_time, writer, stages)
+
+    queue_size = InferenceConfigurations.pipeline_queue_size
+    return Pipeline([
+        Stage("decode", decode, queue_size, thread_pool),
+        Stage("window", window, queue_size, thread_pool),
+        Stage("inference", inference, queue_size, thread_pool),
+        Stage("log", log, queue_size),
+    ])
+
+async def process_pipeline(consumer: "AIOKafkaConsumer", pipeline: Pipeline):
+    """
+    Runs the stages of the pipeline, fed by the fetch loop (see pipeline/stages.py),
+    and logs the queue depth and service time of each stage periodically.
+    """
+    for stage in pipeline.stages:
+        metrics.watch_queue(f"pipeline_{stage.name}", lambda stage=stage: stage.depth)
+    reports = asyncio.ensure_future(pipeline.log_reports(InferenceConfigurations.pipeline_report_interval_ms))
+    tasks = [asyncio.ensure_future(fetch(consumer, pipeline)), asyncio.ensure_future(pipeline.run())]
+    try:
+        # a failed stage stops the fetch loop as well, and the other way round
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        reports.cancel()
+        logger.info("Pipeline: %s, pauses: %d", pipeline.report(), pipeline.pauses)
+
+async def drain(pipeline: Optional[Pipeline]) -> None:
+    """
+    Waits until the polled messages are processed and their models adapted,
+    before the partitions are revoked (see rebalance/handoff.py).
+    In micro-batching mode, the windows of the current batch are predicted after the revocation.
+    """
+    if pipeline is not None:
+        await pipeline.join()
+    if adapter is not None:
+        await asyncio.get_running_loop().run_in_executor(thread_pool, adapter.flush)
+
+async def flush_writer():
+    """
+    Waits, off the event loop and for at most END_RECORD_SHUTDOWN_TIMEOUT_MS, until the queued EndRecord rows are written.
+    """
+    timeout = DBConfigurations.end_record_shutdown_timeout_ms / 1000
+    if not await asyncio.get_running_loop().run_in_executor(thread_pool, writer.flush, timeout):
+        logger.warning("EndRecord rows still queued after %.0f s (%d rows), they are written on exit",
+                       timeout, writer.queue_depth)
 
 async def on_signal_exit(loop, consumer):
     """
     Gracefully handles consumer termination.
 
+    - Hands the state of the users over to the next owner of the partitions.
     - Stops Kafka consumer.
-    - Commits remaining processed data to the database.
+    - Flushes the remaining timestamps to the database.
     - Logs final extracted features.
     """
+    if handoff is not None:
+        await handoff.on_partitions_revoked(consumer.assignment())
     await consumer.stop()
 
-    db.commit()
-    logger.info("Wrote timestamps into DB, ready to shutdown")
+    await flush_writer()
+    logger.info("Wrote timestamps into DB (%d written, %d spilled), ready to shutdown", writer.written_rows, writer.spilled_rows)
 
     loop.stop()
 
-async def main():
+def create_consumer(listener: Optional["StateHandoff"] = None):
     """
-    Main function to start Kafka consumer.
+    Creates the Kafka consumer of the topic,
+    or the in-process broker fed by the simulator for the local profile (KAFKA_HOST=memory://, see broker/local.py).
 
-    - Connects to Kafka and listens for messages.
-    - Deserializes incoming messages and processes sensor data.
-    - Stores inference timestamps in the database before termination.
+    Args:
+        listener (StateHandoff): rebalance listener of the subscription, if any.
     """
+    # workers and the pipeline deserialize off the event loop
+    value_deserializer = None if InferenceConfigurations.workers > 0 or InferenceConfigurations.pipeline_queue_size > 0 else deserialize
+    if KafkaConfigurations.kafka_host == LOCAL_BROKER_HOST:
+        from broker.local import LocalBroker
+        consumer = LocalBroker(
+            KafkaConfigurations.topic,
+            partitions=KafkaConfigurations.partitions,
+            value_deserializer=value_deserializer,
+            max_poll_records=100,
+            port=KafkaConfigurations.local_broker_port,
+            schema_path=KafkaConfigurations.schema_path or None,
+        )
+        consumer.subscribe([KafkaConfigurations.topic], listener=listener)
+        return consumer
+
+    from aiokafka import AIOKafkaConsumer
+    from aiokafka.helpers import create_ssl_context
+
+    if KafkaConfigurations.security_protocol == "SASL_SSL":
+        security = {
+            "ssl_context": create_ssl_context(),
+            "security_protocol": "SASL_SSL",
+            "sasl_mechanism": "SCRAM-SHA-512",
+            "sasl_plain_username": KafkaConfigurations.sasl_user,
+            "sasl_plain_password": KafkaConfigurations.sasl_password,
+        }
+    else:
+        security = {"security_protocol": KafkaConfigurations.security_protocol}
     consumer = AIOKafkaConsumer(
-        KafkaConfigurations.topic,
         bootstrap_servers=KafkaConfigurations.kafka_host,
-        ssl_context=create_ssl_context(),
-        security_protocol="SASL_SSL",
-        sasl_mechanism="SCRAM-SHA-512",
-        sasl_plain_username=KafkaConfigurations.sasl_user,
-        sasl_plain_password=KafkaConfigurations.sasl_password,
+        **security,
         group_id=KafkaConfigurations.consumer_group_id,
         auto_offset_reset="earliest", # Start from the beginning if no offset is found 
-        value_deserializer=deserializer.deserialize,
+        value_deserializer=value_deserializer,
         check_crcs=False,
         max_partition_fetch_bytes=KafkaConfigurations.consumer_max_fetch_size,
-        max_poll_records=100
+        max_poll_records=100,
+        # with workers, offsets are committed once the workers processed the messages (see worker/pool.py)
+        enable_auto_commit=InferenceConfigurations.workers == 0,
     )
+    consumer.subscribe([KafkaConfigurations.topic], listener=listener)
+    return consumer
+
+async def main():
+    """
+    Main function to start Kafka consumer.
+
+    - Loads and warms up the model, then connects to Kafka and listens for messages.
+    - Deserializes incoming messages and processes sensor data.
+    - Stores inference timestamps in the database before termination.
+    """
+    global handoff
+    pipeline = None
+    if InferenceConfigurations.workers == 0 and InferenceConfigurations.pipeline_queue_size > 0:
+        pipeline = build_pipeline(cache, writer)
+    # Hand the state of the users over on rebalances, through a store shared by the consumers of the group:
+    # not with the in-memory store (released windows would stay in it), nor with workers, which own the state of their users.
+    if (InferenceConfigurations.rebalance_prefetch_users > 0 and InferenceConfigurations.workers == 0
+            and not InferenceConfigurations.store_host.startswith("memory://")):
+        from rebalance.handoff import StateHandoff
+        handoff = StateHandoff(cache, models, release_user, drain=lambda: drain(pipeline), executor=thread_pool)
+    consumer = create_consumer(handoff)
 
     # Register termination signal handler
     loop.add_signal_handler(signal.SIGTERM, lambda l, c: l.create_task(on_signal_exit(l, c)), loop, consumer)
 
+    # Load the checkpoint and run a dummy predict before joining the consumer group,
+    # so the first windows after startup or a rebalance do not pay for them.
+    # Workers load their own models: they are started here, and warm up while the consumer joins.
+    pool = None
+    if InferenceConfigurations.workers > 0:
+        pool = WorkerPool()
+        logger.info("Started %d worker processes", pool.workers)
+    else:
+        models.warm_up()
+    startup.mark("model")
+
     # Start Kafka consumer
     await consumer.start()
     logger.info("Kafka consumer started!")
+    startup.mark("consumer")
+    logger.info("Startup: %s", startup.report())
+
+    # Prometheus metrics: sizes are read on each scrape, the lag is refreshed periodically
+    if metrics.start_server():
+        metrics.ACTIVE_USERS.set_function(lambda: user_expiry.active_users)
+        metrics.CACHE_WINDOWS.set_function(lambda: cache.hot_size)
+        metrics.MODEL_USERS.set_function(lambda: len(models))
+        metrics.watch_queue("end_record", lambda: writer.queue_depth)
+        metrics.watch_logging(lambda: log_sampler.sampled, ConsumerLogger.dropped)
+        if adapter is not None:
+            metrics.watch_queue("adaptation", lambda: adapter.queue_depth)
+    lag = asyncio.ensure_future(metrics.update_lag(consumer))
 
     try:
-        async for msg in consumer:
-            logger.info(f"Received message: topic: {msg.topic}, partition: {msg.partition}, offset: {msg.offset}, key: {msg.key}")
-            data: SensorValue = msg.value
-            await process_data(data, cache, db)
+        if pool is not None:
+            await process_parallel(consumer, pool)
+        elif pipeline is not None:
+            await process_pipeline(consumer, pipeline)
+        elif InferenceConfigurations.batch_size > 1:
+            await process_batches(consumer, cache, writer)
+        else:
+            async for msg in consumer:
+                if log_sampler.keep("received"):
+                    logger.info("Received message: topic: %s, partition: %s, offset: %s, key: %s", msg.topic, msg.partition, msg.offset, msg.key)
+                data: SensorValue = msg.value
+                if handoff is not None:
+                    handoff.seen(msg.partition, data['user_id'])
+                await process_data(data, cache, writer, msg.timestamp)
 
     finally:
+        lag.cancel()
+        if handoff is not None:
+            await handoff.on_partitions_revoked(consumer.assignment())
+        if pool is not None:
+            # blocking: off the event loop, which keeps the consumer in the group
+            await asyncio.get_running_loop().run_in_executor(thread_pool, pool.close)
+            await commit_acknowledged(consumer, pool)
         await consumer.stop()
-        db.commit()
-        logger.info("Wrote timestamps into DB, ready to shutdown")
+        await flush_writer()
+        if adapter is not None:
+            adapter.close()
+            logger.info("Adaptation: %s", adapter.report())
+        logger.info("Models: %s, %s", models.report(), user_expiry.report())
+        logger.info("Ordering: duplicates: %d, %s", duplicates.duplicates, reorder_buffer.report())
+        logger.info("Validation: %s", validator.report())
+        if handoff is not None:
+            logger.info("Rebalance: %s", handoff.report())
+        logger.info("Logging: sampled out: %s, dropped: %d", log_sampler.report(), ConsumerLogger.dropped())
+        logger.info("Wrote timestamps into DB (%d written, %d spilled), ready to shutdown", writer.written_rows, writer.spilled_rows)
 
 
 def sanity_check_no_missing(record: SensorValue):
-    """Checks for missing values in sensor data."""
+    """
+    Reference check for missing values in sensor data.
+    update_window uses validator (window/validation.py), which screens every modality with np.isnan.
+    """
     sensor_value = record["value"]
     segment_size = record["segment_size"]
     columns = vars(DeviceSensorValue).get("__annotations__").keys()
@@ -155,16 +604,21 @@ def sanity_check_no_missing(record: SensorValue):
         sampling_rate: int = sensor_value[col]["hz"]
         num_idx: int = (int) (sampling_rate * segment_size / 1000)
         sanity_check_list = []
-        if col in ["chest_acc", "wrist_acc"]:
-            for i in range(num_idx):
-                x = value_list[i]["x"]
-                y = value_list[i]["y"]
-                z = value_list[i]["z"]
-                sanity_check_list += [x, y, z]
+        if isinstance(value_list, np.ndarray):
+            # decoded by FastAvroDeserializer
+            has_nan = np.isnan(value_list[:num_idx]).any()
         else:
-            sanity_check_list = value_list
-
-        if any(math.isnan(a) for a in sanity_check_list):
+            if col in ["chest_acc", "wrist_acc"]:
+                for i in range(num_idx):
+                    x = value_list[i]["x"]
+                    y = value_list[i]["y"]
+                    z = value_list[i]["z"]
+                    sanity_check_list += [x, y, z]
+            else:
+                sanity_check_list = value_list
+            has_nan = any(math.isnan(a) for a in sanity_check_list)
+
+        if has_nan:
             print(f'modality : {col} has NAN value, so pass')
             return True
     return False
@@ -183,75 +637,67 @@ def sanity_check_in_order(record_list: List[SensorValue]):
     else:
         return 0
 
-def extend_data(sensor_data, new_data: DeviceSensorValue) -> DeviceSensorValue:
+def extend_data(sensor_data: SensorWindow, new_data: DeviceSensorValue) -> SensorWindow:
     """
     Extend the window with new data.
-    :param sensor_data: a list of sensor data.
-    :param new_data: a list of new sensor data.
-    :return: a list of sensor data extended with new data.
+    :param sensor_data: the window of a user.
+    :param new_data: new sensor data.
+    :return: the window extended with new data.
     """
-    if not sensor_data:
+    if sensor_data is None:
         # The cache is empty
-        return new_data
-    data: DeviceSensorValue = sensor_data
-    columns = vars(DeviceSensorValue).get("__annotations__").keys()
-    for col in columns:
-        if col in ['label', 'domain']:
-            continue
-        data[col]["value"].extend(new_data[col]["value"])
-    return data
+        sensor_data = SensorWindow(InferenceConfigurations.window_size)
+    sensor_data.extend(new_data)
+    return sensor_data
     
-def remove_overlap(sensor_data: DeviceSensorValue) -> DeviceSensorValue:
+def remove_overlap(sensor_data: SensorWindow) -> SensorWindow:
     """
     Remove the overlap data from the window.
-    :param sensor_data: a list of sensor data.
-    :param overlap_size: the size of the overlap.
-    :return: a list of sensor data without overlap.
+    The ring buffers only move their head, no data is copied.
+    :param sensor_data: the window of a user.
+    :return: the window without overlap.
     """
-    columns = vars(DeviceSensorValue).get("__annotations__").keys()
-    for col in columns:
-        if col in ['label', 'domain']:
-            continue
-        sampling_rate = sensor_data[col]["hz"]
-        sensor_data[col]["value"] = sensor_data[col]["value"][InferenceConfigurations.overlap_size * sampling_rate:]
+    for col in MODALITIES:
+        sampling_rate = sensor_data.hz[col]
+        sensor_data[col].advance(InferenceConfigurations.overlap_size * sampling_rate)
     return sensor_data
     
-def is_valid_length(sensor_data: DeviceSensorValue, length) -> bool:
+def is_valid_length(sensor_data: SensorWindow, length) -> bool:
     """
     Check if the window has enough data to be used for inference.
     :return: True if the window has enough data, False otherwise.
     """
-    columns = vars(DeviceSensorValue).get("__annotations__").keys()
-    for col in columns:
-        if col in ['label', 'domain']:
-            continue
-        sampling_rate = sensor_data[col]["hz"]
-        if len(sensor_data[col]["value"]) < length * sampling_rate:
+    for col in MODALITIES:
+        if col not in sensor_data:
+            return False
+        sampling_rate = sensor_data.hz[col]
+        if sensor_data.length(col) < length * sampling_rate:
             return False
     return True
 
-def feature_extract_sensor(user_id: str, timestamp: int, sensor_data: DeviceSensorValue) -> pd.DataFrame:
+def feature_extract_sensor(user_id: str, timestamp: int, sensor_data: SensorWindow) -> "pd.DataFrame":
+    """
+    Reference feature extraction, building a one-row DataFrame.
+    process_data uses feature_extractor (feature/extractor.py), which produces the same values.
+    """
+    import pandas as pd
+
     feature_dict = {
         "user_id": user_id,
         "timestamp": timestamp
     }
 
-    columns = vars(DeviceSensorValue).get("__annotations__").keys()
-    for col in columns:
-        if col in ['label', 'domain']:
-            continue
+    for col in MODALITIES:
         values = []
-        sampling_rate = sensor_data[col]["hz"]
+        sampling_rate = sensor_data.hz[col]
         window_length = InferenceConfigurations.window_size * sampling_rate
         if col in ["chest_acc", "wrist_acc"]:  # l2-norm of X, Y, Z axis
-            acc_list = sensor_data[col]["value"]
+            acc_list = sensor_data[col].view(window_length).tolist()
             for acc_i in range(window_length):
-                acc_x = acc_list[acc_i]["x"]
-                acc_y = acc_list[acc_i]["y"]
-                acc_z = acc_list[acc_i]["z"]
+                acc_x, acc_y, acc_z = acc_list[acc_i]
                 values.append(np.sqrt(np.power(acc_x, 2) + np.power(acc_y, 2) + np.power(acc_z, 2)))
         else:
-            values.extend(sensor_data[col]["value"][:window_length])
+            values.extend(sensor_data[col].view(window_length))
 
         feature_dict[f"{col}_mean"] = np.mean(values)
         feature_dict[f'{col}_std'] = np.std(values)
@@ -265,7 +711,9 @@ def feature_extract_sensor(user_id: str, timestamp: int, sensor_data: DeviceSens
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
     asyncio.set_event_loop(loop)
-    with get_context_cache() as cache, get_context_db() as db:
+    create_local_tables()
+    with get_context_cache() as cache, get_context_writer() as writer:
         logger.info("DB connected!")
+        startup.mark("db")
         logger.info(KafkaConfigurations())
         loop.run_until_complete(main())
\ No newline at end of file
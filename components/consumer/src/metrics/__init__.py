@@ -0,0 +1,6 @@
+"""
+Observability of the consumer.
+
+- exporter.py: Prometheus metrics (stage durations, consumer lag, users, cache and queue sizes, skipped log records), served on /metrics.
+- startup.py: startup time of the consumer, broken down by phase (imports, model load and warm-up, ...).
+"""
@@ -0,0 +1,160 @@
+"""
+Prometheus metrics of the consumer, served on http://<host>:METRICS_PORT/metrics.
+
+The label children observed on the hot path are bound once, at import:
+timing a stage is one histogram observation, with no label lookup or string formatting per message.
+Sizes (users, cache, queues) are read by callbacks when Prometheus scrapes, so they cost nothing in between,
+and the consumer lag is refreshed by a background task every METRICS_LAG_INTERVAL_MS.
+The log records skipped by sampling, or dropped by a full queue, are collected the same way from their counters.
+"""
+import asyncio
+from typing import Callable, Dict
+
+from prometheus_client import REGISTRY, Gauge, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily
+
+from configurations import InferenceConfigurations
+from logger.ConsumerLogger import ConsumerLogger
+
+logger = ConsumerLogger()
+
+# From 100 us: window updates and compiled predictions take well under a millisecond.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+STAGE_SECONDS = Histogram("consumer_stage_seconds", "Time spent in each processing stage", ["stage"],
+                          buckets=LATENCY_BUCKETS)
+DESERIALIZE_SECONDS = STAGE_SECONDS.labels("deserialize") # per message
+WINDOW_UPDATE_SECONDS = STAGE_SECONDS.labels("window_update") # per segment, feature extraction excluded
+FEATURE_EXTRACTION_SECONDS = STAGE_SECONDS.labels("feature_extraction") # per window
+INFERENCE_SECONDS = STAGE_SECONDS.labels("inference") # per predicted batch
+DB_FLUSH_SECONDS = STAGE_SECONDS.labels("db_flush") # per bulk insert of EndRecord rows
+
+CONSUMER_LAG = Gauge("consumer_lag", "Messages between the fetch position and the high watermark",
+                     ["topic", "partition"])
+ACTIVE_USERS = Gauge("consumer_active_users", "Users seen within USER_TTL_MS")
+CACHE_WINDOWS = Gauge("consumer_cache_windows", "User windows held in the hot tier of the cache")
+MODEL_USERS = Gauge("consumer_model_users", "Per-user models held by the model registry")
+QUEUE_DEPTH = Gauge("consumer_queue_depth", "Items waiting in each queue", ["queue"])
+STARTUP_SECONDS = Gauge("consumer_startup_seconds", "Duration of each startup phase", ["phase"]) # see startup.py
+REBALANCE_SECONDS = Gauge("consumer_rebalance_seconds", "Duration of each phase of the last rebalance",
+                          ["phase"]) # see rebalance/handoff.py
+
+
+def watch_queue(name: str, depth: Callable[[], int]) -> None:
+    """
+    Reports the depth of a queue on every scrape.
+    :param name: value of the "queue" label, e.g. "end_record" or a pipeline stage.
+    :param depth: returns the number of items waiting in the queue.
+    """
+    QUEUE_DEPTH.labels(name).set_function(depth)
+
+
+class LogRecordsCollector:
+    """
+    Collects the log records that were not written, per event type and reason ("sampled" or "dropped").
+    """
+    def __init__(self, sampled: Callable[[], Dict[str, int]], dropped: Callable[[], int]):
+        """
+        :param sampled: returns the records skipped by sampling, per event type.
+        :param dropped: returns the records dropped because the queue of the log listener was full.
+        """
+        self.sampled = sampled
+        self.dropped = dropped
+
+    def collect(self):
+        family = CounterMetricFamily("consumer_log_records_skipped", "Log records not written",
+                                     labels=["event", "reason"])
+        for event, count in self.sampled().items():
+            family.add_metric([event, "sampled"], count)
+        family.add_metric(["", "dropped"], self.dropped())
+        yield family
+
+
+def watch_logging(sampled: Callable[[], Dict[str, int]], dropped: Callable[[], int]) -> None:
+    """
+    Reports the log records skipped by sampling and dropped by the log queue on every scrape.
+    """
+    REGISTRY.register(LogRecordsCollector(sampled, dropped))
+
+
+async def update_lag(consumer, interval_ms: int = InferenceConfigurations.metrics_lag_interval_ms) -> None:
+    """
+    Refreshes the lag of every assigned partition, and drops the partitions no longer assigned.
+    :param consumer: started AIOKafkaConsumer.
+    """
+    from aiokafka.errors import IllegalStateError
+
+    children: Dict = {}
+    while True:
+        assignment = consumer.assignment()
+        for tp in list(children):
+            if tp not in assignment:
+                del children[tp]
+                CONSUMER_LAG.remove(tp.topic, str(tp.partition))
+        for tp in assignment:
+            highwater = consumer.highwater(tp)
+            if highwater is None:
+                continue # no fetch response yet
+            try:
+                position = await consumer.position(tp)
+            except IllegalStateError as e:
+                # revoked by a rebalance meanwhile
+                logger.info("Lag of %s not refreshed: %s", tp, e)
+                continue
+            child = children.get(tp)
+            if child is None:
+                child = children[tp] = CONSUMER_LAG.labels(tp.topic, str(tp.partition))
+            child.set(max(highwater - position, 0))
+        await asyncio.sleep(interval_ms / 1000)
+
+
+def start_server(port: int = InferenceConfigurations.metrics_port) -> bool:
+    """
+    Serves the metrics of this process in a background thread.
+    :param port: port of the HTTP server. 0 disables the endpoint.
+    :return: True if the server was started.
+    """
+    if port <= 0:
+        return False
+    start_http_server(port)
+    logger.info("Serving metrics on :%d/metrics", port)
+    return True
+
+
+if __name__ == "__main__":
+    # executes test codes.
+    from prometheus_client import generate_latest
+
+    with INFERENCE_SECONDS.time():
+        pass
+    watch_queue("test", lambda: 3)
+    watch_logging(lambda: {"received": 5}, lambda: 2)
+    assert REGISTRY.get_sample_value("consumer_stage_seconds_count", {"stage": "inference"}) == 1
+    assert REGISTRY.get_sample_value("consumer_queue_depth", {"queue": "test"}) == 3
+    assert REGISTRY.get_sample_value("consumer_log_records_skipped_total", {"event": "received", "reason": "sampled"}) == 5
+    assert REGISTRY.get_sample_value("consumer_log_records_skipped_total", {"event": "", "reason": "dropped"}) == 2
+    assert b'consumer_stage_seconds_bucket{le="0.0001",stage="deserialize"} 0.0' in generate_latest()
+
+    # a partition revoked while its lag is refreshed is skipped, the refresh goes on.
+    from aiokafka.errors import IllegalStateError
+    from aiokafka.structs import TopicPartition
+
+    class RevokingConsumer:
+        def assignment(self):
+            return {TopicPartition("chest", 0), TopicPartition("chest", 1)}
+        def highwater(self, tp):
+            return 10
+        async def position(self, tp):
+            if tp.partition == 0:
+                raise IllegalStateError(f"No current assignment for partition {tp}")
+            return 4
+
+    async def refresh_lag():
+        task = asyncio.ensure_future(update_lag(RevokingConsumer(), interval_ms=1))
+        await asyncio.sleep(0.01)
+        assert not task.done()
+        task.cancel()
+    asyncio.run(refresh_lag())
+    assert REGISTRY.get_sample_value("consumer_lag", {"topic": "chest", "partition": "1"}) == 6
+    assert REGISTRY.get_sample_value("consumer_lag", {"topic": "chest", "partition": "0"}) is None
+    print("ok")
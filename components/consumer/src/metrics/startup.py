@@ -0,0 +1,61 @@
+"""
+Startup time of the consumer, broken down by phase.
+
+Phases are measured back to back, from the start of the imports of main.py to the start of the Kafka consumer:
+imports, init (module-level state), db (store and database connections), model (checkpoint load and warm-up),
+consumer (connection to the brokers). Each phase is logged once startup is complete,
+and exported as consumer_startup_seconds{phase}.
+"""
+import time
+from typing import Dict, Optional
+
+from metrics.exporter import STARTUP_SECONDS
+
+
+class StartupPhases:
+    """
+    Durations of the startup phases, in ms.
+
+    - phases: duration of each phase, in the order they were marked.
+    """
+    def __init__(self, start: Optional[float] = None):
+        """
+        :param start: perf_counter time the first phase started at, now by default.
+        """
+        self._start = time.perf_counter() if start is None else start
+        self._last = self._start
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> float:
+        """
+        Ends a phase, started when the previous one ended.
+        :return: the duration of the phase, in ms.
+        """
+        now = time.perf_counter()
+        duration = (now - self._last) * 1000
+        self._last = now
+        self.phases[phase] = duration
+        STARTUP_SECONDS.labels(phase).set(duration / 1000)
+        return duration
+
+    @property
+    def total_ms(self) -> float:
+        """Returns the time from the start to the end of the last phase."""
+        return (self._last - self._start) * 1000
+
+    def report(self) -> str:
+        """Returns the duration of each phase and the total."""
+        phases = ", ".join(f"{phase}: {duration:.0f} ms" for phase, duration in self.phases.items())
+        return f"{phases}, total: {self.total_ms:.0f} ms"
+
+
+if __name__ == "__main__":
+    # executes test codes.
+    startup = StartupPhases()
+    time.sleep(0.01)
+    assert startup.mark("imports") >= 10
+    startup.mark("init")
+    assert list(startup.phases) == ["imports", "init"]
+    assert abs(startup.total_ms - sum(startup.phases.values())) < 1e-6
+    assert STARTUP_SECONDS.labels("imports")._value.get() >= 0.01
+    print(startup.report())
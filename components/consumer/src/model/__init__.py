@@ -1,3 +1,8 @@
 """
 This directory stores the models required for ML model execution.
-"""
\ No newline at end of file
+
+- predictor.py: loads the checkpoint and runs per-user adapted predictions, one window or a batch at a time.
+- compiled.py: NumPy evaluator of the trees of the checkpoint, replacing scikit-learn's predict_proba.
+- adaptation.py: asynchronous adaptation of the per-user models, batched per user under a staleness bound.
+- registry.py: per-user models sharing the checkpoint, evicted least recently used first under a memory budget.
+"""
@@ -0,0 +1,156 @@
+"""
+Asynchronous, batched adaptation of the per-user models.
+
+With ADAPTATION_MODE=async, windows are predicted with the current prior of their user,
+and their adjusted probabilities are queued for a dedicated thread,
+which applies every window of a user with a single AdaptiveModel.adapt_many() call.
+A prior is at most ADAPTATION_MAX_STALENESS_MS behind the windows already predicted:
+the thread applies the queued windows once the oldest of them has waited that long.
+If the thread falls behind (the queue is full), predictions wait for it.
+"""
+import queue
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from configurations import InferenceConfigurations
+from logger.ConsumerLogger import ConsumerLogger
+from model.predictor import AdaptiveModel
+
+logger = ConsumerLogger()
+
+_STOP = object() # queue item stopping the adaptation thread
+
+
+class BackgroundAdapter:
+    """
+    Applies the adaptation of the predicted windows off the prediction path, in batches per user.
+
+    - queue_depth: predicted batches waiting to be applied.
+    - adapted_windows / adapted_batches: windows applied / adapt_many() calls (one per user and flush).
+    - max_staleness_ms: longest wait of a window before its adaptation was applied.
+    - blocked: submissions that waited for a full queue.
+    """
+    def __init__(self, max_staleness_ms: int = InferenceConfigurations.adaptation_max_staleness_ms,
+                 queue_size: int = InferenceConfigurations.adaptation_queue_size):
+        """
+        :param max_staleness_ms: max time a predicted window waits before its adaptation is applied.
+        :param queue_size: max number of predicted batches waiting, beyond which predictions wait.
+        """
+        self.max_staleness = max_staleness_ms / 1000
+        self._queue = queue.Queue(maxsize=queue_size)
+
+        self.adapted_windows = 0
+        self.adapted_batches = 0
+        self.max_staleness_ms = 0.0
+        self.blocked = 0
+
+        self._thread = threading.Thread(target=self._run, name="model-adaptation", daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        """Returns the number of predicted batches waiting to be applied."""
+        return self._queue.qsize()
+
+    def submit(self, models: Sequence[AdaptiveModel], probas: Sequence[np.ndarray]) -> None:
+        """
+        Queues the adaptation of predicted windows.
+        :param models: model of the user owning each window.
+        :param probas: adjusted class probabilities of each window, in order.
+        """
+        item = (models, probas, time.monotonic())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.blocked += 1
+            self._queue.put(item)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until every window queued before the call is applied.
+        :return: False if the timeout expired.
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Applies the remaining windows and stops the adaptation thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self) -> None:
+        # windows of each model, in prediction order
+        pending: Dict[int, Tuple[AdaptiveModel, List[np.ndarray]]] = {}
+        oldest = None
+        while True:
+            timeout = None if oldest is None else max(oldest + self.max_staleness - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._apply(pending, oldest)
+                return
+            if isinstance(item, threading.Event):
+                self._apply(pending, oldest)
+                pending, oldest = {}, None
+                item.set()
+                continue
+            if item is not None:
+                models, probas, submitted = item
+                for model, proba in zip(models, probas):
+                    pending.setdefault(id(model), (model, []))[1].append(proba)
+                if oldest is None:
+                    oldest = submitted
+
+            if oldest is not None and time.monotonic() >= oldest + self.max_staleness:
+                self._apply(pending, oldest)
+                pending, oldest = {}, None
+
+    def _apply(self, pending: Dict[int, Tuple[AdaptiveModel, List[np.ndarray]]], oldest: float) -> None:
+        """Adapts each model with all its pending windows at once."""
+        if not pending:
+            return
+        for model, probas in pending.values():
+            model.adapt_many(np.array(probas))
+            self.adapted_windows += len(probas)
+        self.adapted_batches += len(pending)
+        self.max_staleness_ms = max(self.max_staleness_ms, (time.monotonic() - oldest) * 1000)
+
+    def report(self) -> str:
+        """Returns the adaptation counters."""
+        return (f"adapted windows: {self.adapted_windows} in {self.adapted_batches} batches, "
+                f"max staleness: {self.max_staleness_ms:.1f} ms, blocked: {self.blocked}")
+
+
+if __name__ == "__main__":
+    # executes test codes: the batched adaptation matches the sequential one.
+    from model.predictor import model_load
+
+    rng = np.random.default_rng(0)
+    probas = rng.dirichlet(np.ones(3), size=(2, 10))
+    sequential = [model_load(), model_load()]
+    for user, model in enumerate(sequential):
+        for proba in probas[user]:
+            model.adapt(proba)
+
+    adapter = BackgroundAdapter(max_staleness_ms=50)
+    batched = [model_load(), model_load()]
+    for i in range(10):
+        adapter.submit(batched, [probas[0, i], probas[1, i]])
+    assert adapter.flush(timeout=5)
+    for expected, actual in zip(sequential, batched):
+        assert np.allclose(expected.prior, actual.prior, rtol=0, atol=1e-12)
+    assert adapter.adapted_windows == 20 and adapter.adapted_batches == 2
+
+    # without flush, the windows are applied within max_staleness_ms.
+    adapter.submit(batched[:1], probas[0, :1])
+    time.sleep(0.5)
+    assert adapter.adapted_windows == 21 and adapter.queue_depth == 0
+    adapter.close()
+    print(adapter.report())
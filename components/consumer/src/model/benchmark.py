@@ -0,0 +1,77 @@
+"""
+Benchmark of the inference engines.
+Checks that the compiled evaluator predicts the same classes (and probabilities) as the checkpoint,
+then reports the latency of one predict_proba call of each engine, per batch size,
+and the per-window cost of the synchronous and batched (ADAPTATION_MODE=async) adaptation.
+
+Usage (from the src/ directory):
+    python -m model.benchmark --batch-sizes 1 16 256
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from model.compiled import CompiledForest, compile_estimator
+from model.predictor import AdaptiveModel, checkpoint_prior, load_checkpoint
+
+
+def sample_features(compiled: CompiledForest, n: int, seed: int = 0) -> np.ndarray:
+    """
+    Returns n feature vectors drawn around the thresholds the trees split each feature at,
+    so that the rows spread over the branches (and classes) of the forest.
+    """
+    rng = np.random.default_rng(seed)
+    X = np.zeros((n, compiled.n_features_in_))
+    for f in range(compiled.n_features_in_):
+        splits = compiled.threshold[(compiled.feature == f) & np.isfinite(compiled.threshold)]
+        if len(splits):
+            X[:, f] = rng.choice(splits, size=n) * rng.uniform(0.9, 1.1, size=n)
+    return X
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 256], help="rows per predict call")
+    parser.add_argument("--number", type=int, default=20, help="calls per measurement")
+    parser.add_argument("--windows-per-user", type=int, default=16, help="windows applied per adapt_many call")
+    args = parser.parse_args()
+
+    estimator = load_checkpoint()
+    compiled = compile_estimator(estimator)
+    assert isinstance(compiled, CompiledForest), f"{type(estimator).__name__} is not supported by the compiled engine"
+
+    X = sample_features(compiled, max(args.batch_sizes))
+    assert (compiled.predict(X) == estimator.predict(X)).all(), "classes differ from the checkpoint"
+    assert np.allclose(compiled.predict_proba(X), estimator.predict_proba(X), rtol=0, atol=1e-12), \
+        "probabilities differ from the checkpoint"
+    print(f"{type(estimator).__name__}: {compiled.n_trees} trees, {len(compiled.feature)} nodes, depth {compiled.depth}")
+
+    print(f"{'batch size':>10} {'sklearn':>14} {'compiled':>14} {'speedup':>8}")
+    for batch_size in args.batch_sizes:
+        rows = X[:batch_size]
+        latency = {}
+        for name, engine in (("sklearn", estimator), ("compiled", compiled)):
+            latency[name] = min(timeit.repeat(lambda: engine.predict_proba(rows), number=args.number, repeat=5)) / args.number
+        print(f"{batch_size:>10} {latency['sklearn'] * 1e3:11.3f} ms {latency['compiled'] * 1e3:11.3f} ms "
+              f"{latency['sklearn'] / latency['compiled']:7.1f}x")
+
+    # adaptation only: the prediction path pays adapt_and_predict (sync) or predict (async),
+    # and the adaptation thread pays one adapt_many per user and flush.
+    k = args.windows_per_user
+    model = AdaptiveModel(compiled, train_prior=checkpoint_prior())
+    base_proba = compiled.predict_proba(sample_features(compiled, k, seed=1))
+    probas = np.array([model.adjust(proba) for proba in base_proba])
+    cost = {
+        "adapt_and_predict": lambda: [model.adapt_and_predict(proba) for proba in base_proba],
+        "predict": lambda: [model.predict(proba) for proba in base_proba],
+        "adapt": lambda: [model.adapt(proba) for proba in probas],
+        f"adapt_many({k})": lambda: model.adapt_many(probas),
+    }
+    for name, func in cost.items():
+        best = min(timeit.repeat(func, number=args.number * 10, repeat=5)) / (args.number * 10 * k)
+        print(f"{name:<20} {best * 1e6:8.2f} us/window")
+
+
+if __name__ == "__main__":
+    main()
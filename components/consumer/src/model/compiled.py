@@ -0,0 +1,121 @@
+"""
+Compiled evaluator of the checkpoint.
+
+scikit-learn's predict_proba validates its input and dispatches every tree through joblib,
+a fixed cost of milliseconds that dominates for the few rows of a poll.
+The trees of a forest are flattened here into one node table (feature, threshold, children, leaf probabilities),
+and every (row, tree) pair descends one level per step with vectorized NumPy lookups.
+Leaves point to themselves, so max_depth steps reach a leaf for every pair without any branch.
+
+Estimators without trees (or with several outputs) are returned as is, and evaluated by scikit-learn.
+"""
+import numpy as np
+
+# Input type of the scikit-learn trees: rows are compared as float32, against float64 thresholds.
+DTYPE = np.float32
+
+
+class CompiledForest:
+    """
+    Drop-in replacement for the predict_proba/predict of a fitted tree or forest classifier.
+    """
+    def __init__(self, estimator):
+        """
+        :param estimator: fitted DecisionTreeClassifier, or forest of them (RandomForestClassifier, ExtraTreesClassifier).
+        """
+        trees = [estimator] if hasattr(estimator, "tree_") else estimator.estimators_
+        self.classes_ = estimator.classes_
+        self.n_features_in_ = estimator.n_features_in_
+        self.n_trees = len(trees)
+
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        depth = 0
+        for tree in trees:
+            tree = tree.tree_
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left < 0
+            # a leaf compares feature 0 to itself, whichever side it goes to
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            children.append(np.stack([np.where(leaf, nodes, tree.children_left),
+                                      np.where(leaf, nodes, tree.children_right)]) + offset)
+            # leaf values are class counts: normalized per tree, then averaged over the trees
+            value = tree.value[:, 0, :].astype(np.float64)
+            total = value.sum(axis=1, keepdims=True)
+            total[total == 0] = 1
+            values.append(value / total)
+            roots.append(offset)
+            offset += tree.node_count
+            depth = max(depth, tree.max_depth)
+
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds)
+        self.children = np.concatenate(children, axis=1).astype(np.intp) # (2, n_nodes): left, right
+        self.value = np.concatenate(values) / self.n_trees
+        self.roots = np.array(roots, dtype=np.intp)
+        self.depth = depth
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """
+        Returns the leaf reached by each row in each tree, as an index of the node table.
+        :param X: feature matrix of shape (n_samples, n_features).
+        :return: array of shape (n_samples, n_trees).
+        """
+        X = np.ascontiguousarray(X, dtype=DTYPE)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has shape {X.shape}, {self.n_features_in_} features are expected")
+        flat = X.ravel()
+        row_offset = (np.arange(len(X), dtype=np.intp) * self.n_features_in_)[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.depth):
+            right = flat[row_offset + self.feature[node]] > self.threshold[node]
+            node = self.children[right.view(np.int8), node]
+        return node
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        Returns the class probabilities of each row, averaged over the trees.
+        :return: array of shape (n_samples, n_classes).
+        """
+        return self.value[self.apply(X)].sum(axis=1)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Returns the most probable class of each row."""
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def compile_estimator(estimator):
+    """
+    Returns the compiled evaluator of the estimator, or the estimator itself if its type is not supported.
+    """
+    trees = [estimator] if hasattr(estimator, "tree_") else getattr(estimator, "estimators_", None)
+    supported = (
+        trees is not None and len(trees) > 0
+        and hasattr(estimator, "predict_proba") and getattr(estimator, "n_outputs_", 1) == 1
+        and all(hasattr(tree, "tree_") for tree in trees)
+    )
+    return CompiledForest(estimator) if supported else estimator
+
+
+if __name__ == "__main__":
+    # executes test codes: parity with the checkpoint.
+    from model.benchmark import sample_features
+    from model.predictor import load_checkpoint
+
+    estimator = load_checkpoint()
+    compiled = compile_estimator(estimator)
+    assert isinstance(compiled, CompiledForest)
+    X = sample_features(compiled, 512)
+    for rows in (X[:1], X[:16], X):
+        assert (compiled.apply(rows)[:, 0] - compiled.roots[0] == estimator.estimators_[0].apply(rows.astype(DTYPE))).all()
+        assert np.allclose(compiled.predict_proba(rows), estimator.predict_proba(rows), rtol=0, atol=1e-12)
+        assert (compiled.predict(rows) == estimator.predict(rows)).all()
+    # thresholds themselves go left, as in scikit-learn.
+    at_threshold = X[:1].copy()
+    root = estimator.estimators_[0].tree_
+    at_threshold[0, root.feature[0]] = root.threshold[0]
+    assert (compiled.predict(at_threshold) == estimator.predict(at_threshold)).all()
+    # other estimators are left to scikit-learn.
+    assert compile_estimator(object) is object
+    print("ok")
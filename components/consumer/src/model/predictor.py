@@ -0,0 +1,215 @@
+"""
+Loads the affect model and runs per-user adapted predictions.
+
+The checkpoint (small_model_checkpoint.joblib) is a scikit-learn classifier shared by every user.
+Adaptation is done on top of its class probabilities, with a per-user class prior
+(EM-style label shift correction), so the checkpoint itself is never modified.
+"""
+import os
+import sys
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from configurations import InferenceConfigurations
+from model.compiled import compile_estimator
+
+CHECKPOINT_PATH = os.path.abspath(os.path.join(__file__, "..", "small_model_checkpoint.joblib"))
+
+
+@lru_cache(maxsize=None)
+def load_checkpoint(path: str = CHECKPOINT_PATH):
+    """
+    Loads the base estimator once per process.
+    Not memory-mapped: scikit-learn copies the tree nodes out of the mapped arrays,
+    and mapping the arrays of every tree makes the load ~15x slower.
+    :param path: path of the joblib checkpoint.
+    """
+    # imported here: joblib (and scikit-learn, when unpickling) are only needed by the processes that predict
+    import joblib
+    return joblib.load(path)
+
+
+def training_prior(estimator) -> np.ndarray:
+    """
+    Returns the class distribution the estimator was trained with.
+    For forests, it is read from the root nodes of the trees; otherwise it is assumed uniform.
+    """
+    n_classes = len(estimator.classes_)
+    trees = getattr(estimator, "estimators_", None)
+    if trees is None:
+        return np.full(n_classes, 1 / n_classes)
+    roots = np.array([tree.tree_.value[0, 0] for tree in trees], dtype=np.float64)
+    return (roots / roots.sum(axis=1, keepdims=True)).mean(axis=0)
+
+
+@lru_cache(maxsize=256)
+def adaptation_weights(rate: float, n_windows: int) -> Tuple[float, np.ndarray]:
+    """
+    Returns the weights of n successive adaptations, applied at once:
+    prior_n = (1 - rate)^n * prior_0 + sum_i rate * (1 - rate)^(n - 1 - i) * proba_i
+    :return: (weight of prior_0, weight of each proba_i)
+    """
+    weights = rate * (1 - rate) ** np.arange(n_windows - 1, -1, -1)
+    weights.flags.writeable = False
+    return (1 - rate) ** n_windows, weights
+
+
+class AdaptiveModel:
+    """
+    Per-user model: the shared base estimator plus the class prior of the user.
+    The prior is copy-on-write: it is shared with the base until the first adaptation,
+    so the only per-user state is the adapted prior (n_classes floats).
+    """
+    __slots__ = ("base", "adaptation_rate", "train_prior", "prior")
+
+    def __init__(self, base, adaptation_rate: float = InferenceConfigurations.adaptation_rate,
+                 train_prior: Optional[np.ndarray] = None):
+        """
+        :param base: fitted scikit-learn classifier with predict_proba, or its compiled evaluator.
+        :param adaptation_rate: weight of each new window in the class prior of the user.
+        :param train_prior: training_prior(base), when already computed for the shared base.
+        """
+        self.base = base
+        self.adaptation_rate = adaptation_rate
+        self.train_prior = training_prior(base) if train_prior is None else train_prior
+        self.prior = self.train_prior
+
+    @property
+    def adapted(self) -> bool:
+        """Returns True if the user has its own prior."""
+        return self.prior is not self.train_prior
+
+    @property
+    def nbytes(self) -> int:
+        """Returns the memory used by the per-user state (the shared base and training prior excluded)."""
+        return sys.getsizeof(self) + (sys.getsizeof(self.prior) if self.adapted else 0)
+
+    def adjust(self, base_proba: np.ndarray) -> np.ndarray:
+        """
+        Re-weights the base class probabilities with the class prior of the user.
+        :param base_proba: class probabilities of the base estimator, shape (n_classes,).
+        """
+        proba = base_proba * (self.prior / self.train_prior)
+        total = proba.sum()
+        return proba / total if total > 0 else base_proba
+
+    def adapt(self, proba: np.ndarray) -> None:
+        """
+        Moves the class prior of the user towards the adjusted probabilities of a window.
+        :param proba: adjusted class probabilities, shape (n_classes,).
+        """
+        if not self.adapted:
+            self.prior = self.train_prior.copy()
+        self.prior += self.adaptation_rate * (proba - self.prior)
+
+    def adapt_many(self, probas: np.ndarray) -> None:
+        """
+        Applies the adaptation of several windows at once, as successive adapt() calls would.
+        The new prior replaces the previous one, so a concurrent adjust() reads either of them.
+        :param probas: adjusted class probabilities of the windows in order, shape (n_windows, n_classes).
+        """
+        decay, weights = adaptation_weights(self.adaptation_rate, len(probas))
+        self.prior = decay * self.prior + weights @ probas
+
+    def predict(self, base_proba: np.ndarray) -> Tuple[int, np.ndarray]:
+        """
+        Adjusts the base probabilities of one window with the current prior, without adapting it.
+        :return: (predicted class, adjusted class probabilities)
+        """
+        proba = self.adjust(base_proba)
+        return self.base.classes_[int(np.argmax(proba))], proba
+
+    def adapt_and_predict(self, base_proba: np.ndarray) -> Tuple[int, np.ndarray]:
+        """
+        Adjusts the base probabilities of one window, adapts the prior and returns the prediction.
+        :return: (predicted class, adjusted class probabilities)
+        """
+        proba = self.adjust(base_proba)
+        self.adapt(proba)
+        return self.base.classes_[int(np.argmax(proba))], proba
+
+
+@lru_cache(maxsize=None)
+def load_engine(path: str = CHECKPOINT_PATH, engine: str = InferenceConfigurations.inference_engine):
+    """
+    Returns the base estimator evaluated by the inference engine, once per process.
+    :param path: path of the joblib checkpoint.
+    :param engine: "sklearn" for the checkpoint itself, "compiled" for its NumPy evaluator (see compiled.py).
+    """
+    if engine == "sklearn":
+        return load_checkpoint(path)
+    if engine == "compiled":
+        return compile_estimator(load_checkpoint(path))
+    raise ValueError(f"Unknown inference engine: {engine}")
+
+
+@lru_cache(maxsize=None)
+def checkpoint_prior(path: str = CHECKPOINT_PATH) -> np.ndarray:
+    """Returns the training prior of the checkpoint, computed once per process."""
+    prior = training_prior(load_checkpoint(path))
+    prior.flags.writeable = False # shared by every user until its first adaptation
+    return prior
+
+
+def model_load() -> AdaptiveModel:
+    """
+    Returns a new per-user model on top of the shared checkpoint.
+    """
+    return AdaptiveModel(load_engine(), train_prior=checkpoint_prior())
+
+
+def model_adapt_and_predict(model: AdaptiveModel, sensor_features: np.ndarray) -> Tuple[int, np.ndarray]:
+    """
+    Predicts the affect of one window and adapts the model of the user.
+    :param model: model of the user.
+    :param sensor_features: feature matrix of shape (1, n_features).
+    :return: (predicted class, adjusted class probabilities)
+    """
+    base_proba = model.base.predict_proba(sensor_features)
+    return model.adapt_and_predict(base_proba[0])
+
+
+def batch_base_proba(models: List[AdaptiveModel], sensor_features: np.ndarray) -> np.ndarray:
+    """
+    Returns the base class probabilities of a batch of windows, possibly from different users,
+    with one predict call per base estimator.
+    :param models: model of the user owning each row.
+    :param sensor_features: feature matrix of shape (len(models), n_features).
+    :return: array of shape (len(models), n_classes).
+    """
+    groups = {}
+    for i, model in enumerate(models):
+        groups.setdefault(id(model.base), []).append(i)
+    base_proba = None
+    for rows in groups.values():
+        base = models[rows[0]].base
+        # all rows share the base estimator in the common case: no fancy-indexing copy
+        proba = base.predict_proba(sensor_features if len(rows) == len(models) else sensor_features[rows])
+        if base_proba is None:
+            base_proba = np.empty((len(models), proba.shape[1]))
+        base_proba[rows] = proba
+    return base_proba
+
+
+def batch_adapt_and_predict(models: List[AdaptiveModel], sensor_features: np.ndarray) -> List[Tuple[int, np.ndarray]]:
+    """
+    Predicts a batch of windows, possibly from different users, with one predict call per base estimator.
+    Rows are adapted in order, so several windows of the same user are applied one after another.
+    :param models: model of the user owning each row.
+    :param sensor_features: feature matrix of shape (len(models), n_features).
+    :return: (predicted class, adjusted class probabilities) of each row.
+    """
+    base_proba = batch_base_proba(models, sensor_features)
+    return [model.adapt_and_predict(base_proba[i]) for i, model in enumerate(models)]
+
+
+def batch_predict(models: List[AdaptiveModel], sensor_features: np.ndarray) -> List[Tuple[int, np.ndarray]]:
+    """
+    Predicts a batch of windows with the current prior of each user, without adapting them
+    (the adaptation is left to the caller, e.g. model/adaptation.py).
+    :return: (predicted class, adjusted class probabilities) of each row.
+    """
+    base_proba = batch_base_proba(models, sensor_features)
+    return [model.predict(base_proba[i]) for i, model in enumerate(models)]
@@ -0,0 +1,176 @@
+"""
+Registry of the per-user models.
+
+The checkpoint is loaded once, on the first lookup, and shared by every user:
+a user only owns its AdaptiveModel (its adapted class prior, see predictor.py).
+Users are kept in least-recently-used order, and the idlest ones are evicted
+when their state exceeds MODEL_MEMORY_BUDGET_MB. An evicted user restarts from the training prior.
+"""
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from configurations import InferenceConfigurations
+from logger.ConsumerLogger import ConsumerLogger
+from model.predictor import CHECKPOINT_PATH, AdaptiveModel, checkpoint_prior, load_engine
+
+logger = ConsumerLogger()
+
+
+class ModelRegistry:
+    """
+    Per-user models on top of one shared checkpoint, with LRU eviction under a memory budget.
+
+    - cold_start_ms: time to load the checkpoint (compiled with INFERENCE_ENGINE=compiled) and its training prior.
+    - warm_up_ms: time of the first predict call of the checkpoint, on a dummy window (see warm_up).
+    - bytes_per_user: memory used by the state of an adapted user, registry entry included.
+    - memory_bytes: memory used by the state of every user.
+    - hits / misses / evictions: lookups of known users / new users / users evicted.
+    """
+    def __init__(self, memory_budget_mb: float = InferenceConfigurations.model_memory_budget_mb,
+                 path: str = CHECKPOINT_PATH,
+                 adaptation_rate: float = InferenceConfigurations.adaptation_rate):
+        """
+        :param memory_budget_mb: max memory used by the state of the users.
+        :param path: path of the joblib checkpoint.
+        :param adaptation_rate: weight of each new window in the class prior of a user.
+        """
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self.path = path
+        self.adaptation_rate = adaptation_rate
+        self._models: "OrderedDict[str, AdaptiveModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._base = None
+        self._train_prior = None
+
+        self.cold_start_ms = 0.0
+        self.warm_up_ms = 0.0
+        self.bytes_per_user = 0
+        self.max_users = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._models
+
+    @property
+    def memory_bytes(self) -> int:
+        """Returns the memory used by the state of every user."""
+        return len(self._models) * self.bytes_per_user
+
+    def _load(self) -> None:
+        """Loads the shared checkpoint, and sizes the budget in users."""
+        start = time.perf_counter()
+        self._base = load_engine(self.path)
+        self._train_prior = checkpoint_prior(self.path)
+        self.cold_start_ms = (time.perf_counter() - start) * 1000
+
+        # an adapted user: its model, its own prior, its key (a uuid4 string) and its OrderedDict entry
+        model = AdaptiveModel(self._base, self.adaptation_rate, self._train_prior)
+        model.adapt(self._train_prior)
+        entry = sys.getsizeof(OrderedDict.fromkeys(range(1024))) // 1024
+        self.bytes_per_user = model.nbytes + sys.getsizeof(str(uuid.uuid4())) + entry
+        self.max_users = max(self.memory_budget_bytes // self.bytes_per_user, 1)
+        logger.info("Loaded the model checkpoint in %.1f ms, %d bytes per user, up to %d users",
+                    self.cold_start_ms, self.bytes_per_user, self.max_users)
+
+    def warm_up(self) -> None:
+        """
+        Loads the checkpoint and runs one predict call on a dummy window, before any message is consumed,
+        so the first window does not pay for the load and the first call of the engine (allocations, caches).
+        No user model is created or adapted.
+        """
+        with self._lock:
+            if self._base is None:
+                self._load()
+        start = time.perf_counter()
+        self._base.predict_proba(np.zeros((1, self._base.n_features_in_)))
+        self.warm_up_ms = (time.perf_counter() - start) * 1000
+
+    def get(self, user_id: str) -> AdaptiveModel:
+        """
+        Returns the model of the user, created on its first window.
+        """
+        with self._lock:
+            model = self._models.get(user_id)
+            if model is not None:
+                self._models.move_to_end(user_id)
+                self.hits += 1
+                return model
+
+            if self._base is None:
+                self._load()
+            model = AdaptiveModel(self._base, self.adaptation_rate, self._train_prior)
+            self._models[user_id] = model
+            self.misses += 1
+            # evict the idlest users
+            while len(self._models) > self.max_users:
+                self._models.popitem(last=False)
+                self.evictions += 1
+            return model
+
+    def priors(self, user_ids: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Returns a copy of the adapted class prior of the users that have one,
+        e.g. to hand them over to the consumer taking over the users.
+        """
+        with self._lock:
+            models = [(user_id, self._models.get(user_id)) for user_id in user_ids]
+        return {user_id: model.prior.copy() for user_id, model in models if model is not None and model.adapted}
+
+    def restore(self, user_id: str, prior: np.ndarray) -> AdaptiveModel:
+        """
+        Returns the model of the user, with the adapted class prior handed over by its previous consumer.
+        """
+        model = self.get(user_id)
+        model.prior = np.array(prior, dtype=np.float64)
+        return model
+
+    def pop(self, user_id: str) -> Optional[AdaptiveModel]:
+        """Removes the model of the user, if any."""
+        with self._lock:
+            return self._models.pop(user_id, None)
+
+    def report(self) -> str:
+        """Returns the number of users, their memory and the cold start time."""
+        return (f"users: {len(self._models)}, memory: {self.memory_bytes / 1024:.1f} KiB "
+                f"({self.bytes_per_user} bytes/user, budget {self.memory_budget_bytes / 1024 / 1024:.3g} MiB), "
+                f"cold start: {self.cold_start_ms:.1f} ms, warm-up: {self.warm_up_ms:.1f} ms, hits: {self.hits}, misses: {self.misses}, evictions: {self.evictions}")
+
+
+if __name__ == "__main__":
+    # executes test codes.
+    registry = ModelRegistry(memory_budget_mb=0.001)
+    registry.warm_up()
+    assert len(registry) == 0 and registry.cold_start_ms > 0 and registry.warm_up_ms > 0
+    first = registry.get("user1")
+    assert not first.adapted and first.prior is registry.get("user2").prior # copy-on-write prior
+    assert first.base is registry.get("user2").base # shared checkpoint
+
+    proba = np.array([0.1, 0.2, 0.7])
+    first.adapt_and_predict(proba)
+    assert first.adapted and not registry.get("user2").adapted
+    assert registry.get("user1") is first and registry.hits == 3
+
+    # the adapted prior of a user is handed over to another registry.
+    priors = registry.priors(["user1", "user2", "unknown"])
+    assert list(priors) == ["user1"] and priors["user1"] is not first.prior
+    other = ModelRegistry(memory_budget_mb=0.001)
+    assert other.restore("user1", priors["user1"]).adapted
+    assert np.array_equal(other.get("user1").prior, first.prior)
+
+    # the budget holds max_users users, the least recently used ones are evicted first.
+    for i in range(registry.max_users + 5):
+        registry.get(f"other{i}")
+    assert len(registry) == registry.max_users and registry.memory_bytes <= registry.memory_budget_bytes
+    assert "user1" not in registry and registry.evictions == 7
+    print(registry.report())
@@ -0,0 +1,5 @@
+"""
+This module connects the processing steps of the consumer as stages, running concurrently.
+
+- stages.py: stages linked by bounded queues, and the fetch loop pausing partitions when the first queue is full.
+"""
@@ -0,0 +1,151 @@
+"""
+Staged processing pipeline.
+
+Each stage takes items (derived from one poll of Kafka messages) from its bounded input queue,
+processes them one at a time, and puts its result in the queue of the next stage.
+CPU-bound stages run in an executor, so the event loop keeps fetching while they work.
+When a stage falls behind, the queues before it fill up, up to the first one:
+fetch() then pauses the assigned partitions until the first queue drains.
+"""
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional
+
+from logger.ConsumerLogger import ConsumerLogger
+
+logger = ConsumerLogger()
+
+
+class Stage:
+    """
+    One step of the pipeline, with its input queue.
+
+    - depth: items waiting in the input queue.
+    - processed: items processed.
+    - last_service_ms / max_service_ms / mean_service_ms: time spent processing an item.
+    """
+    def __init__(self, name: str, handler: Callable[[Any], Any], queue_size: int, executor: Optional[Executor] = None):
+        """
+        :param name: name of the stage, used in reports.
+        :param handler: processes an item and returns the item of the next stage (None drops it).
+        :param queue_size: max number of items waiting for the stage.
+        :param executor: runs the handler off the event loop. None runs it in the event loop.
+        """
+        self.name = name
+        self.handler = handler
+        self.executor = executor
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.output: Optional[Stage] = None
+
+        self.processed = 0
+        self.last_service_ms = 0.0
+        self.max_service_ms = 0.0
+        self._total_service_ms = 0.0
+
+    @property
+    def depth(self) -> int:
+        """Returns the number of items waiting for the stage."""
+        return self.queue.qsize()
+
+    @property
+    def mean_service_ms(self) -> float:
+        """Returns the mean time spent processing an item."""
+        return self._total_service_ms / self.processed if self.processed else 0.0
+
+    async def run(self) -> None:
+        """Processes the items of the input queue, in order, forever."""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            start = time.perf_counter()
+            try:
+                if self.executor is None:
+                    result = self.handler(item)
+                else:
+                    result = await loop.run_in_executor(self.executor, self.handler, item)
+            finally:
+                self.last_service_ms = (time.perf_counter() - start) * 1000
+                self.max_service_ms = max(self.max_service_ms, self.last_service_ms)
+                self._total_service_ms += self.last_service_ms
+                self.processed += 1
+                self.queue.task_done()
+
+            # waits while the next stage is full: backpressure up to the first stage
+            if self.output is not None and result is not None:
+                await self.output.queue.put(result)
+
+
+class Pipeline:
+    """
+    Stages linked in order: the result of each stage is the input of the next one.
+    """
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.output = next_stage
+        self.pauses = 0 # number of times fetch() paused the partitions
+
+    @property
+    def head(self) -> Stage:
+        """Returns the first stage, fed by fetch()."""
+        return self.stages[0]
+
+    async def run(self) -> None:
+        """Runs every stage until cancelled, or until a stage fails."""
+        tasks = [asyncio.ensure_future(stage.run()) for stage in self.stages]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def join(self) -> None:
+        """Waits until every item put in the pipeline went through all the stages."""
+        for stage in self.stages:
+            await stage.queue.join()
+
+    def report(self) -> str:
+        """Returns the queue depth and service time of every stage, in order."""
+        return ", ".join(
+            f"{stage.name}: depth {stage.depth}, service {stage.mean_service_ms:.2f} ms (max {stage.max_service_ms:.2f} ms)"
+            for stage in self.stages
+        )
+
+    async def log_reports(self, interval_ms: int) -> None:
+        """Logs report() every interval_ms, forever."""
+        while True:
+            await asyncio.sleep(interval_ms / 1000)
+            logger.info("Pipeline: %s, pauses: %d", self.report(), self.pauses)
+
+
+async def fetch(consumer, pipeline: Pipeline, timeout_ms: int = 1000) -> None:
+    """
+    Polls Kafka and puts every non-empty poll in the first stage of the pipeline,
+    as (reception time in ms, messages).
+    While the first queue is full, the assigned partitions are paused (the consumer keeps polling,
+    so it stays in the group), as well as the partitions assigned meanwhile, and resumed once the queue is half empty.
+    :param consumer: a started AIOKafkaConsumer.
+    :param pipeline: pipeline processing the polled messages.
+    :param timeout_ms: max time a poll waits for messages.
+    """
+    queue = pipeline.head.queue
+    paused = False
+    while True:
+        if not paused and queue.full():
+            pipeline.pauses += 1
+            paused = True
+        elif paused and queue.qsize() <= queue.maxsize // 2:
+            consumer.resume(*consumer.paused())
+            paused = False
+        if paused:
+            # a rebalance assigns the partitions unpaused
+            unpaused = consumer.assignment() - consumer.paused()
+            if unpaused:
+                consumer.pause(*unpaused)
+
+        # polls briefly while paused, to resume as soon as the queue drained
+        records = await consumer.getmany(timeout_ms=min(timeout_ms, 10) if paused else timeout_ms)
+        messages = [msg for messages in records.values() for msg in messages]
+        if messages:
+            await queue.put((int(time.time() * 1000), messages))
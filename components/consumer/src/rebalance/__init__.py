@@ -0,0 +1,5 @@
+"""
+This module hands the state of the users over when partitions move between the consumers of the group.
+
+- handoff.py: rebalance listener writing back the windows and models of revoked partitions, and prefetching those of assigned ones.
+"""
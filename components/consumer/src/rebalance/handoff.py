@@ -0,0 +1,233 @@
+"""
+Handoff of the user state when partitions move between the consumers of the group.
+
+Messages are keyed by user id, so the state of a partition is the windows and models of its users.
+Without a handoff, the new owner of a partition starts every user with an empty window (or a stale entry of its store),
+and each user waits a whole window for its first prediction after a rebalance.
+StateHandoff tracks the partition of every user, and the most recent users of each partition
+(up to REBALANCE_PREFETCH_USERS). Through a store shared by the consumers of the group
+(STORE_HOST: sqlite or dbm file on a shared volume, the handoff is disabled with memory://):
+
+- on revocation: waits for the polled messages to be processed, writes back the dirty windows of every user of the
+  revoked partitions, and stores the state of each partition: its recent users with their adapted class priors.
+- on assignment: drops from memory every user of the partitions that moved to another consumer (their state belongs
+  to the new owner), and prefetches the windows and models of the recent users of the newly assigned partitions,
+  so their next message completes a window instead of starting an empty one.
+
+aiokafka revokes every partition on each rebalance (eager protocol): the users of the partitions kept by the
+consumer stay in memory. The segments held by the reorder buffer of a user that moves are dropped.
+The time from the assignment to the first prediction is logged, and exported as consumer_rebalance_seconds.
+"""
+import asyncio
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Executor
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from aiokafka.abc import ConsumerRebalanceListener
+from aiokafka.structs import TopicPartition
+
+from cache.table import Cache
+from configurations import InferenceConfigurations
+from logger.ConsumerLogger import ConsumerLogger
+from metrics.exporter import REBALANCE_SECONDS
+from model.registry import ModelRegistry
+
+logger = ConsumerLogger()
+
+
+def partition_key(tp: TopicPartition) -> str:
+    """Returns the store key of the state of a partition, which cannot collide with a user id."""
+    return f"\0partition/{tp.topic}/{tp.partition}"
+
+
+class StateHandoff(ConsumerRebalanceListener):
+    """
+    Rebalance listener handing the windows and models of the users over through the store.
+    seen() is called for every message, from the thread updating the windows.
+
+    - released_users: users dropped from memory since the start, because their partition moved.
+    - prefetched_windows / prefetched_models: users whose window / adapted model was prefetched since the start.
+    """
+    def __init__(self, cache: Cache, models: ModelRegistry, release_user: Callable[[str], None],
+                 max_users: int = InferenceConfigurations.rebalance_prefetch_users,
+                 drain: Optional[Callable[[], Awaitable[None]]] = None, executor: Optional[Executor] = None):
+        """
+        :param cache: windows of the users, over the store shared by the consumers.
+        :param models: per-user models.
+        :param release_user: frees the rest of the in-memory state of a user that moved (not its stored state).
+        :param max_users: max number of recent users tracked, and handed over, per partition.
+        :param drain: waits until the messages polled before the revocation are processed.
+        :param executor: runs the store reads and writes off the event loop (None: default executor).
+        """
+        self.cache = cache
+        self.models = models
+        self.release_user = release_user
+        self.max_users = max_users
+        self.drain = drain
+        self.executor = executor
+        self._users: Dict[int, "OrderedDict[str, None]"] = defaultdict(OrderedDict) # partition -> recent users, oldest first
+        self._partition_of: Dict[str, int] = {} # every user in memory -> its partition
+        self._owned: Set[TopicPartition] = set()
+        self._assigned_at: Optional[float] = None
+
+        self.released_users = 0
+        self.prefetched_windows = 0
+        self.prefetched_models = 0
+
+    def seen(self, partition: int, user_id: str) -> None:
+        """Records a message of the user on the partition."""
+        self._partition_of[user_id] = partition
+        users = self._users[partition]
+        if user_id in users:
+            users.move_to_end(user_id)
+            return
+        users[user_id] = None
+        if len(users) > self.max_users:
+            users.popitem(last=False)
+
+    def forget(self, user_id: str) -> None:
+        """Stops tracking a user, e.g. expired."""
+        self._partition_of.pop(user_id, None)
+        for users in self._users.values():
+            users.pop(user_id, None)
+
+    async def on_partitions_revoked(self, revoked: Iterable[TopicPartition]) -> None:
+        start = time.perf_counter()
+        if self.drain is not None:
+            await self.drain()
+        revoked = [tp for tp in revoked if tp in self._owned]
+        if revoked:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._store, revoked)
+        REBALANCE_SECONDS.labels("revoke").set(time.perf_counter() - start)
+
+    async def on_partitions_assigned(self, assigned: Iterable[TopicPartition]) -> None:
+        self._assigned_at = start = time.perf_counter()
+        assigned = set(assigned)
+        lost, gained = self._owned - assigned, assigned - self._owned
+        self._owned = assigned
+        released, windows, models = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._handoff, lost, gained)
+        REBALANCE_SECONDS.labels("prefetch").set(time.perf_counter() - start)
+        logger.info("Rebalance: %d partitions assigned (+%d, -%d), %d users released, "
+                    "%d windows and %d models prefetched in %.1f ms", len(assigned), len(gained), len(lost),
+                    released, windows, models, (time.perf_counter() - start) * 1000)
+
+    def predicted(self) -> None:
+        """Called after each prediction, to measure the time from the last assignment to the first prediction."""
+        if self._assigned_at is None:
+            return
+        elapsed = time.perf_counter() - self._assigned_at
+        self._assigned_at = None
+        REBALANCE_SECONDS.labels("first_prediction").set(elapsed)
+        logger.info("Rebalance: first prediction %.1f ms after the assignment", elapsed * 1000)
+
+    def _users_of(self, partitions: Iterable[TopicPartition]) -> list:
+        """Returns every user in memory whose partition is one of the partitions."""
+        partitions = {tp.partition for tp in partitions}
+        return [user_id for user_id, partition in self._partition_of.items() if partition in partitions]
+
+    def _store(self, partitions: Iterable[TopicPartition]) -> None:
+        """Writes back the windows of every user of the partitions, and the state of each partition."""
+        states = []
+        for tp in partitions:
+            partition_users = list(self._users.get(tp.partition, ()))
+            priors = self.models.priors(partition_users)
+            # the recent users in recency order, with their adapted prior (None: the training prior)
+            self.cache.set(partition_key(tp), {user_id: priors.get(user_id) for user_id in partition_users})
+            states.append(partition_key(tp))
+        self.cache.flush(self._users_of(partitions))
+        self.cache.release(states) # written, and not kept in the hot tier
+
+    def _handoff(self, lost: Set[TopicPartition], gained: Set[TopicPartition]) -> tuple:
+        """
+        Drops the users of the lost partitions from memory, and prefetches the state of the gained ones.
+        :return: the number of users released, windows prefetched and models prefetched.
+        """
+        released = self._users_of(lost)
+        for user_id in released:
+            del self._partition_of[user_id]
+            self.models.pop(user_id)
+            self.release_user(user_id)
+        for tp in lost:
+            self._users.pop(tp.partition, None)
+        self.cache.release(released)
+        self.released_users += len(released)
+
+        windows = models = 0
+        for tp in gained:
+            state = self.cache.get(partition_key(tp)) or {}
+            self.cache.release([partition_key(tp)])
+            users = self._users[tp.partition]
+            # oldest first: the most recent users stay in the hot tier of the cache
+            for user_id, prior in state.items():
+                users[user_id] = None
+                self._partition_of[user_id] = tp.partition
+                if self.cache.get(user_id) is not None:
+                    windows += 1
+                if prior is not None:
+                    self.models.restore(user_id, prior)
+                    models += 1
+        self.prefetched_windows += windows
+        self.prefetched_models += models
+        return len(released), windows, models
+
+    def report(self) -> str:
+        """Returns the handoff counters."""
+        return (f"released users: {self.released_users}, prefetched windows: {self.prefetched_windows}, "
+                f"prefetched models: {self.prefetched_models}")
+
+
+if __name__ == "__main__":
+    # executes test codes, two consumers sharing a SQLite store.
+    import os
+    import tempfile
+
+    import numpy as np
+
+    from window.ring_buffer import MODALITIES, SensorWindow
+
+    async def test(store_host):
+        tps = [TopicPartition("chest", partition) for partition in range(2)]
+        segment = {col: {"hz": 2, "value": np.zeros((2, 3)) if col.endswith("acc") else [1.5, 2.5]} for col in MODALITIES}
+        first_cache, second_cache = Cache(store_host, flush_interval_ms=0), Cache(store_host, flush_interval_ms=0)
+        first_models, second_models = ModelRegistry(), ModelRegistry()
+        released = []
+        first = StateHandoff(first_cache, first_models, released.append, max_users=2)
+        second = StateHandoff(second_cache, second_models, released.append, max_users=2)
+        await first.on_partitions_assigned(tps)
+
+        # the first consumer owns both partitions: at most max_users recent users are tracked per partition
+        for user_id, partition in (("a", 0), ("b", 0), ("c", 0), ("b", 0), ("d", 1)):
+            first.seen(partition, user_id)
+            window = SensorWindow(window_size=2)
+            window.extend(segment)
+            first_cache[user_id] = window
+        first_models.get("b").adapt(np.array([0.1, 0.2, 0.7]))
+        prior = first_models.get("b").prior.copy()
+        assert list(first._users[0]) == ["c", "b"]
+
+        # partition 0 moves to the second consumer: eager rebalance, then the second consumer joins
+        await first.on_partitions_revoked(tps)
+        await first.on_partitions_assigned(tps[1:])
+        # "a" is not recent enough to be handed over, but it is released as well: its window is written back
+        assert sorted(released) == ["a", "b", "c"] and "b" not in first_models
+        assert sorted(first_cache._hot) == ["d"] and not first_cache._dirty
+        await second.on_partitions_revoked([])
+        await second.on_partitions_assigned(tps[:1])
+        assert (second.prefetched_windows, second.prefetched_models) == (2, 1)
+        assert np.array_equal(second_models.get("b").prior, prior) and not second_models.get("c").adapted
+        assert second_cache.hot_size == 2 and second_cache["c"]["chest_ecg"].view().tolist() == [1.5, 2.5]
+
+        # the kept partition stays in memory
+        await first.on_partitions_revoked(tps[1:])
+        await first.on_partitions_assigned(tps[1:])
+        assert first.released_users == 3 and "d" in first_cache._hot
+        second.predicted()
+        assert REBALANCE_SECONDS.labels("first_prediction")._value.get() > 0
+        print(first.report(), "|", second.report())
+        first_cache.close()
+        second_cache.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(test(f"sqlite://{os.path.join(directory, 'cache.sqlite')}"))
@@ -0,0 +1,6 @@
+"""
+This module replays messages through the consumer offline, to measure its throughput and stage latencies.
+
+- source.py: synthetic messages (as the simulator sends them) and recorded messages (JSON lines), as Kafka records.
+- harness.py: runs the messages through the processing path of main.py, with an in-memory cache and EndRecord writer.
+"""
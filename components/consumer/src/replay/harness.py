@@ -0,0 +1,214 @@
+"""
+Offline replay of messages through the processing path of the consumer, without Kafka, Glue or PostgreSQL.
+
+The messages (synthetic, see source.py, or recorded as JSON lines) are wrapped in stand-ins of the Kafka records,
+and go through the functions of main.py in the order of process_data (BATCH_SIZE=1) or process_batches:
+deserialize (with --decode), update_window (window update and feature extraction), predict_batch, log_end_record.
+The cache is in memory and the EndRecord rows are kept by MemoryWriter instead of the database.
+Settings (FEATURE_MODE, INFERENCE_ENGINE, ADAPTATION_MODE, NAN_POLICY, ...) are read from the environment as usual.
+
+Reports messages/sec, windows/sec and the p50/p99 latency of each stage, and of each message end to end.
+With --min-messages-per-second and --max-p99-ms, exits with status 1 when the run is slower, to gate CI.
+
+Usage (from the src/ directory):
+    python -m replay.harness --users 20 --messages 2000 --batch-size 16 --decode
+    python -m replay.harness --input recorded.jsonl --json replay.json --min-messages-per-second 200
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from replay.source import (DATA_PATH, SCHEMA_PATH, ReplayMessage, as_records, encode, load_recording, read_messages,
+                           synthetic_messages, write_messages)
+
+STAGES = ("decode", "window", "inference", "log", "end_to_end")
+
+
+class MemoryWriter:
+    """
+    Stand-in of EndRecordWriter (db/writer.py), counting the rows instead of inserting them.
+
+    - last_row: the last row added, to check its columns.
+    """
+    queue_depth = 0
+    spilled_rows = 0
+
+    def __init__(self):
+        self.written_rows = 0
+        self.last_row: Optional[dict] = None
+
+    def add(self, row: dict) -> None:
+        self.written_rows += 1
+        self.last_row = row
+
+    def flush(self, timeout: float = None) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class StageLatencies:
+    """Durations of each stage, in ns: per message (decode, window, log, end_to_end) or per predict call (inference)."""
+    def __init__(self):
+        self.samples: Dict[str, List[int]] = defaultdict(list)
+
+    def add(self, stage: str, duration_ns: int) -> None:
+        self.samples[stage].append(duration_ns)
+
+    def summary(self) -> Dict[str, dict]:
+        """Returns the count and the p50/p99/max latency (ms) of each stage."""
+        summary = {}
+        for stage in STAGES:
+            samples = self.samples.get(stage)
+            if not samples:
+                continue
+            p50, p99 = np.percentile(samples, [50, 99]) / 1e6
+            summary[stage] = {"count": len(samples), "p50_ms": p50, "p99_ms": p99, "max_ms": max(samples) / 1e6}
+        return summary
+
+
+def replay(consumer, records: List[ReplayMessage], cache, writer: MemoryWriter, batch_size: int,
+           decode: bool, latencies: StageLatencies) -> int:
+    """
+    Processes the records as the consumer loop does, timing each stage.
+    :param consumer: the main module.
+    :param records: records holding SensorValue messages, or their encoded bytes if decode is True.
+    :param batch_size: messages predicted together, as polled by process_batches (1: process_data).
+    :return: the number of windows predicted.
+    """
+    windows = 0
+    clock = time.perf_counter_ns
+    for first in range(0, len(records), batch_size):
+        received, begins = [], []
+        for msg in records[first:first + batch_size]:
+            begin = clock()
+            start_time = int(time.time() * 1000)
+            stages = consumer.stage_times(msg.timestamp, start_time)
+            sensor_data = msg.value
+            if decode:
+                sensor_data = consumer.deserialize(sensor_data)
+                decoded = clock()
+                latencies.add("decode", decoded - begin)
+            else:
+                decoded = begin
+            consumer.update_window(sensor_data, cache, consumer.feature_batch)
+            stages["feature_time"] = int(time.time() * 1000)
+            latencies.add("window", clock() - decoded)
+            received.append((sensor_data, start_time, stages))
+            begins.append(begin)
+
+        ready = len(consumer.feature_batch)
+        if ready:
+            predicted = clock()
+            consumer.predict_batch(consumer.feature_batch)
+            latencies.add("inference", clock() - predicted)
+            windows += ready
+        consumer.record_prediction(received, ready)
+        for (sensor_data, start_time, stages), begin in zip(received, begins):
+            logged = clock()
+            consumer.log_end_record(sensor_data, start_time, writer, stages)
+            end = clock()
+            latencies.add("log", end - logged)
+            latencies.add("end_to_end", end - begin)
+    return windows
+
+
+def to_records(messages: List[dict], decode: bool) -> List[ReplayMessage]:
+    """Wraps the messages into records, encoded if they are replayed with the decoding."""
+    values = encode(messages) if decode else messages
+    return as_records((message["user_id"], message["timestamp"], value) for message, value in zip(messages, values))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="number of synthetic users")
+    parser.add_argument("--messages", type=int, default=1000, help="number of synthetic messages, one second each")
+    parser.add_argument("--hz", type=int, default=700, help="sampling rate of the synthetic messages")
+    parser.add_argument("--data", default=DATA_PATH, help="recording cut into the synthetic messages")
+    parser.add_argument("--input", help="JSON-lines file of SensorValue messages to replay instead")
+    parser.add_argument("--save", help="writes the synthetic messages to this JSON-lines file")
+    parser.add_argument("--warmup", type=int, default=100, help="messages of other users processed before timing")
+    parser.add_argument("--batch-size", type=int, default=None, help="messages per predict call (default: BATCH_SIZE)")
+    parser.add_argument("--decode", action="store_true", help="replays the encoded messages, including the decoding")
+    parser.add_argument("--log", action="store_true", help="keeps the per-message INFO logs (LOG_MODE, LOG_SAMPLE_RATES)")
+    parser.add_argument("--json", help="writes the report to this file")
+    parser.add_argument("--min-messages-per-second", type=float, default=0, help="fails below this throughput")
+    parser.add_argument("--max-p99-ms", type=float, default=0, help="fails above this end-to-end p99 latency")
+    args = parser.parse_args()
+
+    # main.py decodes with the registry unless a local schema is set, and is imported after it.
+    os.environ.setdefault("SCHEMA_PATH", SCHEMA_PATH)
+    import main as consumer
+    from cache.table import Cache
+
+    if not args.log:
+        logging.getLogger().setLevel(logging.WARNING)
+    batch_size = args.batch_size or consumer.InferenceConfigurations.batch_size
+    start_time = int(time.time() * 1000) - args.messages // max(args.users, 1) * 1000
+    recording = load_recording(args.data, hz=args.hz)
+    if args.input:
+        messages = list(read_messages(args.input))
+    else:
+        messages = list(synthetic_messages(args.users, args.messages, args.hz, recording=recording, start_time=start_time))
+        if args.save:
+            write_messages(args.save, messages)
+    records = to_records(messages, args.decode)
+
+    cache = Cache("memory://")
+    writer = MemoryWriter()
+    try:
+        # first calls load the checkpoint and fill the caches: replayed for other users, not timed
+        warmup = synthetic_messages(args.users, args.warmup, args.hz, recording=recording, start_time=start_time,
+                                    user_prefix="warmup")
+        replay(consumer, to_records(list(warmup), args.decode), cache, MemoryWriter(), batch_size, args.decode,
+               StageLatencies())
+
+        latencies = StageLatencies()
+        started = time.perf_counter()
+        windows = replay(consumer, records, cache, writer, batch_size, args.decode, latencies)
+        elapsed = time.perf_counter() - started
+        if consumer.adapter is not None:
+            consumer.adapter.flush()
+    finally:
+        cache.close()
+
+    report = {
+        "messages": len(records),
+        "windows": windows,
+        "batch_size": batch_size,
+        "seconds": elapsed,
+        "messages_per_second": len(records) / elapsed,
+        "windows_per_second": windows / elapsed,
+        "stages": latencies.summary(),
+    }
+    print(f"{report['messages']} messages, {windows} windows in {elapsed:.2f} s: "
+          f"{report['messages_per_second']:.1f} messages/s, {report['windows_per_second']:.1f} windows/s")
+    print(f"{'stage':<12} {'count':>8} {'p50':>10} {'p99':>10} {'max':>10}")
+    for stage, summary in report["stages"].items():
+        print(f"{stage:<12} {summary['count']:>8} {summary['p50_ms']:7.3f} ms {summary['p99_ms']:7.3f} ms "
+              f"{summary['max_ms']:7.3f} ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if args.min_messages_per_second and report["messages_per_second"] < args.min_messages_per_second:
+        failures.append(f"throughput {report['messages_per_second']:.1f} < {args.min_messages_per_second} messages/s")
+    p99 = report["stages"].get("end_to_end", {}).get("p99_ms", 0)
+    if args.max_p99_ms and p99 > args.max_p99_ms:
+        failures.append(f"end-to-end p99 {p99:.3f} > {args.max_p99_ms} ms")
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Messages replayed through the consumer, in place of a Kafka topic.
+
+- synthetic_messages: segments of N users cut from a chest recording, as MockSensorDataGenerator (simulator) sends them,
+  but each user advances through the recording and its timestamps, so every segment is new.
+- read_messages / write_messages: SensorValue messages as JSON lines, to replay a recording (or a saved synthetic run).
+- encode: the Avro payload the producer would write, for replays that include the decoding.
+"""
+import itertools
+import json
+import os
+import uuid
+import zlib
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from schema.chest import SensorValue
+from serde.decoder import FastAvroDeserializer
+from serde.encoder import AvroEncoder
+from window.ring_buffer import ACC_MODALITIES, MODALITIES
+
+SCHEMA_PATH = os.path.abspath(os.path.join(__file__, "..", "..", "schema", "SensorRecord.avsc"))
+# recording of the simulator (components/simulator/data), absent from the consumer image
+DATA_PATH = os.path.abspath(os.path.join(__file__, "..", "..", "..", "..", "simulator", "data", "respiban.tsv"))
+
+# columns of respiban.tsv
+_COLUMNS = {"chest_ecg": 0, "chest_eda": 1, "chest_emg": 2, "chest_temp": 3, "chest_acc": [4, 5, 6], "chest_resp": 7}
+
+
+class ReplayMessage(NamedTuple):
+    """Stand-in of the aiokafka ConsumerRecord fields used by the consumer."""
+    topic: str
+    partition: int
+    offset: int
+    key: bytes
+    value: object # SensorValue, or its encoded bytes
+    timestamp: int
+
+
+def load_recording(path: Optional[str] = DATA_PATH, hz: int = 700, seed: int = 0) -> np.ndarray:
+    """
+    Returns the samples of the recording, (n, 8) as in respiban.tsv.
+    Without the file, returns one minute of 16-bit ADC-like samples.
+    """
+    if path and os.path.exists(path):
+        return np.loadtxt(path, dtype=np.int64, delimiter="\t", ndmin=2)
+    return np.random.default_rng(seed).integers(0, 1 << 16, size=(60 * hz, 8))
+
+
+def _segment(samples: np.ndarray, user_id: str, timestamp: int, segment_size: int, hz: int) -> SensorValue:
+    """Builds a message as the producer serializes it: lists of ints, {"x", "y", "z"} for accelerometers."""
+    value = {}
+    for col in MODALITIES:
+        if col in ACC_MODALITIES:
+            values = [{"x": x, "y": y, "z": z} for x, y, z in samples[:, _COLUMNS[col]].tolist()]
+        else:
+            values = samples[:, _COLUMNS[col]].tolist()
+        value[col] = {"hz": hz, "value": values}
+    return {
+        "user_id": user_id,
+        "connection_id": str(uuid.uuid4()),
+        "timestamp": timestamp,
+        "segment_size": segment_size,
+        "value": value,
+    }
+
+
+def synthetic_messages(users: int, messages: int, hz: int = 700, segment_size: int = 1000,
+                       recording: Optional[np.ndarray] = None, start_time: int = 0,
+                       user_prefix: str = "user") -> Iterator[SensorValue]:
+    """
+    Yields the segments of the users in turn, as sent concurrently by the simulator.
+    :param users: number of users.
+    :param messages: total number of messages.
+    :param hz: sampling rate of every modality.
+    :param segment_size: duration of each segment, in ms.
+    :param recording: samples cut into segments (see load_recording), cycled if too short.
+    :param start_time: timestamp of the first segment of every user.
+    """
+    if recording is None:
+        recording = load_recording(hz=hz)
+    length = hz * segment_size // 1000
+    # each user starts at another point of the recording
+    samples = np.concatenate([recording] * (length // len(recording) + 2))
+    stride = max(len(recording) // max(users, 1), 1)
+    for i in range(messages):
+        user, n = i % users, i // users
+        offset = (user * stride + n * length) % len(recording)
+        yield _segment(samples[offset:offset + length], f"{user_prefix}-{user}", start_time + n * segment_size,
+                       segment_size, hz)
+
+
+def read_messages(path: str) -> Iterator[SensorValue]:
+    """Yields the messages of a JSON-lines file, one SensorValue per line."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_messages(path: str, messages: Iterable[SensorValue]) -> int:
+    """
+    Writes the messages as JSON lines.
+    :return: the number of messages written.
+    """
+    count = 0
+    with open(path, "w") as f:
+        for message in messages:
+            f.write(json.dumps(message) + "\n")
+            count += 1
+    return count
+
+
+def encode(messages: Iterable[SensorValue], schema_path: str = SCHEMA_PATH) -> Iterator[bytes]:
+    """Yields the messages serialized as the producer does (Glue header, Avro binary)."""
+    encoder = AvroEncoder(schema_path)
+    for message in messages:
+        yield encoder.encode(message)
+
+
+def as_records(values: Iterable[Tuple[str, int, object]], topic: str = "chest", partitions: int = 6) -> List[ReplayMessage]:
+    """
+    Wraps (user_id, timestamp, value) triples into consumer records, partitioned by user as the producer keys them.
+    """
+    offsets = [itertools.count() for _ in range(partitions)]
+    records = []
+    for user_id, timestamp, value in values:
+        partition = zlib.crc32(user_id.encode()) % partitions
+        records.append(ReplayMessage(topic, partition, next(offsets[partition]), user_id.encode(), value, timestamp))
+    return records
+
+
+if __name__ == "__main__":
+    # executes test codes.
+    import tempfile
+
+    recording = load_recording(path=None, hz=10)
+    messages = list(synthetic_messages(users=2, messages=6, hz=10, recording=recording))
+    assert [(m["user_id"], m["timestamp"]) for m in messages[:4]] == [("user-0", 0), ("user-1", 0), ("user-0", 1000), ("user-1", 1000)]
+    # each user goes through the recording
+    assert messages[2]["value"]["chest_ecg"]["value"] == recording[10:20, 0].tolist()
+    assert messages[0]["value"]["chest_acc"]["value"][0] == dict(zip("xyz", recording[0, 4:7].tolist()))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "messages.jsonl")
+        assert write_messages(path, messages) == 6 and list(read_messages(path)) == messages
+
+    decoded = FastAvroDeserializer("chest", schema_path=SCHEMA_PATH).deserialize(next(encode(messages)))
+    assert decoded["value"]["chest_eda"]["value"].tolist() == messages[0]["value"]["chest_eda"]["value"]
+    records = as_records((m["user_id"], m["timestamp"], m) for m in messages)
+    assert len({record.partition for record in records}) <= 2 and records[2].timestamp == 1000
+    print("ok")
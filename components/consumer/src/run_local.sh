@@ -0,0 +1,9 @@
+#!/bin/bash
+
+# Runs the consumer without Kafka, Schema Registry or PostgreSQL (see LOCAL_SETUP.md)
+export KAFKA_HOST="memory://"
+export SCHEMA_PATH="${SCHEMA_PATH:-schema/SensorRecord.avsc}"
+export DATABASE_URL="${DATABASE_URL:-sqlite:///$PWD/local.db}"
+export STORE_HOST="memory://"
+
+python main.py
@@ -1,4 +1,9 @@
 """
 This module is used to deserialize messages (bytes) received from Kafka 
 into the data type (SensorValue) for inference.
+
+- deserializer.py: adapter of the aws_schema_registry deserializer, producing nested dicts and lists.
+- decoder.py: fast-path decoder, producing NumPy arrays, with a schema cache and optional local schema file.
+- encoder.py: encodes messages as the producer does, from the local schema, where no producer runs.
+- benchmark.py: compares both decoders offline, with the local schema (schema/SensorRecord.avsc).
 """
\ No newline at end of file
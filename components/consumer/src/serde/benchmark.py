@@ -0,0 +1,89 @@
+"""
+Benchmark of the message decoding path, without Glue or network access.
+Encodes synthetic SensorRecord messages with the local schema, checks that FastAvroDeserializer
+decodes the same values as the aws_schema_registry deserializer, then reports the per-message cost
+of both, up to the samples being appended to a SensorWindow.
+
+Usage (from the src/ directory):
+    python -m serde.benchmark --hz 700 --compression
+"""
+import argparse
+import io
+import os
+import timeit
+import uuid
+
+import fastavro
+import numpy as np
+from aws_schema_registry import KafkaDeserializer as _KafkaDeserializer
+from aws_schema_registry.codec import encode
+from aws_schema_registry.schema import SchemaVersion
+
+from serde.decoder import FastAvroDeserializer
+from window.ring_buffer import ACC_MODALITIES, MODALITIES, SensorWindow
+
+SCHEMA_PATH = os.path.abspath(os.path.join(__file__, "..", "..", "schema", "SensorRecord.avsc"))
+
+
+class LocalSchemaRegistry:
+    """Schema registry client serving the local schema for every version ID."""
+    def __init__(self, schema_path: str):
+        with open(schema_path) as f:
+            self.definition = f.read()
+
+    def get_schema_version(self, version_id: uuid.UUID) -> SchemaVersion:
+        return SchemaVersion(schema_name="SensorRecord", version_id=version_id, definition=self.definition,
+                             data_format="AVRO", status="AVAILABLE")
+
+
+def synthetic_message(hz: int, compression: bool, seed: int = 0) -> bytes:
+    """Returns one second of 16-bit ADC-like samples, encoded as the producer does."""
+    rng = np.random.default_rng(seed)
+    value = {}
+    for col in MODALITIES:
+        if col in ACC_MODALITIES:
+            samples = [{"x": int(x), "y": int(y), "z": int(z)} for x, y, z in rng.integers(0, 1 << 16, size=(hz, 3))]
+        else:
+            samples = rng.integers(0, 1 << 16, size=hz).tolist()
+        value[col] = {"hz": hz, "value": samples}
+    record = {"user_id": "user", "connection_id": str(uuid.uuid4()), "timestamp": 0, "segment_size": 1000, "value": value}
+
+    buffer = io.BytesIO()
+    fastavro.schemaless_writer(buffer, fastavro.parse_schema(FastAvroDeserializer.load_schema(SCHEMA_PATH)), record)
+    return encode(buffer.getvalue(), uuid.uuid4(), compression=compression)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hz", type=int, default=700, help="sampling rate of every modality")
+    parser.add_argument("--compression", action="store_true", help="zlib-compress the messages")
+    parser.add_argument("--number", type=int, default=200, help="messages per measurement")
+    args = parser.parse_args()
+
+    message = synthetic_message(args.hz, args.compression)
+    adapter = _KafkaDeserializer(client=LocalSchemaRegistry(SCHEMA_PATH))
+    fast = FastAvroDeserializer("chest", client=LocalSchemaRegistry(SCHEMA_PATH))
+
+    expected = adapter.deserialize("chest", message).data
+    actual = fast.deserialize(message)
+    for col in MODALITIES:
+        values = expected["value"][col]["value"]
+        if col in ACC_MODALITIES:
+            values = [[sample["x"], sample["y"], sample["z"]] for sample in values]
+        assert actual["value"][col]["value"].tolist() == values, f"{col} differs from the aws_schema_registry deserializer"
+    assert {k: v for k, v in actual.items() if k != "value"} == {k: v for k, v in expected.items() if k != "value"}
+
+    def decode_and_extend(decode):
+        window = SensorWindow(2)
+        window.extend(decode(message)["value"])
+
+    for name, func in (
+        ("aws_schema_registry", lambda: decode_and_extend(lambda m: adapter.deserialize("chest", m).data)),
+        ("FastAvroDeserializer", lambda: decode_and_extend(fast.deserialize)),
+    ):
+        best = min(timeit.repeat(func, number=args.number, repeat=5)) / args.number
+        print(f"{name:<22} {best * 1e6:10.1f} us/message ({len(message)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
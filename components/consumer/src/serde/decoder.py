@@ -0,0 +1,272 @@
+"""
+Fast-path decoder of the messages written by the Glue schema registry serializer.
+
+Message layout (see aws_schema_registry.codec):
+- byte 0: version byte (3).
+- byte 1: compression byte (0: none, 5: zlib).
+- bytes 2-17: UUID of the writer schema version.
+- bytes 18+: Avro binary data.
+
+Compared to KafkaDeserializer (deserializer.py), the writer schema of each version ID is resolved
+and compiled once, and every array of ints (or of records of ints, e.g. the accelerometer "x"/"y"/"z")
+is materialized as a NumPy array instead of a list of Python objects:
+- arrays of ints are decoded from the Avro varints with vectorized NumPy operations.
+- schemas using other types are decoded by a precompiled fastavro schemaless reader,
+  whose arrays are then converted to NumPy arrays.
+
+The schema can be read from a local .avsc file instead of the registry, so decoding needs no Glue or network access.
+"""
+import io
+import json
+import zlib
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import fastavro
+import numpy as np
+
+from schema.chest import SensorValue
+
+VERSION_BYTE = 3
+COMPRESSION_DISABLED_BYTE = 0
+COMPRESSION_ENABLED_BYTE = 5 # zlib
+HEADER_SIZE = 18
+
+_INT_TYPES = ("int", "long")
+
+# A compiled record: (field name, kind, argument) for each field, in schema order.
+#  kind is "int", "string", "bytes", "record" (argument: the compiled record) or "array" (argument: width)
+Plan = List[Tuple[str, str, object]]
+
+
+def _type_name(avro_type) -> Optional[str]:
+    """Returns the name of a primitive type (e.g. "int" or {"type": "int"}), None for complex types."""
+    if isinstance(avro_type, dict):
+        if "logicalType" in avro_type:
+            return None
+        avro_type = avro_type.get("type")
+    return avro_type if isinstance(avro_type, str) else None
+
+
+def _int_record_width(avro_type) -> Optional[int]:
+    """Returns the number of fields of a record whose fields are all ints, None otherwise."""
+    if not isinstance(avro_type, dict) or avro_type.get("type") != "record":
+        return None
+    if all(_type_name(field["type"]) in _INT_TYPES for field in avro_type["fields"]):
+        return len(avro_type["fields"])
+    return None
+
+
+def compile_plan(record: dict) -> Optional[Plan]:
+    """
+    Compiles a record schema for the vectorized decoder.
+    :return: the compiled record, or None if the schema uses a type the vectorized decoder does not support.
+    """
+    plan: Plan = []
+    for field in record["fields"]:
+        avro_type = field["type"]
+        name = _type_name(avro_type)
+        if name in _INT_TYPES:
+            plan.append((field["name"], "int", None))
+        elif name in ("string", "bytes"):
+            plan.append((field["name"], name, None))
+        elif isinstance(avro_type, dict) and avro_type.get("type") == "record":
+            sub_plan = compile_plan(avro_type)
+            if sub_plan is None:
+                return None
+            plan.append((field["name"], "record", sub_plan))
+        elif isinstance(avro_type, dict) and avro_type.get("type") == "array":
+            items = avro_type["items"]
+            width = None if _type_name(items) in _INT_TYPES else _int_record_width(items)
+            if width is None and _type_name(items) not in _INT_TYPES:
+                return None
+            plan.append((field["name"], "array", width))
+        else:
+            return None
+    return plan
+
+
+def _read_long(data: bytes, pos: int) -> Tuple[int, int]:
+    """Reads one zigzag varint. :return: (value, position after the varint)."""
+    byte = data[pos]
+    value = byte & 0x7F
+    shift = 7
+    while byte & 0x80:
+        pos += 1
+        byte = data[pos]
+        value |= (byte & 0x7F) << shift
+        shift += 7
+    return (value >> 1) ^ -(value & 1), pos + 1
+
+
+def decode_varints(data: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Decodes a run of zigzag varints at once.
+    :param data: bytes of the varints (uint8).
+    :param ends: position of the last byte of each varint in data.
+    :return: the values, as int64.
+    """
+    payload = (data & 0x7F).astype(np.int64)
+    if len(ends) == len(data):
+        # every varint is a single byte
+        raw = payload
+    else:
+        starts = np.empty_like(ends)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+        lengths = ends - starts + 1
+        # one pass per byte position (at most 5 for ints), over all the varints long enough
+        raw = payload[starts]
+        for j in range(1, int(lengths.max())):
+            raw |= np.where(lengths > j, payload[np.minimum(starts + j, ends)] << (7 * j), 0)
+    return (raw >> 1) ^ -(raw & 1)
+
+
+class _Buffer:
+    """Avro binary data, with the end of every varint candidate precomputed for the vectorized array reads."""
+    def __init__(self, data: bytes):
+        self.data = data
+        self.array = np.frombuffer(data, dtype=np.uint8)
+        # bytes without continuation bit: inside an array of ints, these are exactly the ends of the varints
+        self.ends = np.flatnonzero(self.array < 0x80)
+        self.pos = 0
+
+    def read_long(self) -> int:
+        value, self.pos = _read_long(self.data, self.pos)
+        return value
+
+    def read_bytes(self) -> bytes:
+        length = self.read_long()
+        value = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return value
+
+    def read_array(self, width: Optional[int]) -> np.ndarray:
+        blocks = []
+        while True:
+            count = self.read_long()
+            if count == 0:
+                break
+            if count < 0:
+                # negative count: the block size in bytes follows
+                count = -count
+                self.read_long()
+            n = count * (width or 1)
+            first = int(np.searchsorted(self.ends, self.pos))
+            ends = self.ends[first:first + n]
+            end = int(ends[-1]) + 1
+            blocks.append(decode_varints(self.array[self.pos:end], ends - self.pos))
+            self.pos = end
+        values = blocks[0] if len(blocks) == 1 else np.concatenate(blocks) if blocks else np.empty(0, dtype=np.int64)
+        return values if width is None else values.reshape(-1, width)
+
+    def read_record(self, plan: Plan) -> dict:
+        record = {}
+        for name, kind, argument in plan:
+            if kind == "int":
+                record[name] = self.read_long()
+            elif kind == "string":
+                record[name] = self.read_bytes().decode()
+            elif kind == "bytes":
+                record[name] = self.read_bytes()
+            elif kind == "record":
+                record[name] = self.read_record(argument)
+            else:
+                record[name] = self.read_array(argument)
+        return record
+
+
+def _arrays_of(avro_type) -> Callable[[object], object]:
+    """Returns a function converting the arrays of ints (or of records of ints) of a decoded value to NumPy arrays."""
+    if isinstance(avro_type, dict) and avro_type.get("type") == "record":
+        converters = [(field["name"], _arrays_of(field["type"])) for field in avro_type["fields"]]
+        converters = [(name, convert) for name, convert in converters if convert is not None]
+        if not converters:
+            return None
+
+        def convert_record(record):
+            for name, convert in converters:
+                record[name] = convert(record[name])
+            return record
+        return convert_record
+
+    if isinstance(avro_type, dict) and avro_type.get("type") == "array":
+        items = avro_type["items"]
+        if _type_name(items) in _INT_TYPES:
+            return lambda values: np.array(values, dtype=np.int64)
+        width = _int_record_width(items)
+        if width is not None:
+            getter = itemgetter(*(field["name"] for field in items["fields"]))
+            return lambda values: np.array([getter(value) for value in values], dtype=np.int64).reshape(-1, width)
+    return None
+
+
+def compile_reader(schema: dict) -> Callable[[bytes], dict]:
+    """
+    Compiles the reader of an Avro record schema.
+    :return: a function decoding Avro binary data into a dict, with NumPy arrays for the arrays of ints.
+    """
+    parsed = fastavro.parse_schema(schema)
+    plan = compile_plan(parsed)
+    if plan is not None:
+        return lambda data: _Buffer(data).read_record(plan)
+
+    convert = _arrays_of(parsed) or (lambda record: record)
+    return lambda data: convert(fastavro.schemaless_reader(io.BytesIO(data), parsed))
+
+
+class FastAvroDeserializer:
+    """
+    Drop-in replacement of KafkaDeserializer, decoding the sensor values into NumPy arrays.
+    """
+    def __init__(self, topic: str, schema_path: Optional[str] = None, client=None):
+        """
+        :param topic: Kafka topic of the messages.
+        :param schema_path: local .avsc file used as the writer schema of every message, instead of the registry.
+        :param client: SchemaRegistryClient resolving the schema version IDs. created on the first lookup if None.
+        """
+        self.topic = topic
+        self.client = client
+        self._local_reader = compile_reader(self.load_schema(schema_path)) if schema_path else None
+        self._readers: Dict[bytes, Callable[[bytes], dict]] = {}
+
+    @staticmethod
+    def load_schema(path: str) -> dict:
+        """Reads an Avro schema file."""
+        with open(path) as f:
+            return json.load(f)
+
+    def _reader(self, version_id: bytes) -> Callable[[bytes], dict]:
+        """Returns the compiled reader of a schema version, resolved once per version ID."""
+        reader = self._readers.get(version_id)
+        if reader is None:
+            if self._local_reader is not None:
+                reader = self._local_reader
+            else:
+                if self.client is None:
+                    # imported here, so decoding with a local schema does not need boto3
+                    from serde.deserializer import schema_registry_client
+                    self.client = schema_registry_client()
+                version = self.client.get_schema_version(UUID(bytes=version_id))
+                if version.data_format != "AVRO":
+                    raise ValueError(f"Unsupported data format of schema version {version.version_id}: {version.data_format}")
+                reader = compile_reader(json.loads(version.definition))
+            self._readers[version_id] = reader
+        return reader
+
+    def deserialize(self, bytes_: bytes) -> SensorValue:
+        """
+        deserializer function to use as a "value_deserializer" argument
+         of AIOKafkaConsumer constructor.
+        """
+        if bytes_ is None:
+            return None
+        if len(bytes_) < HEADER_SIZE or bytes_[0] != VERSION_BYTE:
+            raise ValueError(f"Unknown message encoding, leading byte: {bytes_[:1]!r}")
+        data = bytes_[HEADER_SIZE:]
+        if bytes_[1] == COMPRESSION_ENABLED_BYTE:
+            data = zlib.decompress(data)
+        elif bytes_[1] != COMPRESSION_DISABLED_BYTE:
+            raise ValueError(f"Unknown compression byte: {bytes_[1:2]!r}")
+        return self._reader(bytes_[2:HEADER_SIZE])(data)
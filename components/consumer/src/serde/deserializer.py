@@ -7,26 +7,30 @@ from aws_schema_registry import SchemaRegistryClient, KafkaDeserializer as _Kafk
 import boto3
 from configurations import KafkaConfigurations
 
+def schema_registry_client() -> SchemaRegistryClient:
+    """
+    Creates the Glue schema registry client from the IAM account credentials.
+    """
+    # Create a aws session from the IAM account credentials.
+    aws_session = boto3.Session(
+        aws_access_key_id=KafkaConfigurations.iam_access_key_id,
+        aws_secret_access_key=KafkaConfigurations.iam_secret_access_key,
+        region_name=KafkaConfigurations.aws_region_name,
+    )
+    glue_client = aws_session.client("glue")
+    return SchemaRegistryClient(
+        glue_client,
+        registry_name=KafkaConfigurations.registry_name
+    )
+
 class KafkaDeserializer:
     """
     Adapter for aiokafka consumer.
     """
 
     def __init__(self, topic: str):
-        # Create a aws session from the IAM account credentials.
-        aws_session = boto3.Session(
-            aws_access_key_id=KafkaConfigurations.iam_access_key_id,
-            aws_secret_access_key=KafkaConfigurations.iam_secret_access_key,
-            region_name=KafkaConfigurations.aws_region_name,
-        )
-        glue_client = aws_session.client("glue")
-
         # Create the schema registry client and the deserializer that depends upon it.
-        schema_registy_client = SchemaRegistryClient(
-            glue_client,
-            registry_name=KafkaConfigurations.registry_name
-        )
-        self._deserializer = _KafkaDeserializer(client=schema_registy_client)
+        self._deserializer = _KafkaDeserializer(client=schema_registry_client())
         self.topic = topic
 
     def deserialize(self, bytes_):
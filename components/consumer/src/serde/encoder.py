@@ -0,0 +1,33 @@
+"""
+Encoder of the messages as the producer writes them (see decoder.py for the layout), from a local schema.
+Used where no producer runs: the in-process broker (broker/local.py) and the offline replay (replay/source.py).
+"""
+import io
+import uuid
+from typing import Optional
+
+import fastavro
+from aws_schema_registry.codec import encode
+
+from schema.chest import SensorValue
+from serde.decoder import FastAvroDeserializer
+
+
+class AvroEncoder:
+    """
+    Serializes SensorValue messages with a local schema, behind the Glue header of a fixed schema version ID.
+    """
+    def __init__(self, schema_path: str, version_id: Optional[uuid.UUID] = None, compression: bool = False):
+        """
+        :param schema_path: local .avsc file, e.g. schema/SensorRecord.avsc.
+        :param version_id: schema version ID written in the header, random if None.
+        :param compression: zlib-compresses the Avro data, as the producer may.
+        """
+        self.schema = fastavro.parse_schema(FastAvroDeserializer.load_schema(schema_path))
+        self.version_id = version_id or uuid.uuid4()
+        self.compression = compression
+
+    def encode(self, message: SensorValue) -> bytes:
+        buffer = io.BytesIO()
+        fastavro.schemaless_writer(buffer, self.schema, message)
+        return encode(buffer.getvalue(), self.version_id, compression=self.compression)
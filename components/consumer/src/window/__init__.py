@@ -0,0 +1,6 @@
+"""
+This module keeps the per-user sensor windows used for inference.
+Each modality is stored in a fixed-capacity NumPy ring buffer (ring_buffer.py).
+Incoming segments are deduplicated and put back in order (reorder.py),
+then screened for NaN samples before they are appended (validation.py).
+"""
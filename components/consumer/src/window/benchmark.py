@@ -0,0 +1,70 @@
+"""
+Benchmark of the NaN screening of the incoming segments.
+Checks that SegmentValidator (NAN_POLICY=drop) accepts and drops the same segments as sanity_check_no_missing in main.py,
+then reports the per-segment cost of each, for segments decoded as lists (aws_schema_registry deserializer),
+integer arrays (FastAvroDeserializer) and float arrays.
+
+Usage (from the src/ directory):
+    python -m window.benchmark --hz 700
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from window.ring_buffer import ACC_MODALITIES, MODALITIES
+from window.validation import SegmentValidator
+
+
+def synthetic_segment(hz: int, form: str, seed: int = 0) -> dict:
+    """
+    Returns one second of 16-bit ADC-like samples.
+    :param form: "list" for lists ({"x", "y", "z"} dictionaries for accelerometers), "int" or "float" for arrays.
+    """
+    rng = np.random.default_rng(seed)
+    value = {}
+    for col in MODALITIES:
+        samples = rng.integers(0, 1 << 16, size=(hz, 3) if col in ACC_MODALITIES else hz)
+        if form == "list":
+            samples = [{"x": x, "y": y, "z": z} for x, y, z in samples.tolist()] if col in ACC_MODALITIES else samples.tolist()
+        elif form == "float":
+            samples = samples.astype(np.float64)
+        value[col] = {"hz": hz, "value": samples}
+    return {"user_id": "user", "segment_size": 1000, "value": value}
+
+
+def fresh(record: dict) -> dict:
+    """Returns a copy of the record sharing its samples, since the validator replaces lists by arrays."""
+    return {**record, "value": {col: dict(modality) for col, modality in record["value"].items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hz", type=int, default=700, help="sampling rate of every modality")
+    parser.add_argument("--number", type=int, default=200, help="segments per measurement")
+    args = parser.parse_args()
+
+    # imported here, since main.py connects its dependencies at import time.
+    import main as consumer
+
+    validator = SegmentValidator("drop")
+    for form in ("list", "int", "float"):
+        record = synthetic_segment(args.hz, form)
+        assert not consumer.sanity_check_no_missing(record) and validator.validate(fresh(record))
+    for col in MODALITIES:
+        record = synthetic_segment(args.hz, "float")
+        record["value"][col]["value"][args.hz // 2] = np.nan
+        assert consumer.sanity_check_no_missing(record) and not validator.validate(fresh(record)), col
+
+    for form in ("list", "int", "float"):
+        record = synthetic_segment(args.hz, form)
+        for name, check in (
+            ("sanity_check_no_missing", lambda: consumer.sanity_check_no_missing(record)),
+            ("SegmentValidator", lambda: validator.validate(fresh(record))),
+        ):
+            best = min(timeit.repeat(check, number=args.number, repeat=5)) / args.number
+            print(f"{form:<6} {name:<24} {best * 1e6:10.1f} us/segment")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Ordering of the incoming segments before they reach the windows.
+
+Kafka redelivers the segments processed since the last committed offset after a rebalance or a retry,
+and a producer retry may deliver a segment after a newer one of the same user.
+- DuplicateFilter drops the segments whose connection_id was already seen,
+  remembering the last DEDUPLICATION_CAPACITY ids in two rotating sets (fixed memory).
+- ReorderBuffer holds the segments of each user in a min-heap on "timestamp",
+  and releases them in order once the newest timestamp of the user is REORDER_LATENESS_MS ahead.
+  Segments older than the last released one of their user are late, and dropped.
+"""
+import heapq
+import itertools
+from typing import Dict, List, Tuple
+
+from configurations import InferenceConfigurations
+from schema.chest import SensorValue
+
+
+class DuplicateFilter:
+    """
+    Remembers between capacity / 2 and capacity of the last ids:
+    ids are added to the current set, which replaces the previous set once it holds capacity / 2 ids.
+
+    - duplicates: ids seen again.
+    """
+    def __init__(self, capacity: int = InferenceConfigurations.deduplication_capacity):
+        """
+        :param capacity: max number of ids remembered. 0 disables the filter.
+        """
+        self.generation_size = capacity // 2
+        self._current = set()
+        self._previous = set()
+        self.duplicates = 0
+
+    def seen(self, key: str) -> bool:
+        """
+        Records an id.
+        :return: True if the id was already seen.
+        """
+        if self.generation_size <= 0:
+            return False
+        if key in self._current or key in self._previous:
+            self.duplicates += 1
+            return True
+        self._current.add(key)
+        if len(self._current) >= self.generation_size:
+            self._previous = self._current
+            self._current = set()
+        return False
+
+
+class ReorderBuffer:
+    """
+    Per-user buffer releasing the segments in timestamp order, up to a lateness watermark.
+
+    - reordered: segments that arrived after a newer segment of their user, and were put back in order.
+    - late: segments older than the last released segment of their user, dropped.
+    - buffered: segments held, of every user.
+    """
+    def __init__(self, lateness_ms: int = InferenceConfigurations.reorder_lateness_ms,
+                 max_segments: int = InferenceConfigurations.reorder_max_segments):
+        """
+        :param lateness_ms: time a segment waits for older ones, in timestamps of the user. 0 releases it at once.
+        :param max_segments: max number of segments held per user, beyond which the oldest is released.
+        """
+        self.lateness_ms = lateness_ms
+        self.max_segments = max(max_segments, 1)
+        # per user: heap of (timestamp, arrival, segment), newest timestamp, last released timestamp
+        self._heaps: Dict[str, List[Tuple[int, int, SensorValue]]] = {}
+        self._newest: Dict[str, int] = {}
+        self._released: Dict[str, int] = {}
+        self._arrivals = itertools.count()
+
+        self.reordered = 0
+        self.late = 0
+
+    @property
+    def buffered(self) -> int:
+        return sum(len(heap) for heap in self._heaps.values())
+
+    def push(self, segment: SensorValue) -> List[SensorValue]:
+        """
+        Adds a segment.
+        :return: the segments of its user released by it, in timestamp order.
+        """
+        user_id = segment["user_id"]
+        timestamp = segment["timestamp"]
+        if timestamp < self._released.get(user_id, timestamp):
+            self.late += 1
+            return []
+        newest = self._newest.get(user_id)
+        if newest is not None and timestamp < newest:
+            self.reordered += 1
+        if newest is None or timestamp > newest:
+            self._newest[user_id] = newest = timestamp
+
+        heap = self._heaps.setdefault(user_id, [])
+        heapq.heappush(heap, (timestamp, next(self._arrivals), segment))
+        watermark = newest - self.lateness_ms
+        released = []
+        while heap and (heap[0][0] <= watermark or len(heap) > self.max_segments):
+            timestamp, _, segment = heapq.heappop(heap)
+            released.append(segment)
+        if released:
+            self._released[user_id] = timestamp
+        if not heap:
+            del self._heaps[user_id]
+        return released
+
+    def pop(self, user_id: str) -> List[SensorValue]:
+        """Forgets a user, and returns its held segments in timestamp order."""
+        heap = self._heaps.pop(user_id, [])
+        self._newest.pop(user_id, None)
+        self._released.pop(user_id, None)
+        return [segment for _, _, segment in sorted(heap)]
+
+    def report(self) -> str:
+        """Returns the reordering counters."""
+        return f"reordered: {self.reordered}, late: {self.late}, buffered: {self.buffered}"
+
+
+if __name__ == "__main__":
+    # executes test codes.
+    duplicates = DuplicateFilter(capacity=4)
+    assert [duplicates.seen(key) for key in "abab"] == [False, False, True, True]
+    for key in "cdef":
+        duplicates.seen(key)
+    # only the last ids are remembered
+    assert not duplicates.seen("a") and duplicates.seen("f") and duplicates.duplicates == 3
+
+    def segment(timestamp: int, user_id: str = "user") -> SensorValue:
+        return {"user_id": user_id, "timestamp": timestamp}
+
+    def timestamps(segments: List[SensorValue]) -> List[int]:
+        return [segment["timestamp"] for segment in segments]
+
+    reorder = ReorderBuffer(lateness_ms=1000, max_segments=3)
+    assert reorder.push(segment(1000)) == []
+    assert timestamps(reorder.push(segment(3000))) == [1000] # releases up to 3000 - 1000
+    assert timestamps(reorder.push(segment(2000))) == [2000] and reorder.reordered == 1
+    assert reorder.push(segment(2500)) == [] and reorder.buffered == 2
+    assert timestamps(reorder.push(segment(4000))) == [2500, 3000]
+    assert reorder.push(segment(2600)) == [] and reorder.late == 1
+    # at most max_segments are held per user.
+    assert [timestamps(reorder.push(segment(t, "other"))) for t in (40, 30, 20, 10)] == [[], [], [], [10]]
+    assert timestamps(reorder.pop("other")) == [20, 30, 40] and reorder.buffered == 1
+
+    # with no lateness, segments are released at once and the older ones are late.
+    reorder = ReorderBuffer(lateness_ms=0)
+    assert timestamps(reorder.push(segment(2000))) == [2000] and reorder.push(segment(1000)) == []
+    assert reorder.report() == "reordered: 0, late: 1, buffered: 0"
+    print("ok")
@@ -0,0 +1,215 @@
+"""
+Columnar ring buffers holding the sliding window of each user.
+
+A RingBuffer stores the samples of one modality in a typed NumPy array.
+The array is mirrored (every sample is written twice, "capacity" apart),
+so any run of up to "capacity" samples starting at the head is contiguous
+and can be returned as a zero-copy view.
+"""
+from itertools import chain
+from operator import itemgetter
+from typing import Dict, Optional
+
+import numpy as np
+
+from schema.chest import DeviceSensorValue
+
+# Modalities carried by a DeviceSensorValue, in declaration order.
+MODALITIES = tuple(col for col in vars(DeviceSensorValue).get("__annotations__").keys() if col not in ['label', 'domain'])
+# Modalities whose samples are {"x", "y", "z"} dictionaries.
+ACC_MODALITIES = ("chest_acc", "wrist_acc")
+
+ACC_DTYPE = np.float32
+VALUE_DTYPE = np.float64
+
+_xyz = itemgetter("x", "y", "z")
+
+
+class RingBuffer:
+    """
+    Fixed-capacity FIFO of samples backed by a mirrored NumPy array.
+
+    - append(): O(1) per sample, grows (amortized) only if a segment does not fit.
+    - view(): zero-copy, contiguous view of the oldest samples.
+    - advance(): O(1), drops the oldest samples by moving the head.
+    """
+    def __init__(self, capacity: int, width: Optional[int] = None, dtype=VALUE_DTYPE):
+        """
+        :param capacity: number of samples the buffer can hold without growing.
+        :param width: number of columns per sample (e.g. 3 for accelerometers), None for scalars.
+        :param dtype: NumPy dtype of the samples.
+        """
+        self.capacity = max(int(capacity), 1)
+        self.width = width
+        self.dtype = np.dtype(dtype)
+        self._buffer = np.empty(self._shape(2 * self.capacity), dtype=self.dtype)
+        # Absolute sample counters: samples ever dropped / ever appended.
+        self.head = 0
+        self.tail = 0
+
+    def _shape(self, length: int):
+        return (length,) if self.width is None else (length, self.width)
+
+    def __len__(self) -> int:
+        return self.tail - self.head
+
+    def _grow(self, capacity: int) -> None:
+        live = self.view()
+        new_capacity = max(capacity, 2 * self.capacity)
+        buffer = np.empty(self._shape(2 * new_capacity), dtype=self.dtype)
+        # Re-base the live samples so that head % new_capacity lands on them.
+        start = self.head % new_capacity
+        for offset in (start, start + new_capacity):
+            end = min(offset + len(live), 2 * new_capacity)
+            buffer[offset:end] = live[:end - offset]
+        wrapped = start + len(live) - new_capacity
+        if wrapped > 0:
+            buffer[:wrapped] = live[len(live) - wrapped:]
+        self._buffer = buffer
+        self.capacity = new_capacity
+
+    def append(self, values) -> None:
+        """
+        Appends samples at the tail.
+        :param values: array-like of shape (n,) or (n, width).
+        """
+        values = np.asarray(values, dtype=self.dtype)
+        n = len(values)
+        if n == 0:
+            return
+        if len(self) + n > self.capacity:
+            self._grow(len(self) + n)
+        capacity = self.capacity
+        start = self.tail % capacity
+        first = min(n, capacity - start)
+        self._buffer[start:start + first] = values[:first]
+        self._buffer[start + capacity:start + capacity + first] = values[:first]
+        if first < n:
+            rest = n - first
+            self._buffer[:rest] = values[first:]
+            self._buffer[capacity:capacity + rest] = values[first:]
+        self.tail += n
+
+    def view(self, length: Optional[int] = None) -> np.ndarray:
+        """
+        Returns a zero-copy view of the oldest samples.
+        **The view is invalidated by the next append() that grows the buffer.**
+        :param length: number of samples to return (default: all samples in the buffer).
+        """
+        if length is None or length > len(self):
+            length = len(self)
+        start = self.head % self.capacity
+        return self._buffer[start:start + length]
+
+    def advance(self, length: int) -> None:
+        """
+        Drops the oldest samples.
+        :param length: number of samples to drop.
+        """
+        self.head += min(int(length), len(self))
+
+    def __getstate__(self):
+        # Only the live samples are pickled, not the mirrored storage.
+        return {
+            "capacity": self.capacity,
+            "width": self.width,
+            "dtype": self.dtype.str,
+            "head": self.head,
+            "values": np.ascontiguousarray(self.view()),
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state["capacity"], state["width"], state["dtype"])
+        self.head = self.tail = state["head"]
+        self.append(state["values"])
+
+
+class SensorWindow:
+    """
+    Sliding window of one user: one RingBuffer per modality.
+    Buffers are created on the first segment, sized from the window size and the modality "hz".
+    """
+    def __init__(self, window_size: int):
+        """
+        :param window_size: window size in seconds.
+        """
+        self.window_size = window_size
+        self.hz: Dict[str, int] = {}
+        self.buffers: Dict[str, RingBuffer] = {}
+        # Per-block aggregates cached by the incremental feature extractor (feature/incremental.py),
+        # keyed by the absolute position of the first sample of the block. Not persisted by the cache.
+        self.blocks: Dict[str, Dict[int, np.ndarray]] = {}
+
+    def __getitem__(self, col: str) -> RingBuffer:
+        return self.buffers[col]
+
+    def __contains__(self, col: str) -> bool:
+        return col in self.buffers
+
+    def length(self, col: str) -> int:
+        """Returns the number of samples of the modality currently in the window."""
+        buffer = self.buffers.get(col)
+        return 0 if buffer is None else len(buffer)
+
+    def extend(self, new_data: DeviceSensorValue) -> None:
+        """
+        Appends a segment to the window.
+        :param new_data: sensor values of a segment, with "x"/"y"/"z" dictionaries
+         or (n, 3) arrays for accelerometers.
+        """
+        for col in MODALITIES:
+            sampling_rate = new_data[col]["hz"]
+            values = new_data[col]["value"]
+            buffer = self.buffers.get(col)
+            if buffer is None:
+                # A full window plus one second of headroom for the incoming segment.
+                capacity = (self.window_size + 1) * sampling_rate
+                if col in ACC_MODALITIES:
+                    buffer = RingBuffer(capacity, width=3, dtype=ACC_DTYPE)
+                else:
+                    buffer = RingBuffer(capacity, dtype=VALUE_DTYPE)
+                self.buffers[col] = buffer
+                self.hz[col] = sampling_rate
+            if col in ACC_MODALITIES and not isinstance(values, np.ndarray):
+                values = np.fromiter(chain.from_iterable(map(_xyz, values)), dtype=ACC_DTYPE,
+                                     count=3 * len(values)).reshape(-1, 3)
+            buffer.append(values)
+
+
+if __name__ == "__main__":
+    # executes test codes.
+    buffer = RingBuffer(4)
+    buffer.append([1, 2, 3])
+    assert buffer.view().tolist() == [1, 2, 3]
+    buffer.advance(2)
+    buffer.append([4, 5, 6])
+    # the window wraps around the end of the storage but the view stays contiguous.
+    assert buffer.view().tolist() == [3, 4, 5, 6]
+    assert buffer.view().base is buffer._buffer
+    buffer.append([7, 8])
+    # the buffer grows when a segment does not fit.
+    assert buffer.view().tolist() == [3, 4, 5, 6, 7, 8]
+    buffer.advance(3)
+    assert buffer.view(2).tolist() == [6, 7]
+
+    acc = RingBuffer(3, width=3, dtype=ACC_DTYPE)
+    acc.append([[1, 2, 3], [4, 5, 6]])
+    acc.advance(1)
+    acc.append([[7, 8, 9], [10, 11, 12]])
+    assert acc.view().tolist() == [[4, 5, 6], [7, 8, 9], [10, 11, 12]]
+
+    import pickle
+    restored = pickle.loads(pickle.dumps(acc))
+    assert restored.view().tolist() == acc.view().tolist()
+    assert (restored.head, restored.tail) == (acc.head, acc.tail)
+
+    window = SensorWindow(window_size=2)
+    segment = {
+        col: {"hz": 4, "value": [{"x": i, "y": i, "z": i} for i in range(4)] if col in ACC_MODALITIES else list(range(4))}
+        for col in MODALITIES
+    }
+    window.extend(segment)
+    window.extend(segment)
+    assert all(window.length(col) == 8 for col in MODALITIES)
+    assert window["chest_acc"].view(2).tolist() == [[0, 0, 0], [1, 1, 1]]
+    print("ok")
@@ -0,0 +1,181 @@
+"""
+Validation of the incoming segments before they are appended to a window.
+
+Every modality is checked with one np.isnan over its samples, as a NumPy array:
+integer arrays (the SensorRecord schema, decoded by FastAvroDeserializer) cannot hold NaN and are not scanned,
+and Python lists (aws_schema_registry deserializer) are converted once, in place of the segment.
+A segment with NaN samples is dropped (NAN_POLICY=drop), or, with NAN_POLICY=interpolate,
+its gaps of up to NAN_MAX_GAP_MS are linearly interpolated (held at the edges of the segment, each accelerometer
+axis on its own) and only segments with longer gaps are dropped.
+"""
+from itertools import chain
+from typing import Optional
+
+import numpy as np
+
+from configurations import InferenceConfigurations
+from logger.ConsumerLogger import ConsumerLogger
+from schema.chest import SensorValue
+from window.ring_buffer import ACC_DTYPE, ACC_MODALITIES, MODALITIES, VALUE_DTYPE, _xyz
+
+logger = ConsumerLogger()
+
+NAN_POLICIES = ("drop", "interpolate")
+
+
+def as_array(values, accelerometer: bool = False) -> np.ndarray:
+    """
+    Returns the samples of a modality as an array, (n, 3) for accelerometers, without copying arrays.
+    """
+    if isinstance(values, np.ndarray):
+        return values
+    if accelerometer:
+        return np.fromiter(chain.from_iterable(map(_xyz, values)), dtype=ACC_DTYPE, count=3 * len(values)).reshape(-1, 3)
+    return np.asarray(values, dtype=VALUE_DTYPE)
+
+
+def longest_run(mask: np.ndarray) -> int:
+    """Returns the length of the longest run of True in a boolean vector."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).view(np.int8)))
+    return int((edges[1::2] - edges[::2]).max()) if len(edges) else 0
+
+
+def interpolate(values: np.ndarray, missing: np.ndarray) -> None:
+    """
+    Replaces the missing samples by the linear interpolation of their neighbours, in place.
+    Samples before the first (after the last) valid sample take its value.
+    :param values: samples, (n,) or (n, width).
+    :param missing: values to replace, same shape as values: each column is interpolated from its own valid values.
+    """
+    if values.ndim > 1:
+        for axis in range(values.shape[1]):
+            interpolate(values[:, axis], missing[:, axis])
+        return
+    positions = np.flatnonzero(missing)
+    if len(positions):
+        valid = np.flatnonzero(~missing)
+        values[positions] = np.interp(positions, valid, values[valid])
+
+
+class SegmentValidator:
+    """
+    Screens the segments for NaN samples, and drops or repairs them according to the policy.
+
+    - nan_samples: NaN samples seen per modality (a sample of an accelerometer counts once, whichever its axis).
+    - interpolated_samples: samples replaced by interpolation.
+    - dropped_segments: segments not appended to their window.
+    """
+    def __init__(self, policy: str = InferenceConfigurations.nan_policy,
+                 max_gap_ms: int = InferenceConfigurations.nan_max_gap_ms):
+        """
+        :param policy: "drop" drops every segment with NaN, "interpolate" repairs its short gaps.
+        :param max_gap_ms: longest gap repaired by interpolation, in ms of samples of the modality.
+        """
+        if policy not in NAN_POLICIES:
+            raise ValueError(f"Unknown NaN policy: {policy}, expected one of {NAN_POLICIES}")
+        self.policy = policy
+        self.max_gap_ms = max_gap_ms
+        self.nan_samples = dict.fromkeys(MODALITIES, 0)
+        self.interpolated_samples = 0
+        self.dropped_segments = 0
+
+    def _screen(self, col: str, values: np.ndarray) -> Optional[np.ndarray]:
+        """Returns the NaN mask of the values of a modality (same shape), None if there is none."""
+        # a sum is NaN if any sample is (or +inf and -inf): one pass without a temporary mask
+        if values.dtype.kind != "f" or not np.isnan(np.add.reduce(values, axis=None)):
+            return None
+        missing = np.isnan(values)
+        count = np.count_nonzero(missing.any(axis=1) if values.ndim > 1 else missing)
+        if not count:
+            return None
+        self.nan_samples[col] += count
+        return missing
+
+    def validate(self, record: SensorValue) -> bool:
+        """
+        Checks every modality of a segment, converting its samples to arrays and repairing them if allowed.
+        :param record: deserialized sensor data, updated in place.
+        :return: False if the segment must be dropped.
+        """
+        sensor_value = record["value"]
+        gaps = {}
+        for col in MODALITIES:
+            modality = sensor_value[col]
+            values = modality["value"] = as_array(modality["value"], col in ACC_MODALITIES)
+            missing = self._screen(col, values)
+            if missing is not None:
+                gaps[col] = missing
+        if not gaps:
+            return True
+
+        if self.policy == "interpolate":
+            # every axis of an accelerometer needs a valid value, and its own gaps short enough
+            repairable = all(
+                not axis.all() and longest_run(axis) <= max(sensor_value[col]["hz"] * self.max_gap_ms // 1000, 1)
+                for col, missing in gaps.items() for axis in np.atleast_2d(missing.T)
+            )
+            if repairable:
+                for col, missing in gaps.items():
+                    values = sensor_value[col]["value"]
+                    if not values.flags.writeable:
+                        values = sensor_value[col]["value"] = values.copy()
+                    interpolate(values, missing)
+                    self.interpolated_samples += int(np.count_nonzero(missing))
+                return True
+
+        self.dropped_segments += 1
+        logger.info("Dropped the segment of user %s: NaN in %s", record["user_id"], ", ".join(gaps))
+        return False
+
+    def report(self) -> str:
+        """Returns the NaN counters, per modality."""
+        counts = ", ".join(f"{col}: {count}" for col, count in self.nan_samples.items() if count) or "none"
+        return (f"NaN samples: {counts}, interpolated samples: {self.interpolated_samples}, "
+                f"dropped segments: {self.dropped_segments}")
+
+
+if __name__ == "__main__":
+    # executes test codes.
+    assert longest_run(np.array([False, True, True, False, True])) == 2
+    assert longest_run(np.zeros(3, dtype=bool)) == 0
+
+    def segment(hz: int = 10):
+        return {
+            "user_id": "user",
+            "value": {
+                col: {"hz": hz, "value": [{"x": i, "y": i, "z": i} for i in range(hz)] if col in ACC_MODALITIES
+                      else np.arange(hz, dtype=np.int64)}
+                for col in MODALITIES
+            },
+        }
+
+    # integer samples are not scanned, lists become arrays.
+    validator = SegmentValidator("interpolate", max_gap_ms=200)
+    record = segment()
+    assert validator.validate(record) and isinstance(record["value"]["chest_acc"]["value"], np.ndarray)
+
+    # short gaps are interpolated, at the edges too.
+    record = segment()
+    ecg = record["value"]["chest_ecg"]["value"] = np.arange(10, dtype=np.float64)
+    ecg[[0, 4, 5]] = np.nan
+    record["value"]["chest_acc"]["value"][9]["y"] = float("nan")
+    assert validator.validate(record)
+    assert record["value"]["chest_ecg"]["value"].tolist() == [1, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+    assert record["value"]["chest_acc"]["value"][9].tolist() == [9, 8, 9]
+    assert validator.nan_samples["chest_ecg"] == 3 and validator.nan_samples["chest_acc"] == 1
+    assert validator.interpolated_samples == 4 and validator.dropped_segments == 0
+
+    # the gaps of each accelerometer axis are measured and interpolated on their own.
+    record = segment()
+    acc = record["value"]["chest_acc"]["value"] = np.arange(30, dtype=np.float64).reshape(10, 3)
+    acc[[1, 2], 0] = acc[[3, 4], 1] = np.nan
+    assert validator.validate(record) and acc[:, :2].tolist() == [[3 * i, 3 * i + 1] for i in range(10)]
+
+    # longer gaps drop the segment, as does the "drop" policy.
+    record = segment()
+    record["value"]["chest_eda"]["value"] = np.array([np.nan] * 3 + [1.0] * 7)
+    assert not validator.validate(record) and validator.dropped_segments == 1
+    record = segment()
+    record["value"]["chest_eda"]["value"] = np.array([np.nan] + [1.0] * 9)
+    assert not SegmentValidator("drop").validate(record)
+    print(validator.report())
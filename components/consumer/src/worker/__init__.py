@@ -0,0 +1,5 @@
+"""
+This module runs the CPU-bound part of the consumer in worker processes.
+
+- pool.py: routes every message of a user to the same worker process, so window state stays local.
+"""
@@ -0,0 +1,214 @@
+"""
+Partition-parallel processing with sticky user routing.
+
+The fetch loop (main.py) only polls Kafka and hands raw message bytes to a pool of worker processes.
+Every message of a user goes to the same worker (hash of the Kafka key, which is the user id),
+so each worker owns the windows, models and cache entries of its users,
+and per-user ordering is preserved by the FIFO queue of the worker.
+Each worker deserializes, updates windows, extracts features, predicts and writes EndRecords itself.
+
+Offsets are committed by the fetch loop once the workers acknowledged every batch of a poll (auto-commit would commit
+the messages still queued to the workers). If a worker dies, the fetch loop stops: the messages of the polls not
+acknowledged yet (at most WORKER_QUEUE_SIZE polls per worker) are redelivered when the consumer restarts.
+"""
+import asyncio
+import multiprocessing
+import queue
+import time
+import zlib
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from configurations import InferenceConfigurations
+from logger.ConsumerLogger import ConsumerLogger
+
+logger = ConsumerLogger()
+
+WorkItem = Tuple[bytes, int, int] # raw value, start time, Kafka record timestamp
+
+
+def route(key: Optional[bytes], partition: int, workers: int) -> int:
+    """
+    Returns the worker owning a message.
+    Messages are keyed by user id; unkeyed messages stay on the worker of their partition.
+    """
+    if key:
+        return zlib.crc32(key) % workers
+    return partition % workers
+
+
+def worker_store_host(store_host: str, index: int) -> str:
+    """
+    Returns the store of a worker: workers do not share store files.
+    e.g. "sqlite://cache.sqlite" -> "sqlite://cache-1.sqlite"
+    """
+    scheme, separator, filename = store_host.partition("://")
+    if not separator or not filename:
+        default = {"dbm": "cache.dbm", "sqlite": "cache.sqlite"}.get(scheme)
+        if default is None:
+            return store_host
+        filename = default
+    stem, dot, extension = filename.rpartition(".")
+    if not dot or "/" in extension:
+        return f"{scheme}://{filename}-{index}"
+    return f"{scheme}://{stem}-{index}.{extension}"
+
+
+def run_worker(index: int, inbox: multiprocessing.Queue, acks: multiprocessing.Queue) -> None:
+    """
+    Entry point of a worker process.
+    Processes the batches of its inbox until it receives None, and puts its index in acks after each batch.
+    """
+    # imported in the worker process: main.py holds the processing pipeline and its module-level state.
+    import main as consumer
+    from cache.table import get_context_cache
+    from db.writer import get_context_writer
+
+    store_host = worker_store_host(InferenceConfigurations.store_host, index)
+    with get_context_cache(store_host) as cache, get_context_writer() as writer:
+        # before the first batch, as the consumer process does without workers
+        consumer.models.warm_up()
+        logger.info("Worker %d started, store: %s, model warm-up: %.0f ms", index, store_host,
+                    consumer.models.cold_start_ms + consumer.models.warm_up_ms)
+        while True:
+            items: Optional[List[WorkItem]] = inbox.get()
+            if items is None:
+                break
+            dequeue_time = int(time.time() * 1000)
+            # every batch handed to a worker is predicted with a single call
+            received = []
+            for value, start_time, kafka_timestamp in items:
+                stages = consumer.stage_times(kafka_timestamp, dequeue_time, index)
+                sensor_data = consumer.deserialize(value)
+                consumer.update_window(sensor_data, cache, consumer.feature_batch)
+                stages["feature_time"] = int(time.time() * 1000)
+                received.append((sensor_data, start_time, stages))
+            batch_size = len(consumer.feature_batch)
+            consumer.predict_batch(consumer.feature_batch)
+            consumer.record_prediction(received, batch_size)
+            for sensor_data, start_time, stages in received:
+                consumer.log_end_record(sensor_data, start_time, writer, stages)
+            acks.put(index)
+        logger.info("Worker %d stopped, logging: sampled out: %s, dropped: %d",
+                    index, consumer.log_sampler.report(), ConsumerLogger.dropped())
+    ConsumerLogger.stop() # the queued records of the async mode, before the process exits
+
+
+class WorkerPool:
+    """
+    Pool of worker processes, each fed by a bounded queue.
+    dispatch() waits asynchronously while the queue of a worker is full (backpressure on the fetch loop).
+    acknowledged() returns the offsets of the polls processed by the workers, to be committed.
+    """
+    def __init__(self, workers: int = InferenceConfigurations.workers,
+                 queue_size: int = InferenceConfigurations.worker_queue_size):
+        """
+        :param workers: number of worker processes.
+        :param queue_size: max number of batches waiting in the queue of each worker.
+        """
+        # spawn: workers do not inherit the threads and connections of the fetch process.
+        context = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.inboxes = [context.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.acks = context.Queue() # index of the worker, after each batch it processed
+        self.processes = [
+            context.Process(target=run_worker, args=(index, inbox, self.acks), name=f"consumer-worker-{index}", daemon=True)
+            for index, inbox in enumerate(self.inboxes)
+        ]
+        # polls not acknowledged yet, oldest first: [offsets to commit, number of batches not processed yet]
+        self._polls: Deque[list] = deque()
+        self._queued: List[Deque[list]] = [deque() for _ in range(workers)] # poll of each batch queued to a worker
+        for process in self.processes:
+            process.start()
+
+    def _check(self, index: int) -> None:
+        """Raises if the worker exited: its queued batches are never processed."""
+        process = self.processes[index]
+        if not process.is_alive():
+            raise RuntimeError(f"Worker {index} exited with code {process.exitcode}")
+
+    async def dispatch(self, messages, offsets: Optional[Dict] = None) -> None:
+        """
+        Hands a poll of Kafka messages (with raw values) to the workers, one batch per worker.
+        :param offsets: next offset of each partition of the poll, returned by acknowledged() once it is processed.
+        """
+        for index in range(self.workers):
+            self._check(index)
+        start_time = int(time.time() * 1000)
+        batches: Dict[int, List[WorkItem]] = {}
+        for msg in messages:
+            batches.setdefault(route(msg.key, msg.partition, self.workers), []).append((msg.value, start_time, msg.timestamp))
+
+        poll = [offsets or {}, len(batches)]
+        self._polls.append(poll)
+        for index, items in batches.items():
+            while True:
+                try:
+                    self.inboxes[index].put_nowait(items)
+                    break
+                except queue.Full:
+                    self._check(index)
+                    await asyncio.sleep(0.001)
+            self._queued[index].append(poll)
+
+    def acknowledged(self) -> Dict:
+        """
+        Returns the offsets to commit: the next offset of each partition of the oldest polls processed by the workers.
+        """
+        while True:
+            try:
+                index = self.acks.get_nowait()
+            except queue.Empty:
+                break
+            self._queued[index].popleft()[1] -= 1
+        offsets = {}
+        while self._polls and self._polls[0][1] == 0:
+            offsets.update(self._polls.popleft()[0])
+        return offsets
+
+    def close(self, timeout_ms: int = InferenceConfigurations.worker_shutdown_timeout_ms) -> None:
+        """
+        Lets the live workers process their queues, then stops them. Blocks: call it off the event loop.
+        Workers still running after timeout_ms are terminated, their queued batches are not acknowledged.
+        """
+        deadline = time.monotonic() + timeout_ms / 1000
+        for index, (inbox, process) in enumerate(zip(self.inboxes, self.processes)):
+            if process.is_alive():
+                try:
+                    inbox.put(None, timeout=max(deadline - time.monotonic(), 0))
+                    continue
+                except queue.Full:
+                    logger.warning("Worker %d did not drain its queue within %d ms, terminating it", index, timeout_ms)
+                    process.terminate()
+            # nobody reads the queue anymore: do not wait for its buffered batches when the process exits
+            inbox.cancel_join_thread()
+        for index, (inbox, process) in enumerate(zip(self.inboxes, self.processes)):
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning("Worker %d did not stop within %d ms, terminating it", index, timeout_ms)
+                process.terminate()
+                process.join()
+                inbox.cancel_join_thread()
+
+
+if __name__ == "__main__":
+    # executes test codes: a worker dies with a full queue.
+    from types import SimpleNamespace
+
+    async def test():
+        pool = WorkerPool(workers=1, queue_size=1)
+        pool.processes[0].kill()
+        pool.processes[0].join()
+        pool.inboxes[0].put_nowait([])
+        message = SimpleNamespace(key=b"user", partition=0, value=b"", timestamp=0, offset=0)
+        try:
+            await pool.dispatch([message], {"tp": 1})
+            raise AssertionError("dispatch to a dead worker")
+        except RuntimeError as e:
+            assert "exited" in str(e)
+        start = time.monotonic()
+        await asyncio.get_running_loop().run_in_executor(None, pool.close, 1000)
+        assert time.monotonic() - start < 1 and pool.acknowledged() == {}
+
+    asyncio.run(test())
+    print("ok")
@@ -11,6 +11,7 @@ class DBConfigurations:
     postgres_port = 5432 if os.getenv("POSTGRES_PORT") is None else os.getenv("POSTGRES_PORT")
     postgres_db = "postgres" if os.getenv("POSTGRES_DB") is None else os.getenv("POSTGRES_DB")
     postgres_host = "localhost" if os.getenv("POSTGRES_HOST") is None else os.getenv("POSTGRES_HOST")
-    sql_alchemy_url = (
+    # e.g. "sqlite:////tmp/affectstream.sqlite", shared with the consumer (local profile). Empty (.env.example) uses PostgreSQL.
+    sql_alchemy_url = os.getenv("DATABASE_URL") or (
         f"postgresql://{postgres_username}:{postgres_password}@{postgres_host}:{postgres_port}/{postgres_db}"
     )
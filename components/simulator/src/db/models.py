@@ -1,16 +1,19 @@
-from sqlalchemy import Column, String, BigInteger
+from sqlalchemy import Column, String, BigInteger, Integer
 from sqlalchemy.ext.declarative import declarative_base
 
 # Define the base class for all SQLAlchemy models
 Base = declarative_base()
 
+# BIGSERIAL on PostgreSQL. SQLite only autoincrements an "INTEGER PRIMARY KEY" (64-bit as well), used for the local profile.
+ID_TYPE = BigInteger().with_variant(Integer, "sqlite")
+
 # Define the StartRecord model
 class StartRecord(Base):
     __tablename__ = "start_record" # Specify the table name
 
     # Define the columns of the table
     id = Column(
-        BigInteger,
+        ID_TYPE,
         primary_key=True
     )
     connection_id = Column(
@@ -11,5 +11,12 @@ create table public.end_record
     id             bigserial    primary key,
     connection_id  varchar(255) not null,
     timestamp      bigint       not null,
-    inference_time bigint      not null
+    inference_time bigint      not null,
+    -- stage timestamps, written by the consumer with END_RECORD_STAGE_TIMES=true
+    kafka_timestamp bigint,
+    dequeue_time    bigint,
+    feature_time    bigint,
+    prediction_time bigint,
+    batch_size      integer,
+    worker_id       integer
 );